@@ -0,0 +1,110 @@
+'''
+Synopsis
+--------
+Helpers shared by the benchmarks: synthetic datasets generated according to the
+columns definitions of the stubs module, and plain timing reports.
+
+Each benchmark is a module runnable from the project root:
+>>> python -m benchmarks.filter -n 1000000
+'''
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from resource import RUSAGE_SELF, getrusage
+from sys import platform
+from time import perf_counter
+from stubs.constants import COLUMNS
+
+HEADERS = tuple(col.name for col in COLUMNS)
+STATUSES = ('scheduled', 'finished', 'not required', 'in progress', 'on hold')
+START = datetime(2001, 1, 1, 0, 0)
+PROJECTS = 50
+SHOTS = 1000
+
+
+def rows(count):
+    '''
+    Generates the specified number of raw rows, as yielded by the importer.Parser,
+    headers excluded: rows are unique by PROJECT, SHOT and VERSION and clustered
+    by CREATED_DATE.
+    '''
+    for i in range(count):
+        created = START + timedelta(minutes=i)
+        finish = created.date() + timedelta(days=i % 90)
+        yield ('project %d' % (i % PROJECTS),
+               str(i // PROJECTS % SHOTS),
+               str(i // (PROJECTS * SHOTS)),
+               STATUSES[i % len(STATUSES)],
+               finish.strftime('%Y-%m-%d'),
+               '%.2f' % (i % 1000 / 10),
+               created.strftime('%Y-%m-%d %H:%M'))
+
+
+def dataset(count):
+    '''
+    Returns the headers followed by the specified number of raw rows.
+    '''
+    yield HEADERS
+    yield from rows(count)
+
+
+def write(filename, count):
+    '''
+    Writes the dataset of the specified size as a pipe separated file.
+    '''
+    with open(filename, 'w') as f:
+        for row in dataset(count):
+            f.write('|'.join(row) + '\n')
+
+
+def arguments(desc, count=1000000):
+    parser = ArgumentParser(description=desc)
+    parser.add_argument('-n', '--number', type=int, default=count,
+                        help='the number of rows of the synthetic dataset, default to %d' % count)
+    return parser.parse_args()
+
+
+def measure(fn, *args):
+    start = perf_counter()
+    result = fn(*args)
+    return result, perf_counter() - start
+
+
+def peak_rss():
+    '''
+    Returns the peak resident set size of the current process, in megabytes.
+    '''
+    usage = getrusage(RUSAGE_SELF).ru_maxrss
+    if platform == 'darwin':
+        return usage / 1024 ** 2
+    return usage / 1024
+
+
+def isolated(fn, *args):
+    '''
+    Measures the specified function within a fresh process, so that its peak
+    resident set size is not affected by previous runs: returns the result,
+    the elapsed seconds and the peak RSS (of that process only, not of its
+    own children).
+    '''
+    context = get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_measured, args=(queue, fn) + args)
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _measured(queue, fn, *args):
+    result, seconds = measure(fn, *args)
+    queue.put((result, seconds, peak_rss()))
+
+
+def report(label, count, seconds, rss=None):
+    rate = count / seconds if seconds else float('inf')
+    line = '%-32s %12d rows %10.3f s %14.0f rows/s' % (label, count, seconds, rate)
+    if rss is not None:
+        line += ' %10.1f MB peak RSS' % rss
+    print(line)
@@ -0,0 +1,37 @@
+'''
+Synopsis
+--------
+Compares the throughput of the row by row execution against the batch execution
+over a columnar table (by NumPy arrays when installed), for full scans, filters,
+sorts and groupings.
+'''
+
+from db_kata.batch import Batch
+from db_kata.datastore import ColumnarTable
+from db_kata.query import Bulk
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+QUERIES = (
+    ('scan', {}),
+    ('filter scan', {'filter': 'SHOT="42" OR VERSION=1 AND PROJECT="project 7"'}),
+    ('filter index', {'filter': 'STATUS="on hold" AND INTERNAL_BID>50', 'select': 'PROJECT,SHOT'}),
+    ('sort', {'order': 'FINISH_DATE:desc,PROJECT', 'select': 'PROJECT,SHOT,FINISH_DATE'}),
+    ('group', {'select': 'PROJECT,SHOT:count,INTERNAL_BID:sum', 'group': 'PROJECT'}),
+)
+
+
+def main():
+    opts = arguments('Query throughput, row by row versus batch execution')
+    table, seconds = measure(ColumnarTable.factory, dataset(opts.number), COLUMNS)
+    report('import', len(table), seconds)
+    print('batches by %r' % Batch.factory())
+    for label, query in QUERIES:
+        for mode, size in (('rows', 0), ('batch', Batch.SIZE)):
+            bulk = Bulk.factory(batch=size, **query)
+            count, seconds = measure(lambda: sum(1 for _ in bulk(table)))
+            report('%s %s (%d)' % (label, mode, count), len(table), seconds)
+
+
+if __name__ == '__main__':
+    main()
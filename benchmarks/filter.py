@@ -0,0 +1,58 @@
+'''
+Synopsis
+--------
+Compares the filter throughput of the legacy per-row string substitution and eval
+against the compiled query.Filter predicate.
+'''
+
+from db_kata.datastore import Table
+from db_kata.query import Filter
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+QUERY = 'PROJECT="project 7" AND (STATUS="not required" OR VERSION=1) OR SHOT=3'
+
+
+def legacy(table, query):
+    '''
+    The filtering algorithm replaced by the compiled predicates: the expression is
+    translated to Python source once, then every row gets its values substituted
+    into the source and evaluated.
+    '''
+    tokens = Filter(query).tokens
+    names = table.column_names
+    translation = []
+    for token in tokens:
+        if token in names:
+            translation.append(token)
+            col = [col for col in table.columns if col.name == token][0]
+        elif token == Filter.EQUAL:
+            translation.append('==')
+        elif token in Filter.OPERANDS:
+            translation.append(token.lower())
+        else:
+            translation.append(repr(col.value(token)))
+    translation = ' '.join(translation)
+    for row in table:
+        evaluation = translation
+        for name, value in zip(names, row):
+            evaluation = evaluation.replace(name, repr(value))
+        if eval(evaluation):
+            yield row
+
+
+def compiled(table, query):
+    return Filter(query)(table)
+
+
+def main():
+    opts = arguments('Filter throughput, legacy eval versus compiled predicates')
+    table, seconds = measure(Table.factory, dataset(opts.number), COLUMNS)
+    report('import', len(table), seconds)
+    for fn in (legacy, compiled):
+        count, seconds = measure(lambda: sum(1 for _ in fn(table, QUERY)))
+        report('filter %s (%d matches)' % (fn.__name__, count), len(table), seconds)
+
+
+if __name__ == '__main__':
+    main()
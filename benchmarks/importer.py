@@ -0,0 +1,44 @@
+'''
+Synopsis
+--------
+Compares the throughput and the peak memory of importing a pipe separated file
+by building the whole table before storing it, against streaming it in bounded
+batches into datastore segments, and against parsing it by multiple processes.
+'''
+
+from os import path
+from tempfile import TemporaryDirectory
+from db_kata.datastore import Table
+from db_kata.importer import Parser, Segments, Storage, Workers
+from benchmarks import arguments, isolated, report, write
+from stubs.constants import COLUMNS
+
+
+def whole(filename, datastore):
+    table = Table.factory(Parser(filename), COLUMNS)
+    Storage(datastore).write(table)
+    return len(table)
+
+
+def streaming(filename, datastore):
+    return Segments(datastore).load(Parser(filename), COLUMNS)
+
+
+def parallel(filename, datastore):
+    table = Workers().load(filename, COLUMNS)
+    Storage(datastore).write(table)
+    return len(table)
+
+
+def main():
+    opts = arguments('Import throughput and peak memory, whole table versus streamed segments')
+    with TemporaryDirectory() as tempdir:
+        filename = path.join(tempdir, 'projects.txt')
+        write(filename, opts.number)
+        for fn in (whole, streaming, parallel):
+            count, seconds, rss = isolated(fn, filename, path.join(tempdir, fn.__name__))
+            report('import %s' % fn.__name__, count, seconds, rss)
+
+
+if __name__ == '__main__':
+    main()
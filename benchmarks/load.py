@@ -0,0 +1,44 @@
+'''
+Synopsis
+--------
+Compares the throughput of building the tables from parsed rows by appending them
+one by one (validating, logging and keying each row) against the bulk load by
+batches, along with the parsing of the same rows as a baseline.
+'''
+
+from os import path
+from tempfile import TemporaryDirectory
+from db_kata.datastore import ColumnarTable, Table
+from db_kata.importer import Parser
+from benchmarks import arguments, measure, report, write
+from stubs.constants import COLUMNS
+
+
+def appending(cls, data):
+    data = iter(data)
+    table = cls(COLUMNS)
+    table._sort(next(data))
+    for row in data:
+        table.append(row)
+    return table
+
+
+def loading(cls, data):
+    return cls.factory(data, COLUMNS)
+
+
+def main():
+    opts = arguments('Table building throughput, row by row appends versus bulk load')
+    with TemporaryDirectory() as tempdir:
+        filename = path.join(tempdir, 'projects.txt')
+        write(filename, opts.number)
+        data, seconds = measure(list, Parser(filename))
+        report('parse', len(data) - 1, seconds)
+    for cls in (Table, ColumnarTable):
+        for fn in (appending, loading):
+            table, seconds = measure(fn, cls, data)
+            report('%s %s' % (cls.__name__, fn.__name__), len(data) - 1, seconds)
+
+
+if __name__ == '__main__':
+    main()
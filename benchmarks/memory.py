@@ -0,0 +1,89 @@
+'''
+Synopsis
+--------
+Compares the bytes per row of the tables keyed by the legacy MD5 hex digests of
+the concatenated key values against the tuples of the typed key values (sharing
+the values of the records), along with the columnar table and the records stored
+as slotted objects instead of plain tuples.
+Each layout is built within a fresh process, tracing its allocations, by the
+columns stripped of their secondary indexes: the bytes are divided by the rows
+actually stored, since the legacy digests merge the rows whose concatenated keys
+collide (i.e. 'project 1', '10' and 'project 11', '0').
+Exits with an error when the legacy layout reports the same rows and bytes as the
+tuple keys one, i.e. its digests are no longer the keys actually stored.
+'''
+
+from hashlib import md5
+from sys import exit
+from time import perf_counter
+import tracemalloc
+from db_kata.datastore import Column, ColumnarTable, Table
+from benchmarks import HEADERS, arguments, dataset, isolated
+from stubs.constants import COLUMNS
+
+PLAIN = tuple(Column(col.name, col.value, col.key) for col in COLUMNS)
+
+
+class LegacyTable(Table):
+    '''
+    The table keyed by the hex digest of the key values, joined without separator.
+    '''
+
+    def _key(self):
+        positions = [i for i, col in enumerate(self.columns) if col.key]
+        return lambda row: md5(''.join(str(row[i]) for i in positions).encode()).hexdigest()
+
+    def _id(self, row):
+        return self._key()(row)
+
+
+class Record:
+    __slots__ = tuple(HEADERS)
+
+    def __init__(self, *values):
+        for name, val in zip(self.__slots__, values):
+            setattr(self, name, val)
+
+
+def footprint(cls, count):
+    tracemalloc.start()
+    start = perf_counter()
+    table = cls.factory(dataset(count), PLAIN)
+    size, _ = tracemalloc.get_traced_memory()
+    return len(table), size, perf_counter() - start
+
+
+def slotted(count):
+    tracemalloc.start()
+    start = perf_counter()
+    table = Table.factory(dataset(count), PLAIN)
+    table.records = [Record(*row) for row in table.records]
+    size, _ = tracemalloc.get_traced_memory()
+    return len(table), size, perf_counter() - start
+
+
+def report(label, count, seconds, size):
+    print('%-32s %12d rows %10.3f s %10.1f bytes/row %10.1f MB' % (label, count, seconds, size / count, size / 1024 ** 2))
+
+
+LAYOUTS = (
+    ('md5 keys, tuple records', footprint, LegacyTable),
+    ('tuple keys, tuple records', footprint, Table),
+    ('tuple keys, slotted records', slotted),
+    ('tuple keys, columnar', footprint, ColumnarTable),
+)
+
+
+def main():
+    opts = arguments('Bytes per row of the keys and records layouts', 5000000)
+    results = []
+    for label, fn, *args in LAYOUTS:
+        (count, size, seconds), _, _ = isolated(fn, *(args + [opts.number]))
+        report(label, count, seconds, size)
+        results.append((count, size))
+    if results[0] == results[1]:
+        exit('md5 keys measured as tuple keys: %d rows, %d bytes' % results[0])
+
+
+if __name__ == '__main__':
+    main()
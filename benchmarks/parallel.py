@@ -0,0 +1,80 @@
+'''
+Synopsis
+--------
+Measures the scaling of the queries over a mapped datastore by the number of
+worker processes scanning its partitions: full scans, filters without indexes,
+groupings (merging the partial groups) and limited sorts (merging the sorted
+runs), within 1, 2, 4 and 8 workers.
+The rows per second are those of the whole table, the speedup is relative to
+the single process, and the rows of every run are checked against its ones (float
+sums within a relative tolerance, being summed by partition).
+'''
+
+from math import isclose
+from os import cpu_count, path
+from sys import exit
+from tempfile import TemporaryDirectory
+from db_kata.datastore import ColumnarTable
+from db_kata.importer import Mapped
+from db_kata.query import Bulk
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+WORKERS = (1, 2, 4, 8)
+QUERIES = (
+    ('scan', {'select': 'PROJECT,SHOT,INTERNAL_BID'}),
+    ('filter', {'filter': 'INTERNAL_BID>90 AND STATUS="finished"', 'select': 'PROJECT,SHOT'}),
+    ('group', {'select': 'PROJECT,SHOT:count,INTERNAL_BID:sum,CREATED_DATE:max', 'group': 'PROJECT'}),
+    ('status', {'select': 'STATUS,PROJECT:count,SHOT:count_approx', 'group': 'STATUS', 'order': 'STATUS'}),
+    ('top', {'order': 'INTERNAL_BID:desc,CREATED_DATE', 'limit': 100}),
+)
+TOLERANCE = 1e-9
+
+
+def mismatch(rows, expected):
+    '''
+    Returns the position of the first row differing from the expected ones, None
+    when they are the same.
+    '''
+    for pos, (row, other) in enumerate(zip(rows, expected)):
+        if len(row) != len(other) or not all(same(value, val) for value, val in zip(row, other)):
+            return pos
+    if len(rows) != len(expected):
+        return min(len(rows), len(expected))
+    return None
+
+
+def same(value, other):
+    if isinstance(value, float) and isinstance(other, float):
+        return isclose(value, other, rel_tol=TOLERANCE)
+    return value == other
+
+
+def main():
+    opts = arguments('Query throughput by the number of worker processes')
+    print('%d CPUs available' % cpu_count())
+    with TemporaryDirectory() as tempdir:
+        mapped = Mapped(path.join(tempdir, 'projects'))
+        _, seconds = measure(lambda: mapped.dump(ColumnarTable.factory(dataset(opts.number), COLUMNS)))
+        table = mapped.read()
+        report('import', len(table), seconds)
+        differing = []
+        for label, query in QUERIES:
+            expected, baseline = None, None
+            for workers in WORKERS:
+                bulk = Bulk.factory(workers=workers, **query)
+                rows, seconds = measure(lambda: list(bulk(table)))
+                if expected is None:
+                    expected, baseline = rows, seconds
+                else:
+                    pos = mismatch(rows, expected)
+                    if pos is not None:
+                        print('%s within %d workers differs at row %d of %d (%d expected)' % (label, workers, pos, len(rows), len(expected)))
+                        differing.append('%s/%d' % (label, workers))
+                report('%s, %d workers (x%.2f)' % (label, workers, baseline / seconds), len(table), seconds)
+    if differing:
+        exit('parallel rows differ from the serial ones: %s' % ','.join(differing))
+
+
+if __name__ == '__main__':
+    main()
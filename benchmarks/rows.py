@@ -0,0 +1,94 @@
+'''
+Synopsis
+--------
+Compares the throughput of the legacy rows of name/value pairs, matched by name
+at every row, against the positional rows flowing through query.Bulk as plain
+tuples, for selections, filters and sorts over a row oriented table.
+'''
+
+from collections import OrderedDict
+from operator import itemgetter
+from db_kata.datastore import Table
+from db_kata.query import Bulk, Filter
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+SELECT = 'PROJECT,SHOT,VERSION'
+QUERY = 'VERSION>=0'
+ORDER = 'FINISH_DATE,INTERNAL_BID'
+
+
+def pairs(table, names=None):
+    '''
+    The rows as yielded by the legacy tables: tuples of name/value pairs.
+    '''
+    names = names or table.column_names
+    indexes = tuple(table.column_names.index(name) for name in names)
+    for row in table.records:
+        yield tuple((name, row[i]) for name, i in zip(names, indexes))
+
+
+def legacy_select(rows, names):
+    for row in rows:
+        selected = OrderedDict()
+        for qname in names:
+            for name, value in row:
+                if qname == name:
+                    selected[name] = value
+        yield tuple(selected.items())
+
+
+def legacy_sort(rows, names):
+    rows = (OrderedDict(row) for row in rows)
+    for row in sorted(rows, key=itemgetter(*names)):
+        yield tuple(row.items())
+
+
+def legacy_filter(table, query):
+    '''
+    The filter scanning the pairs of the compared columns (their values unpacked
+    for the current predicates) and taking the whole rows by position.
+    '''
+    _filter = Filter(query)
+    predicate = _filter._compile(_filter.tree, table)
+    rows = pairs(table, _filter.names)
+    positions = [pos for pos, row in enumerate(rows) if predicate(tuple(value for _, value in row))]
+    names = table.column_names
+    for pos in positions:
+        yield tuple(zip(names, table.records[pos]))
+
+
+def legacy(table, select=None, query=None, order=None):
+    rows = pairs(table)
+    if query:
+        rows = legacy_filter(table, query)
+    if order:
+        rows = legacy_sort(rows, order.split(','))
+    if select:
+        rows = legacy_select(rows, select.split(','))
+    for row in rows:
+        yield tuple(value for _, value in row)
+
+
+QUERIES = (
+    ('scan', {}),
+    ('select', {'select': SELECT}),
+    ('filter select', {'filter': QUERY, 'select': SELECT}),
+    ('filter sort', {'filter': QUERY, 'order': ORDER, 'select': SELECT}),
+)
+
+
+def main():
+    opts = arguments('Query throughput, name/value pairs versus positional rows')
+    table, seconds = measure(Table.factory, dataset(opts.number), COLUMNS)
+    report('import', len(table), seconds)
+    for label, query in QUERIES:
+        count, seconds = measure(lambda: sum(1 for _ in legacy(table, query.get('select'), query.get('filter'), query.get('order'))))
+        report('%s pairs (%d)' % (label, count), len(table), seconds)
+        bulk = Bulk.factory(batch=0, **query)
+        count, seconds = measure(lambda: sum(1 for _ in bulk(table)))
+        report('%s positional (%d)' % (label, count), len(table), seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''
+Synopsis
+--------
+Compares the peak RSS of sorting a dataset several times larger than the sort
+budget in memory against the external merge sort spilling runs to temporary
+files: both the positions of a stored table and the rows yielded by a filter
+are sorted.
+'''
+
+from os import path
+from tempfile import TemporaryDirectory
+from db_kata.datastore import ColumnarTable
+from db_kata.importer import Mapped
+from db_kata.query import Bulk, Filter, Sorter
+from benchmarks import arguments, dataset, isolated, report
+from stubs.constants import COLUMNS
+
+ORDER = 'FINISH_DATE,INTERNAL_BID'
+QUERY = 'VERSION>=0'
+RUNS = 8
+
+
+def build(filename, count):
+    Mapped(filename).dump(ColumnarTable.factory(dataset(count), COLUMNS))
+
+
+def sort(filename, query, budget):
+    table = Mapped(filename).read()
+    _filter = Filter(query) if query else None
+    bulk = Bulk(_filter, Sorter(ORDER, budget=budget), None)
+    return sum(1 for _ in bulk(table))
+
+
+def main():
+    opts = arguments('Sort peak RSS, in memory versus external merge sort')
+    budget = max(opts.number // RUNS, 1)
+    with TemporaryDirectory() as tempdir:
+        filename = path.join(tempdir, 'projects')
+        # built by another process as well, since the peak RSS is inherited by the spawned ones
+        isolated(build, filename, opts.number)
+        for query in (None, QUERY):
+            source = 'filtered rows' if query else 'table'
+            for label, size in (('memory', None), ('budget %d' % budget, budget)):
+                count, seconds, rss = isolated(sort, filename, query, size)
+                report('sort %s, %s' % (source, label), count, seconds, rss)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''
+Synopsis
+--------
+Compares the time to open a datastore and answer a single-row query from the
+gzipped pickle format against the memory mapped binary format, over the synthetic
+dataset and over a high-cardinality one, whose shots are all distinct (so that the
+dictionary of the SHOT column holds a word per row).
+'''
+
+from os import path
+from tempfile import TemporaryDirectory
+from db_kata.datastore import ColumnarTable
+from db_kata.importer import Mapped, Storage
+from db_kata.query import Filter
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+QUERY = 'PROJECT="project 7" AND SHOT=%d AND VERSION=0'
+
+
+def distinct(count):
+    '''
+    Returns the dataset whose SHOT values are the row numbers.
+    '''
+    rows = dataset(count)
+    yield next(rows)
+    for i, row in enumerate(rows):
+        yield row[:1] + (str(i),) + row[2:]
+
+
+def query(storage, shot):
+    table = storage.read()
+    return len(list(Filter(QUERY % shot)(table))), len(table)
+
+
+def main():
+    opts = arguments('Datastore startup and single-row query, pickle versus mapped binary format')
+    for label, data, shot in (('', dataset, 42), (', distinct shots', distinct, 2107)):
+        table = ColumnarTable.factory(data(opts.number), COLUMNS)
+        with TemporaryDirectory() as tempdir:
+            for cls in (Storage, Mapped):
+                storage = cls(path.join(tempdir, 'projects'))
+                storage.dump(table)
+                (matches, count), seconds = measure(query, storage, shot)
+                report('%s read and query%s (%d matches)' % (cls.__name__.lower(), label, matches), count, seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+Synopsis
+--------
+Compares the per-value cost of the values parsers against the implementations
+they replaced: strptime for dates and times, bounds cast on every call for numbers.
+Exits with an error when any fast path turns out slower than its legacy one (their
+results being checked equivalent by the values tests).
+'''
+
+from datetime import datetime
+from sys import exit
+from db_kata.values import DateVal, FloatVal, IntVal, TimeVal
+from benchmarks import arguments, measure, rows
+
+
+class LegacyInt(IntVal):
+    CAST = int
+
+    def _cast(self, val):
+        val = self.CAST(val)
+        if val < self.CAST(self._min) or val > self.CAST(self._max):
+            msg = '%s is outside of permitted range: %s-%s' % (val, self._min, self._max)
+            raise ValueError(msg)
+        return val
+
+
+class LegacyFloat(LegacyInt):
+    CAST = float
+
+
+class LegacyDate(DateVal):
+    def _parse(self, val):
+        return datetime.strptime(val, self.FORMAT).date()
+
+
+class LegacyTime(TimeVal):
+    def _parse(self, val):
+        return datetime.strptime(val, self.FORMAT)
+
+
+PARSERS = (
+    ('int', 2, LegacyInt(), IntVal()),
+    ('float', 5, LegacyFloat(), FloatVal()),
+    ('date', 4, LegacyDate(), DateVal()),
+    ('time', 6, LegacyTime(), TimeVal()),
+)
+
+
+def per_value(parser, values):
+    '''
+    Returns the microseconds spent by the parser for each value.
+    '''
+    _, seconds = measure(lambda: [parser(val) for val in values])
+    return seconds / len(values) * 10 ** 6
+
+
+def main():
+    opts = arguments('Per-value cost of the values parsers, legacy versus fast path', 100000)
+    data = list(rows(opts.number))
+    slower = []
+    for kind, index, legacy, fast in PARSERS:
+        values = [row[index] for row in data]
+        before = per_value(legacy, values)
+        after = per_value(fast, values)
+        _, batched = measure(fast.batch, values)
+        batched = batched / len(values) * 10 ** 6
+        print('%-8s legacy %8.3f us fast %8.3f us batch %8.3f us %8.1fx' %
+              (kind, before, after, batched, before / after))
+        if after >= before:
+            slower.append(kind)
+    if slower:
+        exit('fast path slower than legacy: %s' % ','.join(slower))
+
+
+if __name__ == '__main__':
+    main()
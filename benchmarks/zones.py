@@ -0,0 +1,45 @@
+'''
+Synopsis
+--------
+Compares the throughput of date-bounded filters over a mapped datastore scanning
+every block against skipping the blocks by the zone maps, both row by row and by
+batches: the synthetic rows are clustered by CREATED_DATE, which is not indexed.
+'''
+
+from os import path
+from tempfile import TemporaryDirectory
+from db_kata.datastore import ColumnarTable
+from db_kata.importer import Mapped
+from db_kata.query import Bulk, Filter
+from benchmarks import arguments, dataset, measure, report
+from stubs.constants import COLUMNS
+
+QUERIES = (
+    'CREATED_DATE BETWEEN 2001-01-02 00:00 AND 2001-01-02 23:59',
+    'CREATED_DATE<2001-01-08 00:00 AND STATUS="finished"',
+    'PROJECT="project 7" AND CREATED_DATE<2001-01-15 00:00',
+)
+
+
+def main():
+    opts = arguments('Filter throughput, full scans versus zone maps')
+    with TemporaryDirectory() as tempdir:
+        mapped = Mapped(path.join(tempdir, 'projects'))
+        _, seconds = measure(lambda: mapped.dump(ColumnarTable.factory(dataset(opts.number), COLUMNS)))
+        table = mapped.read()
+        report('import', len(table), seconds)
+        zones = table.zones
+        for query in QUERIES:
+            blocks = Filter(query)._blocks(table)
+            print('%s: %d of %d blocks' % (query, len(blocks), len(next(iter(zones.values())))))
+            for mode, batch in (('rows', None), ('batch', Bulk.factory().batch)):
+                for label, maps in (('scan', {}), ('zones', zones)):
+                    table.zones = maps
+                    bulk = Bulk(Filter(query), None, None, batch=batch)
+                    count, seconds = measure(lambda: sum(1 for _ in bulk(table)))
+                    report('%s %s (%d)' % (mode, label, count), len(table), seconds)
+        table.zones = zones
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+from itertools import compress, repeat
+from operator import neg
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Batch(object):
+    '''
+    Summary
+    -------
+    The primitives of the batch execution mode over columnar tables: the rows are
+    processed by chunks of positions, whose columns are the codes of the table vectors
+    and whose selections are the indexes of the selected rows within the chunk (None
+    selecting all of them).
+    Comparisons are evaluated over the codes, since the encodings preserve the order of
+    the values (the dictionary encoded text columns just support equality).
+
+    This implementation relies on C level iteration (operator functions mapped over the
+    columns and compressed by the results), NumpyBatch on arrays.
+
+    Arguments
+    ---------
+    * size: the number of rows of each chunk
+
+    Constructor
+    -----------
+    >>> batch = Batch(size=4096)
+
+    Methods
+    -------
+    Batch.factory: factory the NumpyBatch when NumPy is installed, the Batch otherwise
+    >>> batch = Batch.factory()
+
+    chunks: return a generator splitting the positions (all of the table when None)
+            into chunks of the batch size
+    >>> list(batch.chunks(None, 10000))
+    [range(0, 4096), range(4096, 8192), range(8192, 10000)]
+
+    spans: return a generator splitting the (start, stop) ranges of positions into
+           chunks of the batch size
+    >>> list(batch.spans([(0, 5000), (8192, 9000)]))
+    [range(0, 4096), range(4096, 5000), range(8192, 9000)]
+
+    column: return the codes of the vector at the positions of the chunk
+    >>> batch.column(table.vectors['VERSION'], range(0, 4096))
+
+    select: return the indexes of the selection whose codes satisfy the comparison
+    >>> batch.select(operator.ge, column, 64, selection=None)
+    [0, 2, 3]
+
+    union: return the sorted indexes of either selections
+    >>> batch.union([0, 3], [2, 3])
+    [0, 2, 3]
+
+    positions: return the positions of the chunk at the indexes of the selection
+    >>> batch.positions(range(4096, 8192), [0, 2])
+    [4096, 4098]
+
+    keys: return the codes of the vector at the positions as sorting keys, optionally
+          mapped to their ranks and negated
+    >>> batch.keys(table.vectors['PROJECT'], positions, ranks=vector.ranks(), negate=True)
+
+    argsort: return the indexes sorting the keys columns, None when not supported (the
+             caller sorting them by itself)
+    >>> batch.argsort([keys], reverse=False)
+    '''
+
+    SIZE = 4096
+
+    @classmethod
+    def factory(cls, size=SIZE):
+        if numpy is not None:
+            return NumpyBatch(size)
+        return cls(size)
+
+    def __init__(self, size=SIZE):
+        self.size = size
+
+    def __repr__(self):
+        name = self.__class__.__name__
+        return '%s(size=%d)' % (name, self.size)
+
+    def chunks(self, positions, length):
+        if positions is None:
+            yield from self.spans([(0, length)])
+            return
+        for start in range(0, len(positions), self.size):
+            yield positions[start:start + self.size]
+
+    def spans(self, spans):
+        for start, stop in spans:
+            for chunk in range(start, stop, self.size):
+                yield range(chunk, min(chunk + self.size, stop))
+
+    def column(self, vector, positions):
+        if isinstance(positions, range):
+            return vector.chunk(positions.start, positions.stop)
+        return vector.gather(positions)
+
+    def select(self, fn, column, code, selection=None):
+        if code is None:
+            return []
+        if selection is None:
+            return list(compress(range(len(column)), map(fn, column, repeat(code))))
+        return list(compress(selection, map(fn, map(column.__getitem__, selection), repeat(code))))
+
+    def union(self, left, right):
+        return sorted(set(left).union(right))
+
+    def positions(self, chunk, selection):
+        if selection is None:
+            return list(chunk)
+        return list(map(chunk.__getitem__, selection))
+
+    def keys(self, vector, positions, ranks=None, negate=False):
+        codes = self.column(vector, positions)
+        if ranks is not None:
+            codes = list(map(ranks.__getitem__, codes))
+        if negate:
+            codes = list(map(neg, codes))
+        return codes
+
+    def argsort(self, columns, reverse=False):
+        return None
+
+
+class NumpyBatch(Batch):
+    '''
+    Summary
+    -------
+    The batch primitives over NumPy arrays: columns are views over the vectors data
+    (copied just when gathered), selections are arrays of indexes computed by boolean
+    masks and sorting relies on the stable numpy.lexsort.
+
+    Constructor
+    -----------
+    >>> batch = NumpyBatch(size=4096)
+    '''
+
+    def column(self, vector, positions):
+        data = vector.data
+        if not len(data):
+            return numpy.empty(0)
+        codes = numpy.frombuffer(data, dtype=memoryview(data).format)
+        if isinstance(positions, range):
+            return codes[positions.start:positions.stop]
+        return codes[numpy.asarray(positions, dtype=numpy.intp)]
+
+    def select(self, fn, column, code, selection=None):
+        if code is None:
+            return numpy.empty(0, dtype=numpy.intp)
+        if selection is None:
+            return numpy.flatnonzero(fn(column, code))
+        return selection[fn(column[selection], code)]
+
+    def union(self, left, right):
+        return numpy.union1d(left, right)
+
+    def positions(self, chunk, selection):
+        if selection is None:
+            return list(chunk)
+        if isinstance(chunk, range):
+            return (numpy.asarray(selection) + chunk.start).tolist()
+        return numpy.asarray(chunk)[selection].tolist()
+
+    def keys(self, vector, positions, ranks=None, negate=False):
+        codes = self.column(vector, positions)
+        if ranks is not None:
+            codes = numpy.asarray(ranks, dtype=numpy.intp)[codes]
+        if negate:
+            codes = -codes
+        return codes
+
+    def argsort(self, columns, reverse=False):
+        if reverse:
+            columns = [-column for column in columns]
+        return numpy.lexsort(columns[::-1])
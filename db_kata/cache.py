@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from hashlib import md5
+from os import listdir, makedirs, path, remove, replace, stat, utime
+import pickle
+import re
+from threading import Lock
+from db_kata.logger import BASE as logger
+
+
+class Cache(object):
+    '''
+    Summary
+    -------
+    Caches the rows yielded by the query.Bulk operators, keyed by their canonical
+    form along with the generation of the datastore, so that repeated queries are
+    answered without reading the table at all: the least recently used entries are
+    evicted once the cached rows exceed the size, results larger than it (or not
+    repeatable, i.e. over unseeded samples) are not cached. Entries are looked up and stored under a lock, so that queries can run
+    within multiple threads.
+
+    Arguments
+    ---------
+    * size: the maximum number of rows cached
+
+    Constructor
+    -----------
+    >>> cache = Cache(size=100000)
+
+    Methods
+    -------
+    call: return a generator with the rows answering the bulk over the storage,
+          reading the storage just on cache misses
+    >>> cache(Bulk(...), Storage(...))
+
+    fetch: return a generator with the rows answering the bulk for the generation,
+           calling load to get the table on cache misses
+    >>> cache.fetch(Bulk(...), generation, lambda: table)
+    '''
+
+    SIZE = 100000
+
+    def __init__(self, size=SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __call__(self, bulk, storage):
+        return self.fetch(bulk, storage.generation(), storage.read)
+
+    def fetch(self, bulk, generation, load):
+        key = self._key(bulk, generation)
+        rows = self._get(key) if key is not None else None
+        if rows is not None:
+            logger.info('answering by %d cached rows', len(rows))
+            yield from rows
+            return
+        rows = []
+        for row in bulk(load()):
+            if rows is not None:
+                rows.append(row)
+                if len(rows) > self.size:
+                    rows = None
+            yield row
+        if rows is not None and key is not None:
+            self._put(key, rows)
+
+    def _key(self, bulk, generation):
+        canonical = bulk.canonical()
+        if generation is None or canonical is None:
+            return None
+        return md5(repr((generation, canonical)).encode()).hexdigest()
+
+    def _get(self, key):
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is not None:
+                self.entries.move_to_end(key)
+            return rows
+
+    def _put(self, key, rows):
+        with self.lock:
+            if key in self.entries:
+                self.rows -= len(self.entries.pop(key))
+            self.entries[key] = rows
+            self.rows += len(rows)
+            while self.rows > self.size:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= len(evicted)
+
+
+class DiskCache(Cache):
+    '''
+    Summary
+    -------
+    Caches the rows within a directory, one pickle file per entry, so that they are
+    shared by subsequent processes (i.e. the CLI): the number of rows of each entry
+    is part of its filename and hits touch the file, so that the least recently
+    used entries are evicted by their modification time.
+
+    Arguments
+    ---------
+    * dirname: the path of the cache directory, created if missing
+    * size: the maximum number of rows cached
+
+    Constructor
+    -----------
+    >>> cache = DiskCache('./.db_kata_cache', size=1000000)
+    '''
+
+    DIRNAME = './.db_kata_cache'
+    SIZE = 1000000
+    EXT = '.pickle'
+    TEMP = '.tmp'
+    PATTERN = re.compile(r'^([0-9a-f]{32})\.(\d+)%s$' % re.escape(EXT))
+
+    def __init__(self, dirname=DIRNAME, size=SIZE):
+        super().__init__(size)
+        self.dirname = path.abspath(dirname)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _get(self, key):
+        entry = self._entries().get(key)
+        if entry is None:
+            return None
+        filename, _ = entry
+        try:
+            with open(filename, 'rb') as f:
+                rows = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.error('discarding cache entry %s: %s', filename, e)
+            return None
+        try:
+            utime(filename)
+        except FileNotFoundError:
+            pass
+        return rows
+
+    def _put(self, key, rows):
+        makedirs(self.dirname, exist_ok=True)
+        filename = path.join(self.dirname, '%s.%d%s' % (key, len(rows), self.EXT))
+        temp = filename + self.TEMP
+        with open(temp, 'wb') as f:
+            pickle.dump(rows, f, pickle.HIGHEST_PROTOCOL)
+        replace(temp, filename)
+        self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries().values(), key=lambda entry: self._mtime(entry[0]))
+        cached = sum(count for _, count in entries)
+        for filename, count in entries:
+            if cached <= self.size:
+                break
+            logger.info('evicting cache entry %s', filename)
+            try:
+                remove(filename)
+            except FileNotFoundError:
+                pass
+            cached -= count
+
+    def _entries(self):
+        if not path.isdir(self.dirname):
+            return {}
+        entries = {}
+        for name in listdir(self.dirname):
+            match = self.PATTERN.match(name)
+            if match:
+                entries[match.group(1)] = (path.join(self.dirname, name), int(match.group(2)))
+        return entries
+
+    def _mtime(self, filename):
+        try:
+            return stat(filename).st_mtime_ns
+        except FileNotFoundError:
+            return 0
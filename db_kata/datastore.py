@@ -1,6 +1,12 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from collections import OrderedDict
-from hashlib import md5
+from heapq import merge
+from itertools import islice, repeat
+from operator import itemgetter
+from time import perf_counter
 from db_kata.logger import BASE as logger
+from db_kata.values import Val
 
 
 class Column:
@@ -15,21 +21,735 @@ class Column:
     * value: the kind of the column, one of the instances specified in the values module
     * key: indicates if the column is a unique key
     * desc: an optional description
+    * index: the kind of the secondary index maintained for the column, if any:
+      'hash' for equality lookups, 'sorted' for equality and ordered lookups
 
     Constructor
     -----------
     >>> Column('VERSION', values.IntVal(), key=True, desc='the current version of the file')
+    >>> Column('FINISH_DATE', values.DateVal(), index='sorted')
     '''
 
-    def __init__(self, name, value, key=False, desc=''):
+    INDEXES = ('hash', 'sorted')
+
+    def __init__(self, name, value, key=False, desc='', index=None):
         self.name = str(name)
         self.value = value
         self.key = key
         self.desc = str(desc)
+        self.index = self._index(index)
 
     def __repr__(self):
         return 'Column(%s, %s, key=%s)' % (self.name, self.value, self.key)
 
+    def _index(self, index):
+        if index and index not in self.INDEXES:
+            msg = '%s is not a valid index: %s' % (index, ','.join(self.INDEXES))
+            logger.error(msg)
+            raise ValueError(msg)
+        return index
+
+
+class HashIndex:
+    '''
+    Summary
+    -------
+    Maps the distinct values of a column to the set of positions of the rows
+    holding them, answering equality lookups without scanning the table.
+
+    Constructor
+    -----------
+    >>> index = HashIndex()
+
+    Methods
+    -------
+    HashIndex.factory: factory the index by its kind, as declared by the column
+    >>> index = HashIndex.factory('sorted')
+
+    add: adds the position of a row for the specified value
+    >>> index.add('the hobbit', 0)
+
+    extend: adds the consecutive positions of rows from start for the specified values
+    >>> index.extend(['the hobbit', 'the lord of the rings'], start=4)
+
+    discard: removes the position of a row for the specified value
+    >>> index.discard('the hobbit', 0)
+
+    lookup: returns the set of positions of rows matching the specified value
+    >>> index.lookup('the hobbit')
+    {0, 3}
+    '''
+
+    @classmethod
+    def factory(cls, kind):
+        return {'hash': HashIndex, 'sorted': SortedIndex}[kind]()
+
+    def __init__(self):
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return '%s(values=%d)' % (self.__class__.__name__, len(self.positions))
+
+    def add(self, val, pos):
+        positions = self.positions.get(val)
+        if positions is None:
+            positions = self.positions[val] = set()
+            self._new(val)
+        positions.add(pos)
+
+    def extend(self, values, start=0):
+        index = self.positions
+        new = []
+        for pos, val in enumerate(values, start):
+            positions = index.get(val)
+            if positions is None:
+                positions = index[val] = set()
+                new.append(val)
+            positions.add(pos)
+        if new:
+            self._merge(new)
+
+    def discard(self, val, pos):
+        positions = self.positions.get(val)
+        if positions is not None:
+            positions.discard(pos)
+            if not positions:
+                del self.positions[val]
+                self._drop(val)
+
+    def lookup(self, val):
+        return self.positions.get(val, set())
+
+    def _new(self, val):
+        pass
+
+    def _merge(self, values):
+        pass
+
+    def _drop(self, val):
+        pass
+
+
+class SortedIndex(HashIndex):
+    '''
+    Summary
+    -------
+    Extends the hash index by keeping the distinct values of the column sorted,
+    so that ordered lookups bisect them instead of scanning the table: the values
+    new to a bulk of rows are sorted apart and merged at once.
+
+    Methods
+    -------
+    range: returns the set of positions of rows whose value falls within the
+           specified bounds, inclusive by default, missing bounds are unlimited
+    >>> index.range(low=date(2010, 7, 1), high=date(2010, 9, 30))
+    {0, 3}
+    >>> index.range(high=45.0, right=False)
+    {1, 2, 3}
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.keys = []
+
+    def range(self, low=None, high=None, left=True, right=True):
+        keys = self.keys
+        start = 0
+        stop = len(keys)
+        if low is not None:
+            start = (bisect_left if left else bisect_right)(keys, low)
+        if high is not None:
+            stop = (bisect_right if right else bisect_left)(keys, high)
+        positions = set()
+        for key in keys[start:stop]:
+            positions |= self.positions[key]
+        return positions
+
+    def _new(self, val):
+        insort(self.keys, val)
+
+    def _merge(self, values):
+        self.keys = list(merge(self.keys, sorted(values)))
+
+    def _drop(self, val):
+        del self.keys[bisect_left(self.keys, val)]
+
+
+class MappedIndex:
+    '''
+    Summary
+    -------
+    Represents a read-only index over the codes of a column: row positions are
+    sorted by code, while distinct codes are sorted apart along with the bounds
+    of their positions, so that lookups bisect the codes of a memory mapped
+    index without loading it.
+
+    Arguments
+    ---------
+    * vector: the vector of the indexed column, encoding the looked up values
+    * keys: the sorted distinct codes of the column
+    * bounds: the starting offset of the positions of each code, followed by their total
+    * positions: the positions of the rows, sorted by code
+
+    Constructor
+    -----------
+    >>> index = MappedIndex(vector, *MappedIndex.build(vector.data))
+
+    Methods
+    -------
+    MappedIndex.factory: factory the index by its kind, as declared by the column
+    >>> index = MappedIndex.factory('sorted', vector, keys, bounds, positions)
+
+    MappedIndex.build: computes the keys, bounds and positions arrays from the codes of a column
+    >>> keys, bounds, positions = MappedIndex.build(vector.data)
+
+    lookup: returns the set of positions of rows matching the specified value
+    >>> index.lookup('the hobbit')
+    {0, 3}
+    '''
+
+    TYPECODE = 'q'
+
+    @classmethod
+    def factory(cls, kind, *args):
+        return {'hash': MappedIndex, 'sorted': MappedSortedIndex}[kind](*args)
+
+    @classmethod
+    def build(cls, codes):
+        positions = array(cls.TYPECODE, sorted(range(len(codes)), key=codes.__getitem__))
+        keys = array(codes.typecode)
+        bounds = array(cls.TYPECODE)
+        for i, pos in enumerate(positions):
+            code = codes[pos]
+            if not keys or keys[-1] != code:
+                keys.append(code)
+                bounds.append(i)
+        bounds.append(len(positions))
+        return keys, bounds, positions
+
+    def __init__(self, vector, keys, bounds, positions):
+        self.vector = vector
+        self.keys = keys
+        self.bounds = bounds
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __repr__(self):
+        return '%s(values=%d)' % (self.__class__.__name__, len(self.keys))
+
+    def lookup(self, val):
+        code = self.vector.code(val)
+        if code is not None:
+            i = bisect_left(self.keys, code)
+            if i < len(self.keys) and self.keys[i] == code:
+                return self._positions(i, i + 1)
+        return set()
+
+    def _positions(self, start, stop):
+        if start >= stop:
+            return set()
+        return set(self.positions[self.bounds[start]:self.bounds[stop]])
+
+
+class MappedSortedIndex(MappedIndex):
+    '''
+    Summary
+    -------
+    Extends the mapped index by ordered lookups, relying on codes that preserve
+    the order of the values (as for dates, times and numbers).
+
+    Methods
+    -------
+    range: returns the set of positions of rows whose value falls within the
+           specified bounds, inclusive by default, missing bounds are unlimited
+    >>> index.range(low=date(2010, 7, 1), high=date(2010, 9, 30))
+    {0, 3}
+    '''
+
+    def range(self, low=None, high=None, left=True, right=True):
+        keys = self.keys
+        start = 0
+        stop = len(keys)
+        if low is not None:
+            start = (bisect_left if left else bisect_right)(keys, self.vector.code(low))
+        if high is not None:
+            stop = (bisect_right if right else bisect_left)(keys, self.vector.code(high))
+        return self._positions(start, stop)
+
+
+class ZoneMap:
+    '''
+    Summary
+    -------
+    Represents the statistics of a column by blocks of consecutive positions: the
+    minimum and maximum code, the number of values (all of them non null, since no
+    column is nullable) and the number of distinct codes of each block, so that scans
+    skip the blocks which cannot hold the compared values.
+    Codes preserve the order of the values, but the dictionary encoded ones, whose
+    blocks are skipped just by equality (their codes follow the order the words are
+    first met, so that clustered columns still have narrow blocks).
+
+    Arguments
+    ---------
+    * vector: the vector of the column, encoding the compared values
+    * size: the number of positions of each block
+    * lows: the minimum code of each block
+    * highs: the maximum code of each block
+    * counts: the number of values of each block
+    * distincts: the number of distinct codes of each block
+
+    Constructor
+    -----------
+    >>> zones = ZoneMap(vector, 4096, *ZoneMap.build(vector.data))
+
+    Methods
+    -------
+    ZoneMap.build: computes the lows, highs, counts and distincts arrays from the codes of a column
+    >>> lows, highs, counts, distincts = ZoneMap.build(vector.data, size=4096)
+
+    lookup: returns the set of the blocks which may hold the specified value
+    >>> zones.lookup('the hobbit')
+    {0, 1}
+
+    range: returns the set of the blocks which may hold values within the specified
+           bounds, inclusive by default, missing bounds are unlimited
+    >>> zones.range(low=date(2010, 7, 1), high=date(2010, 9, 30))
+    {7, 8}
+
+    spans: returns the sorted (start, stop) ranges of positions of the specified
+           blocks, adjacent blocks being joined
+    >>> zones.spans({7, 8, 10})
+    [(28672, 36864), (40960, 45056)]
+
+    rows: returns the number of values within the specified blocks
+    >>> zones.rows({7, 8})
+    8192
+
+    distinct: returns an upper bound of the distinct values of the column
+    >>> zones.distinct()
+    50
+
+    among: returns the set of the blocks which may hold any of the specified sorted codes
+    >>> zones.among([3, 17, 42])
+    {0, 5}
+    '''
+
+    TYPECODE = 'q'
+    SIZE = 4096
+
+    @classmethod
+    def build(cls, codes, size=SIZE):
+        lows = array(codes.typecode)
+        highs = array(codes.typecode)
+        counts = array(cls.TYPECODE)
+        distincts = array(cls.TYPECODE)
+        for start in range(0, len(codes), size):
+            block = codes[start:start + size]
+            lows.append(min(block))
+            highs.append(max(block))
+            counts.append(len(block))
+            distincts.append(len(set(block)))
+        return lows, highs, counts, distincts
+
+    def __init__(self, vector, size, lows, highs, counts, distincts):
+        self.vector = vector
+        self.size = size
+        self.lows = lows
+        self.highs = highs
+        self.counts = counts
+        self.distincts = distincts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        return '%s(blocks=%d, size=%d)' % (self.__class__.__name__, len(self), self.size)
+
+    def lookup(self, val):
+        code = self.vector.code(val)
+        if code is None:
+            return set()
+        return {block for block, (low, high) in enumerate(zip(self.lows, self.highs)) if low <= code <= high}
+
+    def range(self, low=None, high=None, left=True, right=True):
+        low = None if low is None else self.vector.code(low)
+        high = None if high is None else self.vector.code(high)
+        blocks = set()
+        for block, (lowest, highest) in enumerate(zip(self.lows, self.highs)):
+            if low is not None and (highest < low or not left and highest == low):
+                continue
+            if high is not None and (lowest > high or not right and lowest == high):
+                continue
+            blocks.add(block)
+        return blocks
+
+    def spans(self, blocks):
+        length = len(self.vector)
+        spans = []
+        for block in sorted(blocks):
+            start = block * self.size
+            stop = min(start + self.size, length)
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], stop)
+            else:
+                spans.append((start, stop))
+        return spans
+
+    def rows(self, blocks):
+        return sum(self.counts[block] for block in blocks)
+
+    def distinct(self):
+        return min(sum(self.distincts), len(self.vector))
+
+    def among(self, codes):
+        blocks = set()
+        for block, (low, high) in enumerate(zip(self.lows, self.highs)):
+            i = bisect_left(codes, low)
+            if i < len(codes) and codes[i] <= high:
+                blocks.add(block)
+        return blocks
+
+
+class Vector:
+    '''
+    Summary
+    -------
+    Represents the values of a single column as a typed array of codes, relying on
+    the value object of the column to encode and decode them.
+
+    Arguments
+    ---------
+    * value: the value object of the column, one of the instances specified in the values module
+
+    Constructor
+    -----------
+    >>> vector = Vector(values.IntVal())
+
+    Methods
+    -------
+    Vector.factory: factory the vector matching the value object, dictionary encoded
+                    when the value has no array typecode
+    >>> vector = Vector.factory(values.TxtVal())
+
+    append: encodes and appends the specified value
+    >>> vector.append(42)
+
+    extend: encodes and appends the specified values
+    >>> vector.extend([42, 8])
+
+    []: decodes the value at the specified position, or replaces it
+    >>> vector[0] = 43
+    >>> vector[0]
+    43
+
+    iter: iterates over the decoded values
+    >>> for val in vector:
+            ...
+
+    code: returns the code of the specified value, None if it is not encoded
+    >>> vector.code(43)
+    43
+
+    chunk: returns the codes within the specified range of positions
+    >>> vector.chunk(0, 4096)
+
+    gather: returns the codes at the specified positions
+    >>> vector.gather([0, 42, 4095])
+
+    decode: returns the list of the values of the specified codes
+    >>> vector.decode(vector.chunk(0, 4096))
+    '''
+
+    @classmethod
+    def factory(cls, value):
+        if value.TYPECODE:
+            return cls(value)
+        return DictVector(value)
+
+    def __init__(self, value):
+        self.value = value
+        self.data = array(value.TYPECODE)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return map(self._decode, self.data)
+
+    def __getitem__(self, pos):
+        return self._decode(self.data[pos])
+
+    def __setitem__(self, pos, val):
+        self.data[pos] = self._encode(val)
+
+    def __repr__(self):
+        name = self.__class__.__name__
+        return '%s(%s, size=%d)' % (name, self.value, len(self.data))
+
+    def append(self, val):
+        self.data.append(self._encode(val))
+
+    def extend(self, values):
+        self.data.extend(map(self._encode, values))
+
+    def code(self, val):
+        return self.value.encode(val)
+
+    def chunk(self, start, stop):
+        return self.data[start:stop]
+
+    def gather(self, positions):
+        return list(map(self.data.__getitem__, positions))
+
+    def decode(self, codes):
+        codes = codes.tolist() if hasattr(codes, 'tolist') else list(codes)
+        if type(self.value).decode is Val.decode:
+            return codes
+        return list(map(self.value.decode, codes))
+
+    def _encode(self, val):
+        return self.value.encode(val)
+
+    def _decode(self, code):
+        return self.value.decode(code)
+
+
+class DictVector(Vector):
+    '''
+    Summary
+    -------
+    Represents the values of a single text column as an array of integer codes,
+    each one pointing to the distinct word within the column dictionary.
+
+    Constructor
+    -----------
+    >>> vector = DictVector(values.TxtVal())
+
+    Methods
+    -------
+    ranks: returns the rank of each code by the order of its word, so that codes
+           can be sorted as their words
+    >>> vector.ranks()
+    [2, 0, 1]
+    '''
+
+    TYPECODE = 'q'
+
+    def __init__(self, value):
+        self.value = value
+        self.data = array(self.TYPECODE)
+        self.words = []
+        self.codes = {}
+
+    def _encode(self, val):
+        code = self.codes.get(val)
+        if code is None:
+            code = len(self.words)
+            self.codes[val] = code
+            self.words.append(val)
+        return code
+
+    def code(self, val):
+        return self.codes.get(val)
+
+    def decode(self, codes):
+        codes = codes.tolist() if hasattr(codes, 'tolist') else codes
+        return list(map(self.words.__getitem__, codes))
+
+    def ranks(self):
+        ranks = [0] * len(self.words)
+        for rank, code in enumerate(sorted(range(len(self.words)), key=self.words.__getitem__)):
+            ranks[code] = rank
+        return ranks
+
+    def _decode(self, code):
+        return self.words[code]
+
+
+class MappedWords:
+    '''
+    Summary
+    -------
+    Represents the read-only dictionary of a text column over the blocks of a memory
+    mapped file: the UTF-8 words concatenated, the offsets of each word (followed by
+    their total length) and the codes sorted by their words, so that opening the
+    dictionary costs nothing, words are decoded just when accessed and codes are
+    looked up by bisecting the sorted ones.
+
+    Arguments
+    ---------
+    * data: the bytes of the concatenated words
+    * offsets: the starting offset of each word, followed by their total length
+    * order: the codes sorted by their words
+
+    Constructor
+    -----------
+    >>> words = MappedWords(*MappedWords.build(['the hobbit', 'lotr']))
+
+    Methods
+    -------
+    MappedWords.build: computes the data, offsets and order blocks of a list of words
+    >>> data, offsets, order = MappedWords.build(vector.words)
+
+    []: decodes the word of the specified code
+    >>> words[1]
+    'lotr'
+
+    code: returns the code of the specified word, None if it is missing
+    >>> words.code('the hobbit')
+    0
+
+    ranks: returns the rank of each code by the order of its word
+    >>> words.ranks()
+    [1, 0]
+    '''
+
+    TYPECODE = 'q'
+
+    @classmethod
+    def build(cls, words):
+        encoded = [word.encode() for word in words]
+        offsets = array(cls.TYPECODE, [0])
+        for word in encoded:
+            offsets.append(offsets[-1] + len(word))
+        order = array(cls.TYPECODE, sorted(range(len(words)), key=words.__getitem__))
+        return b''.join(encoded), offsets, order
+
+    def __init__(self, data, offsets, order):
+        self.data = data
+        self.offsets = offsets
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def __getitem__(self, code):
+        return str(self.data[self.offsets[code]:self.offsets[code + 1]], 'utf-8')
+
+    def code(self, word):
+        if not isinstance(word, str):
+            return None
+        order = self.order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self[order[middle]] < word:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order) and self[order[low]] == word:
+            return order[low]
+        return None
+
+    def ranks(self):
+        ranks = [0] * len(self.order)
+        for rank, code in enumerate(self.order):
+            ranks[code] = rank
+        return ranks
+
+
+class MappedDictVector(DictVector):
+    '''
+    Summary
+    -------
+    Represents the values of a text column of a memory mapped file, looking up and
+    ranking the codes by its mapped dictionary.
+
+    Arguments
+    ---------
+    * value: the value object of the column
+    * words: the mapped dictionary of the column, a MappedWords
+
+    Constructor
+    -----------
+    >>> vector = MappedDictVector(values.TxtVal(), MappedWords(...))
+    '''
+
+    def __init__(self, value, words):
+        super().__init__(value)
+        self.words = words
+
+    def code(self, val):
+        return self.words.code(val)
+
+    def ranks(self):
+        return self.words.ranks()
+
+
+class Rows:
+    '''
+    Summary
+    -------
+    Represents the rows flowing between the query operators: plain tuples of values
+    along with the names of their columns, so that the names are resolved to positions
+    once per query instead of once per row.
+
+    Arguments
+    ---------
+    * column_names: the names of the columns of the rows, by position
+    * rows: an iterable over the tuples of values (consumed once when a generator)
+
+    Constructor
+    -----------
+    >>> rows = Rows(('PROJECT', 'SHOT'), [('the hobbit', '1'), ('lotr', '3')])
+
+    Methods
+    -------
+    Rows.projection: return a callable picking the values of the specified names from
+                     the rows of the available column names, as a tuple
+    >>> Rows.projection(('PROJECT', 'SHOT', 'VERSION'), ('VERSION', 'PROJECT'))(row)
+    (64, 'the hobbit')
+
+    iter: iterates over the values of rows
+    >>> for row in rows:
+            ...
+
+    scan: iterates over the values of rows, limited to the specified column names
+    >>> for row in rows.scan(('SHOT',)):
+            ...
+    '''
+
+    @staticmethod
+    def projection(available, names):
+        indexes = tuple(available.index(name) for name in names)
+        if len(indexes) == 1:
+            index, = indexes
+            return lambda row: (row[index],)
+        if not indexes:
+            return lambda row: ()
+        return itemgetter(*indexes)
+
+    def __init__(self, column_names, rows):
+        self.column_names = tuple(column_names)
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __repr__(self):
+        names = ', '.join(self.column_names)
+        return '%s(columns=(%s))' % (self.__class__.__name__, names)
+
+    def scan(self, names=None):
+        names = self._names(names)
+        if names == self.column_names:
+            return iter(self.rows)
+        return map(self.projection(self.column_names, names), self.rows)
+
+    def _names(self, names):
+        available = self.column_names
+        if names is None:
+            return available
+        return tuple(name for name in names if name in available)
+
 
 class Table:
     '''
@@ -40,7 +760,10 @@ class Table:
     Arguments
     ---------
     * columns: a list of columns objects
-    * rows: a dict with 
+    * rows: a dict mapping the combined keys to the position of the row, as tuples
+            of the typed values of the key columns (None when no column is a key)
+    * records: the list of the rows values, by position, as plain tuples
+    * indexes: a dict mapping the names of the indexed columns to their secondary index
 
     Constructor
     -----------
@@ -49,12 +772,21 @@ class Table:
     Methods
     -------
     Table.factory: factory a table object by raw data, sorting accordingly the columns
+                   and bulk loading the rows
     >>> table = Table.factory([['PROJECT', 'SHOT', ...], ['the hobbit', '1', ...],...], COLUMNS)
 
     append: appends the specified row data, replacing existing ones by combined keys
     >>> table.append(['the hobbit', '1', '64', ...])
 
-    merge: merges the specified list of rows data, relying on append
+    load: bulk loads the specified rows data by batches of the specified size: each
+          batch is validated column by column (an invalid batch is not loaded at all),
+          its rows are deduplicated by combined keys (the last one wins, at the position
+          of the first) and the new ones are appended at once; progress is logged by
+          batch rather than by row, return the number of loaded rows
+    >>> table.load([['the hobbit', '1', ...], ['king kong', '42'], ...], batch=10000)
+    2
+
+    merge: merges the specified list of rows data, relying on load
     >>> table.merge([['the hobbit', '1', ...], ['king kong', '42'], ...])
 
     +: modify left table by adding tranformed rows from another table object
@@ -64,8 +796,34 @@ class Table:
     iter: iterates over the values of rows
     >>> for row in table:
             ...
+
+    items: iterates over the combined keys and the values of rows
+    >>> for _id, row in table.items():
+            ...
+
+    getitem: returns the values of the row by its combined keys
+    >>> table[('the hobbit', '1', 64)]
+
+    locate: returns the positions of the rows by the specified combined keys, the
+            missing ones being skipped
+    >>> table.locate([('the hobbit', '1', 64), ('lotr', '9', 1)])
+    {('the hobbit', '1', 64): 0}
+
+    scan: iterates over the values of rows, limited to the specified column names,
+          optionally within the specified range of positions
+    >>> for row in table.scan(('PROJECT', 'SHOT')):
+            ...
+    >>> for row in table.scan(('PROJECT', 'SHOT'), 4096, 8192):
+            ...
+
+    take: iterates over the values of the rows at the specified positions,
+          optionally limited to the specified column names
+    >>> for row in table.take([3, 0, 1]):
+            ...
     '''
 
+    BATCH = 10000
+
     class DataError(ValueError):
         '''
         Indicates invalid data have been tried to be appended to the table
@@ -73,57 +831,153 @@ class Table:
 
     @classmethod
     def factory(cls, data, columns):
+        data = iter(data)
         table = cls(columns)
-        for i, row in enumerate(data): 
-            if i == 0:
-                table._sort(row)
-            else:
-                table.append(row)
+        headers = next(data, None)
+        if headers is not None:
+            table._sort(headers)
+            table.load(data)
         return table
 
     def __init__(self, columns):
         self.columns = columns
         self.rows = OrderedDict()
+        self.records = []
+        self.indexes = {col.name: HashIndex.factory(col.index) for col in columns if col.index}
+
+    def __setstate__(self, state):
+        if 'indexes' not in state:
+            logger.info('migrating legacy table state')
+            rows = state['rows']
+            state['records'] = list(rows.values())
+            state['rows'] = OrderedDict((_id, pos) for pos, _id in enumerate(rows))
+            state['indexes'] = {}
+        self.__dict__.update(state)
+        if any(isinstance(_id, str) for _id in islice(self.rows, 1)):
+            logger.info('migrating legacy digests of the combined keys')
+            self.rows = OrderedDict((self._id(self._row(pos)), pos) for pos in self.rows.values())
 
     def __len__(self):
         return len(self.rows)
 
     def __iter__(self):
-        for row in self.rows.values():
-            yield tuple(zip(self.column_names, row))
-    
+        return iter(self.records)
+
     def __contains__(self, _id):
         return _id in self.rows
 
     def __getitem__(self, _id):
-        return self.rows[_id]
+        return self._row(self.rows[_id])
 
     def __add__(self, other):
-        self.rows.update(other.rows)
+        for _id, row in other.items():
+            self._store(_id, row)
+
+    def locate(self, ids):
+        rows = self.rows
+        return {_id: rows[_id] for _id in ids if _id in rows}
 
     def __repr__(self):
         names = ', '.join(self.column_names)
-        return 'Table(columns=(%s), rows=%d)' % (names, len(self.rows))
+        return '%s(columns=(%s), rows=%d)' % (self.__class__.__name__, names, len(self))
 
     @property
     def column_names(self):
         return tuple(col.name for col in self.columns)
 
+    def items(self):
+        return zip(self.rows.keys(), self.records)
+
+    def scan(self, names=None, start=0, stop=None):
+        names = self._names(names)
+        records = self.records if start == 0 and stop is None else self.records[start:stop]
+        if names == self.column_names:
+            return iter(records)
+        return map(Rows.projection(self.column_names, names), records)
+
+    def take(self, positions, names=None):
+        rows = map(self.records.__getitem__, positions)
+        names = self._names(names)
+        if names == self.column_names:
+            return rows
+        return map(Rows.projection(self.column_names, names), rows)
+
     def merge(self, rows):
-        for row in rows:
-            self.append(row)
+        self.load(rows)
+
+    def load(self, rows, batch=BATCH):
+        rows = iter(rows)
+        key = self._key()
+        count = replaced = 0
+        start = perf_counter()
+        while True:
+            chunk = list(islice(rows, batch))
+            if not chunk:
+                break
+            records = self._cast(chunk, count)
+            latest = OrderedDict(zip(map(key, records), records))
+            replaced += len(chunk) - self._bulk(latest)
+            count += len(chunk)
+            logger.info('loaded %d rows', count)
+        logger.info('loaded %d rows in %.3f s, %d replaced by keys, %d stored', count, perf_counter() - start, replaced, len(self))
+        return count
 
     def append(self, row):
         self._check(row)
         logger.info('appending row: %r', row)
-        keys = []
-        data = []
-        for col, val in zip(self.columns, row):
-            val = col.value(val)
-            data.append(val)
-            self._keys(keys, col, val)
-        _id = self._id(keys)
-        self.rows[_id] = tuple(data)
+        data = tuple(col.value(val) for col, val in zip(self.columns, row))
+        self._store(self._id(data), data)
+
+    def _store(self, _id, row):
+        pos = self.rows.get(_id)
+        if pos is None:
+            pos = self.rows[_id] = len(self.rows)
+            self._insert(row)
+        else:
+            self._reindex(pos, self._row(pos), HashIndex.discard)
+            self._update(pos, row)
+        self._reindex(pos, row, HashIndex.add)
+
+    def _bulk(self, latest):
+        rows = self.rows
+        fresh = []
+        for _id, row in latest.items():
+            if _id in rows:
+                self._store(_id, row)
+            else:
+                fresh.append((_id, row))
+        if fresh:
+            start = len(rows)
+            records = [row for _, row in fresh]
+            self._extend(records)
+            rows.update((_id, pos) for pos, (_id, _) in enumerate(fresh, start))
+            self._index(start, records)
+        return len(fresh)
+
+    def _insert(self, row):
+        self.records.append(row)
+
+    def _extend(self, rows):
+        self.records.extend(rows)
+
+    def _update(self, pos, row):
+        self.records[pos] = row
+
+    def _row(self, pos):
+        return self.records[pos]
+
+    def _reindex(self, pos, row, fn):
+        if self.indexes:
+            for name, val in zip(self.column_names, row):
+                index = self.indexes.get(name)
+                if index is not None:
+                    fn(index, val, pos)
+
+    def _index(self, start, rows):
+        for i, name in enumerate(self.column_names):
+            index = self.indexes.get(name)
+            if index is not None:
+                index.extend(map(itemgetter(i), rows), start)
 
     def _check(self, row):
         if len(row) != len(self.columns):
@@ -131,15 +985,179 @@ class Table:
             logger.error('%s: %r', msg, self.column_names)
             raise self.DataError(msg)
 
-    def _keys(self, keys, column, val):
-        if column.key:
-            keys.append(str(val))
+    def _cast(self, rows, start=0):
+        width = len(self.columns)
+        for row in rows:
+            if len(row) != width:
+                self._check(row)
+        values = []
+        for col, column in zip(self.columns, zip(*rows)):
+            try:
+                values.append(col.value.batch(column, start))
+            except Val.BatchError as e:
+                msg = 'invalid values of column %s: %s' % (col.name, e)
+                logger.error(msg)
+                raise self.DataError(msg) from e
+        return list(zip(*values))
+
+    def _key(self):
+        names = [col.name for col in self.columns if col.key]
+        if not names:
+            return lambda row: None
+        return Rows.projection(self.column_names, names)
+
+    def _id(self, row):
+        return tuple(val for col, val in zip(self.columns, row) if col.key) or None
+
+    def _names(self, names):
+        available = self.column_names
+        if names is None:
+            return available
+        return tuple(name for name in names if name in available)
 
-    def _id(self, keys):
-        if keys:
-            return md5(''.join(keys).encode()).hexdigest()
-    
     def _sort(self, headers):
         logger.info('sorting according to headers: %r', headers)
         columns  = {column.name: column for column in self.columns}
         self.columns = [columns[name] for name in headers]
+
+
+class ColumnarTable(Table):
+    '''
+    Summary
+    -------
+    Represents the data table within the datastore by storing each column within
+    its own vector: rows map the combined keys to the position of the values
+    inside the vectors, so that scans decode just the columns they touch.
+
+    Constructor
+    -----------
+    >>> table = ColumnarTable([Column('PROJECT', values.TxtVal(), ...), ...])
+    '''
+
+    def __init__(self, columns):
+        super().__init__(columns)
+        del self.records
+        self.vectors = {col.name: Vector.factory(col.value) for col in columns}
+
+    def __iter__(self):
+        return self.scan()
+
+    def items(self):
+        return zip(self.rows.keys(), zip(*self._vectors()))
+
+    def scan(self, names=None, start=0, stop=None):
+        vectors = self._vectors(self._names(names))
+        if not vectors:
+            return repeat((), len(range(len(self))[start:stop]))
+        if start == 0 and stop is None:
+            return zip(*vectors)
+        return zip(*[vector.decode(vector.chunk(start, stop)) for vector in vectors])
+
+    def take(self, positions, names=None):
+        vectors = self._vectors(self._names(names))
+        for pos in positions:
+            yield tuple(vector[pos] for vector in vectors)
+
+    def _vectors(self, names=None):
+        if names is None:
+            names = self.column_names
+        return [self.vectors[name] for name in names]
+
+    def _insert(self, row):
+        for vector, val in zip(self._vectors(), row):
+            vector.append(val)
+
+    def _extend(self, rows):
+        for vector, values in zip(self._vectors(), zip(*rows)):
+            vector.extend(values)
+
+    def _update(self, pos, row):
+        for vector, val in zip(self._vectors(), row):
+            vector[pos] = val
+
+    def _row(self, pos):
+        return tuple(vector[pos] for vector in self._vectors())
+
+
+class MappedTable(ColumnarTable):
+    '''
+    Summary
+    -------
+    Represents a read-only columnar table whose vectors and indexes are views over
+    a memory mapped file: columns are decoded just when scanned, and the combined
+    keys are mapped to their positions only when first accessed, by zipping the
+    vectors of the key columns.
+    The zone maps of the columns (if any) let filters skip whole blocks of rows, and
+    lookups of a few keys skip the blocks which cannot hold their codes, instead of
+    mapping the keys of all of the rows.
+
+    Arguments
+    ---------
+    * columns: a list of columns objects
+    * vectors: a dict mapping the names of the columns to their vectors
+    * indexes: a dict mapping the names of the indexed columns to their mapped index
+    * zones: a dict mapping the names of the columns to their zone map
+
+    Constructor
+    -----------
+    >>> table = MappedTable(columns, vectors, indexes, zones)
+    '''
+
+    def __init__(self, columns, vectors, indexes, zones=None):
+        self.columns = columns
+        self.vectors = vectors
+        self.indexes = indexes
+        self.zones = zones or {}
+        self._rows = None
+
+    def __len__(self):
+        return len(self.vectors[self.columns[0].name])
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            logger.info('mapping keys of %d rows', len(self))
+            keys = [self.vectors[col.name] for col in self.columns if col.key]
+            ids = zip(*keys) if keys else repeat(None, len(self))
+            self._rows = OrderedDict(zip(ids, range(len(self))))
+        return self._rows
+
+    def locate(self, ids):
+        names = [col.name for col in self.columns if col.key]
+        if self._rows is not None or not names:
+            return super().locate(ids)
+        vectors = [self.vectors[name] for name in names]
+        ids = list(ids)
+        columns = []
+        for vector, values in zip(vectors, zip(*ids)):
+            encoded = {val: vector.code(val) for val in set(values)}
+            columns.append(map(encoded.__getitem__, values))
+        codes = {code: _id for code, _id in zip(zip(*columns), ids) if None not in code}
+        if not codes:
+            return {}
+        blocks = zones = None
+        for i, name in enumerate(names):
+            if name in self.zones:
+                zones = self.zones[name]
+                among = zones.among(sorted({code[i] for code in codes}))
+                blocks = among if blocks is None else blocks & among
+        spans = [(0, len(self))] if zones is None else zones.spans(blocks)
+        found = {}
+        for start, stop in spans:
+            chunks = zip(*[vector.chunk(start, stop) for vector in vectors])
+            for pos, code in enumerate(chunks, start):
+                _id = codes.get(code)
+                if _id is not None:
+                    found[_id] = pos
+        return found
+
+    def _store(self, _id, row):
+        self._read_only()
+
+    def _extend(self, rows):
+        self._read_only()
+
+    def _read_only(self):
+        msg = 'mapped tables are read-only'
+        logger.error(msg)
+        raise self.DataError(msg)
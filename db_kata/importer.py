@@ -1,7 +1,21 @@
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 import gzip
+from itertools import chain, islice
+import json
+from math import log
+from mmap import ACCESS_READ, mmap
+from os import cpu_count, listdir, makedirs, path, remove, replace, stat
 import pickle
-from os import path, stat
+import re
+from struct import Struct
+from sys import byteorder
+from threading import Lock, Thread
+from uuid import uuid4
+from db_kata.datastore import ColumnarTable, MappedDictVector, MappedIndex, MappedTable, MappedWords, Rows, Table, Vector, ZoneMap
 from db_kata.logger import BASE as logger
+from db_kata.views import Views
 
 
 class Parser:
@@ -24,9 +38,23 @@ class Parser:
     iter: return a generator with the file contents splitted by separator characters
     >>> for line in parser:
     >>>   ...
+
+    headers: return the first row of the file
+    >>> parser.headers()
+    ('PROJECT', 'SHOT', ...)
+
+    ranges: return a generator with the byte ranges of the dataset (headers excluded),
+            of about the specified size and split on line boundaries
+    >>> list(parser.ranges(1024))
+    [(68, 1097), (1097, 2130), ...]
+
+    read: return a generator with the rows within the specified byte range
+    >>> for line in parser.read(68, 1097):
+    >>>   ...
     '''
 
     SEPARATOR = '|'
+    ENCODING = 'utf-8'
 
     def __init__(self, filename):
         self.filename = path.abspath(filename)
@@ -36,6 +64,148 @@ class Parser:
             for line in f:
                 yield tuple(line.strip().split(self.SEPARATOR))
 
+    def headers(self):
+        with open(self.filename, 'r') as f:
+            return tuple(f.readline().strip().split(self.SEPARATOR))
+
+    def ranges(self, size):
+        total = stat(self.filename).st_size
+        with open(self.filename, 'rb') as f:
+            f.readline()
+            start = f.tell()
+            while start < total:
+                f.seek(start + size)
+                f.readline()
+                end = min(f.tell(), total)
+                yield (start, end)
+                start = end
+
+    def read(self, start, end):
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start).decode(self.ENCODING)
+        for line in data.splitlines():
+            yield tuple(line.strip().split(self.SEPARATOR))
+
+
+class Workers:
+    '''
+    Summary
+    -------
+    Parses and validates a pipe separated file in parallel: the dataset is split into
+    byte ranges on line boundaries, each one turned into a table by a worker process
+    according to the columns definitions. Tables are yielded by their order within the
+    file, so that merging them keeps the rows appearing later over the earlier ones
+    with the same keys.
+
+    Arguments
+    ---------
+    * workers: the number of worker processes, default to the number of CPUs
+    * size: the approximate size in bytes of each range
+
+    Constructor
+    -----------
+    >>> workers = Workers(8)
+
+    Methods
+    -------
+    tables: return a generator with the tables parsed from each range of the file,
+            keeping at most two ranges per worker in flight
+    >>> for table in workers.tables('./sample.txt', COLUMNS):
+    >>>   ...
+
+    load: return the table merging all of the parsed ranges of the file
+    >>> workers.load('./sample.txt', COLUMNS)
+    '''
+
+    SIZE = 8 * 1024 ** 2
+
+    def __init__(self, workers=None, size=SIZE):
+        self.workers = workers or cpu_count()
+        self.size = size
+
+    def tables(self, filename, columns):
+        parser = Parser(filename)
+        headers = parser.headers()
+        pending = deque()
+        with ProcessPoolExecutor(self.workers) as executor:
+            for start, end in parser.ranges(self.size):
+                logger.info('parsing bytes %d-%d of %s', start, end, filename)
+                pending.append(executor.submit(_parse, parser.filename, start, end, headers, columns))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def load(self, filename, columns):
+        table = Table.factory([Parser(filename).headers()], columns)
+        for chunk in self.tables(filename, columns):
+            table + chunk
+        return table
+
+
+def _parse(filename, start, end, headers, columns):
+    rows = Parser(filename).read(start, end)
+    return ColumnarTable.factory(chain([headers], rows), columns)
+
+
+class Generation:
+    '''
+    Summary
+    -------
+    Stamps the contents of a datastore, so that caches can tell whether their entries
+    are still valid: the stamp combines a token renewed by every write, stored within
+    a sidecar file, with the status of the datastore file (or directory), so that
+    changes made by other means (i.e. dumps and compactions) are noticed as well.
+
+    Arguments
+    ---------
+    * datastore: the path of the datastore file (or directory)
+
+    Constructor
+    -----------
+    >>> generation = Generation('./projects.kata')
+
+    Methods
+    -------
+    call: return the current stamp, None if the datastore does not exist
+    >>> generation()
+    '0f8fad5bd9cb469fa165707fa1e1cb1b:7341083-1508021345123456789-1024'
+
+    token: return the token of the sidecar file, renewed by every write
+    >>> generation.token()
+    '0f8fad5bd9cb469fa165707fa1e1cb1b'
+
+    renew: renew the token of the sidecar file
+    >>> generation.renew()
+    '''
+
+    EXT = '.generation'
+    TEMP = '.tmp'
+
+    def __init__(self, datastore):
+        self.datastore = datastore
+        self.filename = datastore + self.EXT
+
+    def __call__(self):
+        try:
+            info = stat(self.datastore)
+        except FileNotFoundError:
+            return None
+        return '%s:%d-%d-%d' % (self.token(), info.st_ino, info.st_mtime_ns, info.st_size)
+
+    def token(self):
+        if not path.isfile(self.filename):
+            return ''
+        with open(self.filename) as f:
+            return f.read().strip()
+
+    def renew(self):
+        temp = self.filename + self.TEMP
+        with open(temp, 'w') as f:
+            f.write(uuid4().hex)
+        replace(temp, self.filename)
+
 
 class Storage:
     '''
@@ -54,22 +224,51 @@ class Storage:
 
     Methods
     -------
+    Storage.factory: factory the storage matching the filename: segments are used
+                     when it is suffixed by '.segments', pickle when suffixed by
+                     '.pickle', the mapped binary format otherwise
+    >>> storage = Storage.factory('./projects.segments')
+
     write: write table data to the specified compressed file, if file exists, read data
-           before writing and replace file with merged data (mandatory to keep unique keys)
+           before writing and replace file with merged data (mandatory to keep unique keys),
+           renewing the generation and updating the registered views by the written
+           rows and the replaced ones
     >>> worker.write(Table(...))
 
+    dump: write table data to the specified compressed file, replacing existing data
+    >>> worker.dump(Table(...))
+
     read: read the compressed file and return a table object filled by data
     >>> worker.read()
+
+    generation: return the stamp of the current contents
+    >>> worker.generation()
     '''
 
     EXT = '.pickle'
 
+    @classmethod
+    def factory(cls, filename):
+        if filename.rstrip('/').endswith(Segments.EXT):
+            return Segments(filename)
+        if filename.endswith(Storage.EXT):
+            return Storage(filename)
+        return Mapped(filename)
+
     def __init__(self, filename):
         self.filename = self._filename(filename)
+        self.generation = Generation(self.filename)
+        self.views = Views(self.filename, self.generation, self.read)
 
     def write(self, table):
         logger.info('writing data to %s', self.filename)
-        table = self._table(table)
+        merged, replaced = self._table(table)
+        stamp = self.generation.token()
+        self.generation.renew()
+        self.dump(merged)
+        self.views.update(table, replaced, stamp)
+
+    def dump(self, table):
         with gzip.open(self.filename, 'wb') as f:
             pickle.dump(table, f)
 
@@ -87,9 +286,435 @@ class Storage:
         if self._exist():
             logger.info('appending to existing datastore %s', self.filename)
             existing = self.read()
+            replaced = _replaced(self.views, table, [existing])
             existing + table
-            table = existing
-        return table
+            return existing, replaced
+        return table, _replaced(self.views, table, [])
 
     def _exist(self):
         return path.isfile(self.filename) and stat(self.filename).st_size
+
+
+class Mapped(Storage):
+    '''
+    Summary
+    -------
+    Writes and reads data by a versioned binary format which is memory mapped on read,
+    so that queries decode just the columns they touch, without deserializing the
+    whole table first.
+
+    The file starts with a fixed prefix (magic, version, offset and length of the
+    footer), followed by blocks aligned to 8 bytes: the pickled columns, the codes
+    of each column, the keys, bounds and positions arrays
+    of each index and the lows, highs, counts and distincts arrays of the zone map of
+    each column, and the words, offsets and sorted codes of the dictionary of each
+    text column (version 3), so that opening a datastore does not decode them. The
+    JSON footer lists the offset and length of every block.
+    Files of version 2 are read anyway, their dictionaries being listed by the footer.
+    Files lacking zone maps (written before they were introduced) are read anyway,
+    their scans just skip no blocks.
+    Files of version 1 are read anyway too: the block of their combined keys digests
+    is ignored, since the keys are mapped by the vectors of the key columns.
+    Blocks are written by fixed width typecodes, the footer records the item size of
+    each column and the byte order, files written by a host not matching them are
+    rejected rather than misread.
+
+    A legacy '.pickle' datastore with the same name is read when the binary file is
+    missing, and it is migrated by the next write.
+
+    Constructor
+    -----------
+    >>> storage = Mapped('./projects')
+
+    Methods
+    -------
+    read: map the binary file and return a read-only table object over its blocks
+    >>> storage.read()
+    '''
+
+    EXT = '.kata'
+    MAGIC = b'DBKATA'
+    VERSION = 3
+    VERSIONS = (1, 2, 3)
+    PREFIX = Struct('<6sHQQ')
+    ALIGN = 8
+    TEMP = '.tmp'
+    ZONE = ZoneMap.SIZE
+
+    class FormatError(ValueError):
+        '''
+        Indicates the file is not a valid datastore for the supported format version
+        '''
+
+    def read(self):
+        legacy = self._legacy()
+        if not path.isfile(self.filename) and path.isfile(legacy):
+            logger.info('reading legacy datastore %s', legacy)
+            return Storage(legacy).read()
+        logger.info('mapping data from %s', self.filename)
+        with open(self.filename, 'rb') as f:
+            view = memoryview(mmap(f.fileno(), 0, access=ACCESS_READ))
+        footer = self._footer(view)
+        columns = pickle.loads(self._block(view, footer['columns']))
+        vectors = {}
+        indexes = {}
+        zones = {}
+        for col, meta in zip(columns, footer['vectors']):
+            vector = vectors[col.name] = self._vector(view, col, meta['words'])
+            self._itemsize(meta)
+            vector.data = self._block(view, meta['data']).cast(meta['typecode'])
+            if meta['index']:
+                index = meta['index']
+                arrays = (self._block(view, index['keys']).cast(meta['typecode']),
+                          self._block(view, index['bounds']).cast(MappedIndex.TYPECODE),
+                          self._block(view, index['positions']).cast(MappedIndex.TYPECODE))
+                indexes[col.name] = MappedIndex.factory(index['kind'], vector, *arrays)
+            if meta.get('zones'):
+                zone = meta['zones']
+                arrays = (self._block(view, zone['lows']).cast(meta['typecode']),
+                          self._block(view, zone['highs']).cast(meta['typecode']),
+                          self._block(view, zone['counts']).cast(ZoneMap.TYPECODE),
+                          self._block(view, zone['distincts']).cast(ZoneMap.TYPECODE))
+                zones[col.name] = ZoneMap(vector, zone['size'], *arrays)
+        return MappedTable(columns, vectors, indexes, zones)
+
+    def dump(self, table):
+        temp = self.filename + self.TEMP
+        with open(temp, 'wb') as f:
+            f.write(bytes(self.PREFIX.size))
+            footer = json.dumps(self._blocks(f, table)).encode()
+            offset = f.tell()
+            f.write(footer)
+            f.seek(0)
+            f.write(self.PREFIX.pack(self.MAGIC, self.VERSION, offset, len(footer)))
+        replace(temp, self.filename)
+
+    def _table(self, table):
+        if self._exist() or path.isfile(self._legacy()):
+            logger.info('appending to existing datastore %s', self.filename)
+            existing = self.read()
+            replaced = _replaced(self.views, table, [existing])
+            merged = ColumnarTable(table.columns)
+            merged + existing
+            merged + table
+            return merged, replaced
+        return table, _replaced(self.views, table, [])
+
+    def _blocks(self, f, table):
+        footer = {'byteorder': byteorder,
+                  'columns': self._write(f, pickle.dumps(table.columns)),
+                  'vectors': []}
+        for col, vector in zip(table.columns, self._vectors(table)):
+            meta = {'typecode': vector.data.typecode,
+                    'itemsize': vector.data.itemsize,
+                    'data': self._write(f, vector.data.tobytes()),
+                    'words': None,
+                    'index': None}
+            if hasattr(vector, 'words'):
+                data, offsets, order = MappedWords.build(list(vector.words))
+                meta['words'] = {'data': self._write(f, data),
+                                 'offsets': self._write(f, offsets.tobytes()),
+                                 'order': self._write(f, order.tobytes())}
+            if col.index:
+                keys, bounds, positions = MappedIndex.build(vector.data)
+                meta['index'] = {'kind': col.index,
+                                 'keys': self._write(f, keys.tobytes()),
+                                 'bounds': self._write(f, bounds.tobytes()),
+                                 'positions': self._write(f, positions.tobytes())}
+            lows, highs, counts, distincts = ZoneMap.build(vector.data, self.ZONE)
+            meta['zones'] = {'size': self.ZONE,
+                             'lows': self._write(f, lows.tobytes()),
+                             'highs': self._write(f, highs.tobytes()),
+                             'counts': self._write(f, counts.tobytes()),
+                             'distincts': self._write(f, distincts.tobytes())}
+            footer['vectors'].append(meta)
+        return footer
+
+    def _vectors(self, table):
+        if type(table) is ColumnarTable:
+            return [table.vectors[name] for name in table.column_names]
+        vectors = [Vector.factory(col.value) for col in table.columns]
+        for _, row in table.items():
+            for vector, val in zip(vectors, row):
+                vector.append(val)
+        return vectors
+
+    def _write(self, f, data):
+        f.write(bytes(-f.tell() % self.ALIGN))
+        offset = f.tell()
+        f.write(data)
+        return (offset, len(data))
+
+    def _footer(self, view):
+        magic, version, offset, length = self.PREFIX.unpack_from(view)
+        if magic != self.MAGIC or version not in self.VERSIONS:
+            self._error('%s is not a datastore of version %d' % (self.filename, self.VERSION))
+        footer = json.loads(bytes(view[offset:offset + length]).decode())
+        if footer['byteorder'] != byteorder:
+            self._error('%s has been written by a %s-endian host' % (self.filename, footer['byteorder']))
+        return footer
+
+    def _vector(self, view, col, words):
+        if isinstance(words, dict):
+            return MappedDictVector(col.value, MappedWords(self._block(view, words['data']),
+                                                           self._block(view, words['offsets']).cast(MappedWords.TYPECODE),
+                                                           self._block(view, words['order']).cast(MappedWords.TYPECODE)))
+        vector = Vector.factory(col.value)
+        if words is not None:
+            vector.words = words
+            vector.codes = {word: code for code, word in enumerate(words)}
+        return vector
+
+    def _itemsize(self, meta):
+        itemsize = array(meta['typecode']).itemsize
+        if meta.get('itemsize', itemsize) != itemsize:
+            self._error('%s has been written by a host of %d bytes %r items' % (self.filename, meta['itemsize'], meta['typecode']))
+
+    def _block(self, view, block):
+        offset, length = block
+        return view[offset:offset + length]
+
+    def _legacy(self):
+        return '%s%s' % (self.filename[:-len(self.EXT)], Storage.EXT)
+
+    def _error(self, msg):
+        logger.error(msg)
+        raise self.FormatError(msg)
+
+
+class Segments:
+    '''
+    Summary
+    -------
+    Stores data as an append-only sequence of immutable segments within a directory,
+    each segment being a table written by a Mapped storage (legacy pickle segments
+    are still read).
+    Reading merges the segments by their order, so that rows of newer segments
+    replace the ones with the same keys.
+
+    Writes compact the segments by tiers in a background thread: consecutive runs of
+    FANOUT segments of the same tier (their size by powers of FANOUT above TIER bytes)
+    are merged into one, so that each row is rewritten a logarithmic number of times
+    and memory is bounded by the run rather than by the whole datastore; segments
+    larger than LARGEST bytes are folded just by explicit compaction. The merged run
+    is staged apart and swapped in place of its newest segment, removing the older
+    ones, while writes are not looking up the segments; reads listing a removed
+    segment list the segments again.
+
+    Arguments
+    ---------
+    * dirname: the name of the directory that stores the segments, the '.segments'
+      extension is suffixed if missing
+
+    Constructor
+    -----------
+    >>> segments = Segments('./projects')
+
+    Methods
+    -------
+    write: write table data as a new segment, without reading the existing ones,
+           renewing the generation; when views are registered, the rows replaced by
+           the written ones are located within the segments, newest first (skipping
+           the blocks whose zone maps cannot hold their keys), to update the views
+    >>> segments.write(Table(...))
+
+    read: read and merge all of the segments, return a table object filled by data
+    >>> segments.read()
+
+    load: stream parsed rows (headers first) into new segments of the specified
+          batch size, so that memory is bounded by the batch rather than by the
+          whole datastore, return the number of loaded rows
+    >>> segments.load(Parser('./sample.txt'), COLUMNS, batch=50000)
+
+    extend: write the specified tables (i.e. the ranges parsed by workers) as new
+            segments of at most the specified batch size, splitting the larger
+            ones, return the number of written rows
+    >>> segments.extend(Workers(8).tables('./sample.txt', COLUMNS), batch=50000)
+
+    compact: fold the existing segments into the newest one, removing the older ones,
+             optionally within a background thread (returned)
+    >>> segments.compact()
+    '''
+
+    EXT = '.segments'
+    SEGMENT = '%08d'
+    PATTERN = re.compile(r'^\d{8}(%s|%s)$' % (re.escape(Storage.EXT), re.escape(Mapped.EXT)))
+    STAGE = '.compacting'
+    BATCH = 50000
+    THRESHOLD = 16
+    FANOUT = 4
+    TIER = 1 << 20
+    LARGEST = 1 << 28
+    RETRIES = 3
+
+    def __init__(self, dirname):
+        self.dirname = self._dirname(dirname)
+        self.generation = Generation(self.dirname)
+        self.views = Views(self.dirname, self.generation, self.read)
+        self.worker = None
+        self.lock = Lock()
+        self.compacting = Lock()
+
+    def __len__(self):
+        return len(self.segments)
+
+    @property
+    def segments(self):
+        if not path.isdir(self.dirname):
+            return []
+        names = sorted(name for name in listdir(self.dirname) if self.PATTERN.match(name))
+        return [path.join(self.dirname, name) for name in names]
+
+    def write(self, table):
+        makedirs(self.dirname, exist_ok=True)
+        stamp = self.generation.token()
+        with self.lock:
+            tables = (Storage.factory(filename).read() for filename in reversed(self.segments))
+            replaced = _replaced(self.views, table, tables)
+            self.generation.renew()
+            self._write(self._sequence(), table)
+        self.views.update(table, replaced, stamp)
+        with self.lock:
+            run = self._run(self._sizes(self.segments))
+        if run is not None:
+            self._background(self._tiers)
+
+    def read(self):
+        logger.info('reading segments from %s', self.dirname)
+        for attempt in range(self.RETRIES):
+            segments = self.segments
+            if not segments:
+                msg = 'no segments found within %s' % self.dirname
+                logger.error(msg)
+                raise FileNotFoundError(msg)
+            try:
+                return self._merge(segments)
+            except FileNotFoundError:
+                if attempt + 1 == self.RETRIES:
+                    raise
+                logger.warning('segments of %s compacted while reading, reading them again', self.dirname)
+
+    def compact(self, background=False):
+        if background:
+            return self._background(self.compact)
+        with self.compacting:
+            segments = self.segments
+            if len(segments) > 1:
+                self._fold(segments)
+
+    def _background(self, target):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = Thread(target=target, name='compaction')
+            self.worker.start()
+        return self.worker
+
+    def _tiers(self):
+        with self.compacting:
+            while True:
+                segments = self.segments
+                run = self._run(self._sizes(segments))
+                if run is None:
+                    return
+                self._fold(segments[run])
+
+    def _sizes(self, segments):
+        return [stat(filename).st_size for filename in segments]
+
+    def _run(self, sizes):
+        if len(sizes) < 2:
+            return None
+        tiers = [int(log(max(size, self.TIER) / self.TIER, self.FANOUT)) for size in sizes]
+        width = min(self.FANOUT, len(sizes))
+        starts = [start for start in range(len(sizes) - width + 1) if max(sizes[start:start + width]) <= self.LARGEST]
+        runs = [start for start in starts if len(set(tiers[start:start + width])) == 1]
+        if width == self.FANOUT and runs:
+            start = min(runs, key=tiers.__getitem__)
+        elif len(sizes) > self.THRESHOLD and starts:
+            start = min(starts, key=lambda start: sum(sizes[start:start + width]))
+        else:
+            return None
+        return slice(start, start + width)
+
+    def _fold(self, run):
+        logger.info('compacting %d segments within %s', len(run), self.dirname)
+        number = self._number(run[-1])
+        staged = self._write(number, self._merge(run), self.STAGE)
+        target = Mapped(path.join(self.dirname, self.SEGMENT % number)).filename
+        with self.lock:
+            replace(staged, target)
+            for filename in run:
+                if filename != target:
+                    remove(filename)
+
+    def load(self, data, columns, batch=BATCH):
+        data = iter(data)
+        headers = next(data, None)
+        count = 0
+        if headers is None:
+            return count
+        while True:
+            rows = list(islice(data, batch))
+            if not rows:
+                return count
+            logger.info('loading batch of %d rows', len(rows))
+            self.write(Table.factory(chain([headers], rows), columns))
+            count += len(rows)
+
+    def extend(self, tables, batch=BATCH):
+        count = 0
+        for table in tables:
+            items = table.items()
+            for start in range(0, len(table), batch):
+                chunk = table
+                if len(table) > batch:
+                    chunk = type(table)(table.columns)
+                    chunk._bulk(OrderedDict(islice(items, batch)))
+                logger.info('loading batch of %d rows', len(chunk))
+                self.write(chunk)
+                count += len(chunk)
+        return count
+
+    def _merge(self, segments):
+        tables = (Storage.factory(filename).read() for filename in segments)
+        if len(segments) == 1:
+            return next(tables)
+        table = None
+        for segment in tables:
+            if table is None:
+                table = ColumnarTable(segment.columns)
+            table._bulk(OrderedDict(segment.items()))
+        return table
+
+    def _write(self, sequence, table, stage=''):
+        storage = Mapped(path.join(self.dirname, self.SEGMENT % sequence + stage))
+        logger.info('writing segment %s', storage.filename)
+        storage.dump(table)
+        return storage.filename
+
+    def _sequence(self):
+        segments = self.segments
+        if segments:
+            return self._number(segments[-1]) + 1
+        return 1
+
+    def _number(self, filename):
+        return int(path.basename(filename)[:8])
+
+    def _dirname(self, dirname):
+        dirname = dirname.rstrip('/')
+        if not dirname.endswith(self.EXT):
+            dirname = '%s%s' % (dirname, self.EXT)
+        return path.abspath(dirname)
+
+
+def _replaced(views, table, tables):
+    rows = []
+    if views:
+        pending = set(table.rows)
+        for existing in tables:
+            if not pending:
+                break
+            found = existing.locate(pending)
+            rows.extend(existing.take(sorted(found.values()), table.column_names))
+            pending.difference_update(found)
+    return Rows(table.column_names, rows)
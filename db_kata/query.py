@@ -1,9 +1,24 @@
+from bisect import bisect_left
 from collections import OrderedDict
-import datetime # used by eval
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from functools import partial
+from hashlib import blake2b
+from heapq import merge, nlargest, nsmallest
+from itertools import count, islice
+from logging import DEBUG
+from math import log, sqrt
+from multiprocessing import get_all_start_methods, get_context
 from numbers import Number
-from operator import itemgetter
+from operator import eq, ge, gt, itemgetter, le, lt
+import pickle
+from random import Random
 import re
+from tempfile import TemporaryFile
+from db_kata.batch import Batch
+from db_kata.datastore import ColumnarTable, Rows, Table
 from db_kata.logger import BASE as logger
+from db_kata.values import TimeVal, TxtVal
 
 
 class Operator(object):
@@ -13,24 +28,53 @@ class Operator(object):
     An abstract class representing a general operator on data, to be implemented
     by concrete ones.
 
+    Operators accept either a table or the datastore.Rows yielded by another operator
+    and return datastore.Rows: the column names are resolved to positions once per
+    call, so that rows flow as plain tuples of values.
+
     Arguments
     ---------
     * query: the columns names, followed by a colon and the aggregate 
       name (if any), separated by comma
+
+    Methods
+    -------
+    canonical: return a hashable form of the operator, equal for the operators
+               yielding the same data (i.e. to key cached results)
+    >>> Selector('PROJECT,SHOT:count', 'PROJECT').canonical()
+    ('Selector', ('PROJECT', None), ('SHOT', 'count'), ('PROJECT',))
+
+    explain: return the description of the operator over the table, along with the
+             estimated number of rows it yields out of the specified input ones and
+             whether the estimate is exact (an upper bound otherwise)
+    >>> Selector('PROJECT,SHOT:count', 'PROJECT').explain(table, 4, True)
+    ('group PROJECT,SHOT:count by PROJECT', 3, False)
     '''
 
     SPLITTER = ','
     AGGREGATOR = ':'
+    AGGREGATES = {}
 
     class AggregateError(ValueError):
         '''
         Indicates an invalid aggregate has been specified
         '''
 
+    class ColumnError(ValueError):
+        '''
+        Indicates the query refers to columns missing from the data
+        '''
+
     def __init__(self, query):
         self.query = OrderedDict(self._query(query))
         self.names = tuple(self.query.keys())
-        self.aggregates = {name[4:] for name in dir(self) if name.startswith('_ag_')}
+        self.aggregates = set(self.AGGREGATES)
+
+    def canonical(self):
+        return (self.__class__.__name__,) + tuple(self.query.items())
+
+    def explain(self, table, rows, exact):
+        return self.__class__.__name__.lower(), rows, exact
 
     def _query(self, query):
         for name in str(query).split(self.SPLITTER):
@@ -39,27 +83,272 @@ class Operator(object):
             else:
                 yield(name.strip(), None)
 
+    def _available(self, data, names):
+        available = data.column_names
+        return tuple(name for name in names if name in available)
+
+    def _projected(self, data):
+        if self.project is None or not hasattr(data, 'vectors'):
+            return data.column_names
+        return self._available(data, self.project)
+
+    def _describe(self, names):
+        return ','.join(name if self.query.get(name) is None else '%s:%s' % (name, self.query[name]) for name in names)
+
+    def _check_columns(self, data, names):
+        missing = [name for name in names if name not in data.column_names]
+        if missing:
+            msg = '%s is not a valid column: %s' % (','.join(missing), ','.join(data.column_names))
+            logger.error(msg)
+            raise self.ColumnError(msg)
+
     def _check_aggregate(self):
         for aggregate in self.query.values():
             if aggregate and aggregate not in self.aggregates:
-                valid = ','.join(self.aggregates)
+                valid = ','.join(sorted(self.aggregates))
                 msg = '%s is not a valid aggregate: %s' % (aggregate, valid)
                 logger.error(msg)
                 raise self.AggregateError(msg)
 
 
+class Accumulator(object):
+    '''
+    Summary
+    -------
+    Reduces the values of a single column within a group, a new accumulator is
+    created by the first value of the group and updated by the following ones:
+    the base class just keeps the last value.
+
+    Methods
+    -------
+    add: updates the accumulator by the specified value
+    >>> acc = Accumulator(42)
+    >>> acc.add(43)
+
+    result: return the reduced value
+    >>> acc.result()
+    43
+
+    decode: replaces the reduced codes of a dictionary encoded column by their values
+    >>> acc.decode(vector.words.__getitem__)
+
+    merge: updates the accumulator by another one of the same kind, which reduced
+           the values met later (i.e. within the following partition of the table)
+    >>> acc.merge(Accumulator(44))
+
+    Accumulator.tally: return the reduced value of the values counted by a mapping
+                       of their multiplicities (i.e. a Counter), within a group
+    >>> Sum.tally(Counter({45.0: 2, 30.0: 1}))
+    120.0
+    '''
+
+    __slots__ = ('value',)
+
+    @classmethod
+    def tally(cls, counts):
+        values = iter(counts)
+        accumulator = cls(next(values))
+        for value in values:
+            accumulator.add(value)
+        return accumulator.result()
+
+    def __init__(self, value):
+        self.value = value
+
+    def add(self, value):
+        self.value = value
+
+    def merge(self, other):
+        self.add(other.value)
+
+    def result(self):
+        return self.value
+
+    def decode(self, decode):
+        self.value = decode(self.value)
+
+
+class Max(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value > self.value:
+            self.value = value
+
+
+class Min(Accumulator):
+    __slots__ = ()
+
+    def add(self, value):
+        if value < self.value:
+            self.value = value
+
+
+class Sum(Accumulator):
+    '''
+    Sums the numeric values only, ignoring the other ones (the plain int and float
+    values are checked first, sparing the abstract Number check)
+    '''
+
+    __slots__ = ()
+    NUMBERS = (int, float)
+
+    @classmethod
+    def tally(cls, counts):
+        accumulator = cls(0)
+        for value, count in counts.items():
+            if accumulator._numeric(value):
+                accumulator.add(value * count)
+        return accumulator.result()
+
+    def __init__(self, value):
+        self.value = value if self._numeric(value) else 0
+
+    def add(self, value):
+        if self._numeric(value):
+            self.value += value
+
+    def _numeric(self, value):
+        return isinstance(value, self.NUMBERS) or isinstance(value, Number)
+
+
+class Collect(Accumulator):
+    '''
+    Collects the distinct values, just the first cap + 1 met ones when capped: the
+    result lists the first cap of them by order, followed by an ellipsis when more
+    values have been met
+    '''
+
+    __slots__ = ('cap',)
+    ELLIPSIS = '...'
+
+    def __init__(self, value, cap=None):
+        self.value = {value}
+        self.cap = cap
+
+    def add(self, value):
+        if self.cap is None or len(self.value) <= self.cap:
+            self.value.add(value)
+
+    def merge(self, other):
+        if self.cap is None:
+            self.value |= other.value
+            return
+        for value in other.value:
+            self.add(value)
+
+    def result(self):
+        values = sorted(str(e) for e in self.value)
+        if self.cap is not None and len(values) > self.cap:
+            values = values[:self.cap] + [self.ELLIPSIS]
+        return '[%s]' % ','.join(values)
+
+    def decode(self, decode):
+        self.value = set(map(decode, self.value))
+
+
+class Count(Collect):
+    __slots__ = ()
+
+    def result(self):
+        return '(%d)' % len(self.value)
+
+    def decode(self, decode):
+        pass
+
+
+class ApproxCount(Accumulator):
+    '''
+    Counts the distinct values by a HyperLogLog sketch of 2^P registers, whose
+    standard error is 1.04 / sqrt(2^P) (1.6%): values are kept within a set until
+    they exceed the SPARSE ones, so that small groups are counted exactly and
+    the approximate counts are marked by a tilde. Values are hashed by BLAKE2b
+    (text ones by their UTF-8 bytes, the others by their repr), unlike the builtin
+    hash randomized by process, so that estimates are repeatable
+    '''
+
+    __slots__ = ()
+    P = 12
+    SPARSE = 256
+    BITS = 64
+    MASK = (1 << BITS) - 1
+
+    def __init__(self, value):
+        self.value = {value}
+
+    def add(self, value):
+        if type(self.value) is set:
+            self.value.add(value)
+            if len(self.value) > self.SPARSE:
+                registers = bytearray(1 << self.P)
+                for value in self.value:
+                    self._register(registers, value)
+                self.value = registers
+            return
+        self._register(self.value, value)
+
+    def merge(self, other):
+        if type(other.value) is set:
+            for value in other.value:
+                self.add(value)
+            return
+        if type(self.value) is set:
+            values, self.value = self.value, bytearray(other.value)
+            for value in values:
+                self._register(self.value, value)
+            return
+        self.value = bytearray(map(max, self.value, other.value))
+
+    def result(self):
+        if type(self.value) is set:
+            return '(%d)' % len(self.value)
+        return '(~%d)' % round(self._estimate(self.value))
+
+    def decode(self, decode):
+        pass
+
+    def _register(self, registers, value):
+        x = self._hash(value)
+        width = self.BITS - self.P
+        rank = width - (x & ((1 << width) - 1)).bit_length() + 1
+        index = x >> width
+        if rank > registers[index]:
+            registers[index] = rank
+
+    def _hash(self, value):
+        data = value.encode() if isinstance(value, str) else repr(value).encode()
+        return int.from_bytes(blake2b(data, digest_size=self.BITS // 8).digest(), 'little')
+
+    def _estimate(self, registers):
+        m = len(registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            return m * log(m / zeros)
+        return estimate
+
+
 class Selector(Operator):
     '''
     Summary
     -------
     Selects the specified data by column names.
 
-    Optionally groups by specified column name and the available aggregates:
+    Optionally groups by specified column names (separated by comma) and the
+    available aggregates:
     * min: select the minimum value from a column 
     * max: select the maximum value from a column 
     * sum: select the summation of all numeric values in a column 
     * count: count the distinct values in a column
-    * collect: collect the distinct values in a column
+    * count_approx: count the distinct values in a column by a HyperLogLog sketch,
+      approximate beyond a few hundreds values (~1.6% standard error)
+    * collect: collect the distinct values in a column, at most cap of them when
+      capped (if any)
+
+    Grouping streams the rows once, keeping just one accumulator for each column
+    of each group (the non aggregated columns keep the last value): groups are
+    yielded in the order they are first met. Selecting skips the columns missing
+    from the data, while grouping raises a ColumnError for them.
 
     Methods
     -------
@@ -70,113 +359,392 @@ class Selector(Operator):
     call: if group is specified, group data by available aggregates
     >>> selector = Selector('PROJECT,SHOT:count,VERSION:collect', 'PROJECT')
     >>> selector(Table(...))
+    >>> selector = Selector('STATUS,SHOT:count_approx,PROJECT:collect', 'STATUS', cap=10)
+    >>> selector(Table(...))
+    >>> selector = Selector('PROJECT,STATUS,SHOT:count', 'PROJECT,STATUS')
+    >>> selector(Table(...))
+
+    batches: return a generator with the values of the rows at the chunks of positions
+             of a columnar table, decoded column by column (grouped if specified)
+    >>> selector.batches(ColumnarTable(...), Batch().chunks(None, len(table)), Batch())
+
+    accumulate: return the groups of the rows at the chunks of positions of a columnar
+                table, mapping their keys to their accumulators, to be merged
+    >>> groups = selector.accumulate(ColumnarTable(...), Batch().spans([(0, 8192)]), Batch())
+
+    merge: return a generator with the grouped values of the accumulated groups of
+           consecutive partitions of the table, merged by their order
+    >>> selector.merge([groups, selector.accumulate(table, Batch().spans([(8192, 16384)]), Batch())])
+
+    Grouping by batches keeps the dictionary encoded columns as codes, when they are
+    group keys or reduced by count, count_approx, collect or no aggregate: words are
+    decoded just once per group.
     '''
 
-    def __init__(self, query, group=None):
+    AGGREGATES = {'max': Max, 'min': Min, 'sum': Sum, 'collect': Collect, 'count': Count, 'count_approx': ApproxCount}
+    PLAIN = Accumulator
+    ENCODED = {None, 'count', 'count_approx', 'collect'}
+
+    def __init__(self, query, group=None, cap=None):
         super().__init__(query)
-        self.group = group
+        self.group = tuple(name.strip() for name in group.split(self.SPLITTER)) if group else ()
+        self.cap = cap
     
+    def canonical(self):
+        canonical = super().canonical() + (self.group,)
+        if self.cap is not None:
+            canonical += (('cap', self.cap),)
+        return canonical
+
+    def explain(self, table, rows, exact):
+        if not self.group:
+            return 'select %s' % self._describe(self.names), rows, exact
+        label = 'group %s by %s' % (self._describe(self.names), ','.join(self.group))
+        groups = 1
+        for name in self.group:
+            distinct = self._distinct(table, name)
+            if distinct is None:
+                return label, rows, False
+            groups *= distinct
+        return label, min(rows, groups), False
+
     def __call__(self, data):
         if self.group:
             logger.info('grouping data by: %r', self.names)
-            yield from self._group_by(data)
-        else:
-            logger.info('selecting data by: %r', self.names)
-            yield from self._select(data)
+            return self._group_by(data)
+        logger.info('selecting data by: %r', self.names)
+        return self._select(data)
 
     def _select(self, data):
-        for row in data:
-            selected = OrderedDict()
-            for qname in self.names:
-                for name, value in row:
-                    if qname == name:
-                        selected[name] = value
-            yield(tuple(selected.items()))
+        names = self._available(data, self.names)
+        return Rows(names, data.scan(names))
+
+    def batches(self, table, chunks, batch):
+        if self.group:
+            yield from self._results(self.accumulate(table, chunks, batch))
+            return
+        vectors = [table.vectors[name] for name in self.names if name in table.vectors]
+        if not vectors:
+            yield from (() for chunk in chunks for _ in chunk)
+            return
+        yield from (row for chunk in chunks for row in zip(*[vector.decode(batch.column(vector, chunk)) for vector in vectors]))
+
+    def accumulate(self, table, chunks, batch):
+        names = self._grouped()
+        self._check_columns(table, names)
+        vectors = [table.vectors[name] for name in names]
+        decoders = tuple(self._decoder(name, vector) for name, vector in zip(names, vectors))
+        rows = (row for chunk in chunks for row in zip(*self._columns(vectors, decoders, chunk, batch)))
+        return self._accumulate(rows, decoders)
+
+    def merge(self, partials):
+        groups = OrderedDict()
+        for partial in partials:
+            for key, accumulators in partial.items():
+                merged = groups.get(key)
+                if merged is None:
+                    groups[key] = accumulators
+                    continue
+                for accumulator, other in zip(merged, accumulators):
+                    accumulator.merge(other)
+        logger.info('merged %d groups', len(groups))
+        return self._results(groups)
+
+    def _decoder(self, name, vector):
+        if hasattr(vector, 'words') and self.query.get(name) in self.ENCODED:
+            return vector.words.__getitem__
+
+    def _columns(self, vectors, decoders, chunk, batch):
+        columns = []
+        for vector, decoder in zip(vectors, decoders):
+            codes = batch.column(vector, chunk)
+            if decoder is None:
+                columns.append(vector.decode(codes))
+            else:
+                columns.append(codes.tolist() if hasattr(codes, 'tolist') else codes)
+        return columns
 
     def _group_by(self, data):
-        self._check_aggregate()
-        for group in self._groups(data).values():
-            yield(self._aggregate(group))
+        self._check_columns(data, self._grouped())
+        return Rows(self.names, self._reduce(data.scan(self._grouped())))
+
+    def _distinct(self, table, name):
+        index = table.indexes.get(name)
+        if index is not None:
+            return len(index)
+        vector = getattr(table, 'vectors', {}).get(name)
+        if hasattr(vector, 'words'):
+            return len(vector.words)
+        zones = getattr(table, 'zones', {}).get(name)
+        if zones is not None:
+            return zones.distinct()
+
+    def _grouped(self):
+        return self.names + tuple(name for name in self.group if name not in self.names)
 
-    def _groups(self, data):
+    def _factory(self, name):
+        aggregate = self.query[name]
+        factory = self.AGGREGATES.get(aggregate, self.PLAIN)
+        if aggregate == 'collect' and self.cap is not None:
+            return partial(factory, cap=self.cap)
+        return factory
+
+    def _reduce(self, rows, decoders=()):
+        yield from self._results(self._accumulate(rows, decoders))
+
+    def _results(self, groups):
+        return (tuple(acc.result() for acc in accumulators) for accumulators in groups.values())
+
+    def _accumulate(self, rows, decoders=()):
+        self._check_aggregate()
+        names = self._grouped()
+        key = Rows.projection(names, self.group)
+        factories = tuple(self._factory(name) for name in self.names)
         groups = OrderedDict()
-        for row in self._select(data):
-            for name, value in row:
-                if name == self.group:
-                    if value not in groups:
-                        groups[value] = []
-                    groups[value].append(row)
+        for values in rows:
+            accumulators = groups.get(key(values))
+            if accumulators is None:
+                groups[key(values)] = tuple(factory(value) for factory, value in zip(factories, values))
+                continue
+            for accumulator, value in zip(accumulators, values):
+                accumulator.add(value)
+        logger.info('reduced %d groups', len(groups))
+        for accumulators in groups.values():
+            for accumulator, decoder in zip(accumulators, decoders):
+                if decoder is not None:
+                    accumulator.decode(decoder)
         return groups
 
-    def _aggregate(self, group):
-        reduced = OrderedDict()
-        for row in group:
-            for name, value in row:
-                aggregate = self.query[name]
-                if aggregate:
-                    logger.debug('aggergating by %s', aggregate)
-                    fn = getattr(self, '_ag_%s' % aggregate)
-                    fn(name, OrderedDict(row), reduced)
-                else:
-                    reduced[name] = value
-        return self._transform(reduced)
-
-    def _transform(self, reduced):
-        for name, value in reduced.items():
-            if isinstance(value, set):
-                aggregate = self.query[name]
-                if aggregate == 'collect':
-                    items = ','.join(sorted(str(e) for e in value))
-                    reduced[name] = '[%s]' % items
-                elif aggregate == 'count':
-                    reduced[name] = '(%d)' % len(value)
-        return tuple(reduced.items())
-
-    def _ag_max(self, name, row, reduced):
-        if name not in reduced:
-            reduced[name] = row[name]
-        if reduced[name] < row[name]:
-            reduced[name] = row[name]
-
-    def _ag_min(self, name, row, reduced):
-        if name not in reduced:
-            reduced[name] = row[name]
-        if reduced[name] > row[name]:
-            reduced[name] = row[name]
-
-    def _ag_sum(self, name, row, reduced):
-        if isinstance(row[name], Number):
-            if name not in reduced:
-                reduced[name] = 0
-            reduced[name] += row[name]
-
-    def _ag_collect(self, name, row, reduced):
-        if name not in reduced:
-            reduced[name] = set()
-        reduced[name].add(row[name])
-    
-    def _ag_count(self, name, row, reduced):
-        self._ag_collect(name, row, reduced)
-
 
 class Sorter(Operator):
     '''
     Summary
     -------
-    Sort the specified data by columns name.
+    Sort the specified data by columns name, each one optionally followed by a
+    colon and the direction, asc (default) or desc.
+
+    Mixed directions over tables are sorted by precomputed keys, the rank of each
+    value among the column distinct ones (reversed for the descending columns), or
+    for columnar tables the codes of the vectors (text ones by their ranks, negated
+    for the descending columns), and over plain rows by stable sorting passes column
+    by column (or, within a budget, by keys wrapping the values of the descending
+    columns, so that the sorted runs are spilled as well).
+    Sorting by columns missing from the data raises a ColumnError.
+
+    Arguments
+    ---------
+    * query: the columns names and directions (if any), separated by comma
+    * limit: the number of leading rows needed (if any), which are selected by a
+      bounded heap instead of sorting the whole data
+    * budget: the maximum number of rows (or table positions) to sort in memory
+      (if any), beyond which sorted runs are spilled to temporary files and
+      lazily merged back
 
     Methods
     -------
     call: return a generator with data sorted by specified names
     >>> sorter = Sorter('PROJECT,SHOT,VERSION')
     >>> sorter(Table(...))
+
+    call: return a generator with data sorted by specified names and directions
+    >>> sorter = Sorter('FINISH_DATE:desc,INTERNAL_BID:asc')
+    >>> sorter(Table(...))
+
+    call: return a generator with the first rows sorted by specified names
+    >>> sorter = Sorter('CREATED_DATE:desc', limit=50)
+    >>> sorter(Table(...))
+
+    call: return a generator with data sorted by external merge sort
+    >>> sorter = Sorter('FINISH_DATE,INTERNAL_BID', budget=100000)
+    >>> sorter(Table(...))
+
+    batches: return a generator with the chunks of the sorted positions of a columnar
+             table (among the ones of the chunks, if any), sorting their codes (text
+             ones by their ranks, descending ones negated when mixed)
+    >>> sorter.batches(ColumnarTable(...), None, Batch())
+
+    merge: return a generator with the rows of the sorted runs of (keys, row) pairs,
+           merged by their keys (the values of the sorted columns), the rows of the
+           former runs leading the equal ones
+    >>> sorter.merge([[(('lotr',), row), ...], [(('the hobbit',), row), ...]])
     '''
 
+    DIRECTIONS = {'asc': False, 'desc': True}
+    BLOCK = 1024
+
+    class OrderError(ValueError):
+        '''
+        Indicates an invalid direction has been specified
+        '''
+
+    def __init__(self, query, limit=None, budget=None):
+        super().__init__(query)
+        self.reverse = tuple(self.DIRECTIONS.get(self.query[name], False) for name in self.names)
+        self.limit = limit
+        self.budget = None if budget is None else max(budget, 1)
+        self.project = None
+
+    def canonical(self):
+        self._check_direction()
+        return (self.__class__.__name__,) + tuple(zip(self.names, self.reverse))
+
+    def explain(self, table, rows, exact):
+        label = 'sort %s' % self._describe(self.names)
+        if self.limit is not None:
+            label += ' top %d' % self.limit
+            rows = min(rows, self.limit)
+        if self.budget is not None:
+            label += ' within %d rows' % self.budget
+        names = self._projected(table)
+        if names != table.column_names:
+            label += ', taking %s' % ','.join(names)
+        return label, rows, exact
+
     def __call__(self, data):
+        self._check_direction()
+        self._check_columns(data, self.names)
         logger.info('sorting data by: %r', self.names)
-        data = (OrderedDict(row) for row in data)
-        for row in sorted(data, key=itemgetter(*self.names)):
-            yield(tuple(row.items()))
+        names = self._projected(data) if hasattr(data, 'take') else data.column_names
+        return Rows(names, self._sorted(data, names))
+
+    def batches(self, table, chunks, batch):
+        self._check_direction()
+        self._check_columns(table, self.names)
+        logger.info('sorting data by batches: %r', self.names)
+        positions = range(len(table)) if chunks is None else [pos for chunk in chunks for pos in chunk]
+        if not positions:
+            return
+        mixed = self._mixed()
+        columns = []
+        for name, reverse in zip(self.names, self.reverse):
+            vector = table.vectors[name]
+            ranks = vector.ranks() if hasattr(vector, 'ranks') else None
+            columns.append(batch.keys(vector, positions, ranks, negate=mixed and reverse))
+        reverse = False if mixed else self.reverse[0]
+        order = batch.argsort(columns, reverse)
+        if order is None:
+            keys = list(zip(*columns))
+            order = self._sort(range(len(keys)), keys.__getitem__, reverse)
+        elif self.limit is not None:
+            order = order[:self.limit]
+        yield from batch.chunks(batch.positions(positions, order), len(table))
+
+    def merge(self, runs):
+        if self._mixed():
+            reverse = self.reverse
+            key = lambda item: tuple(Descending(value) if desc else value for value, desc in zip(item[0], reverse))
+            rows = merge(*runs, key=key)
+        else:
+            rows = merge(*runs, key=itemgetter(0), reverse=self.reverse[0])
+        return (row for _, row in islice(rows, self.limit))
+
+    def _sorted(self, data, names):
+        if hasattr(data, 'take'):
+            yield from data.take(self._positions(data), names)
+        elif self._mixed() and self.budget is None:
+            yield from self._passes(data)
+        elif self._mixed():
+            reverse = self.reverse
+            key = Rows.projection(data.column_names, self.names)
+            yield from self._sort(iter(data), lambda row: tuple(Descending(value) if desc else value for value, desc in zip(key(row), reverse)))
+        else:
+            key = Rows.projection(data.column_names, self.names)
+            yield from self._sort(iter(data), key, self.reverse[0])
+
+    def _mixed(self):
+        return len(set(self.reverse)) > 1
+
+    def _check_direction(self):
+        for direction in self.query.values():
+            if direction and direction not in self.DIRECTIONS:
+                msg = '%s is not a valid direction: %s' % (direction, ','.join(sorted(self.DIRECTIONS)))
+                logger.error(msg)
+                raise self.OrderError(msg)
+
+    def _positions(self, table):
+        if self._mixed():
+            keys = zip(*[self._keys(table, name, reverse) for name, reverse in zip(self.names, self.reverse)])
+            reverse = False
+        else:
+            keys = table.scan(self.names)
+            reverse = self.reverse[0]
+        if self.budget is not None and self.limit is None:
+            return (pos for _, pos in self._sort(zip(keys, count()), itemgetter(0), reverse))
+        keys = list(keys)
+        return self._sort(range(len(keys)), keys.__getitem__, reverse)
+
+    def _keys(self, table, name, reverse):
+        vector = getattr(table, 'vectors', {}).get(name)
+        if vector is None:
+            ranks = self._ranks(table, name, reverse)
+            return (ranks[value] for (value,) in table.scan((name,)))
+        codes = vector.data
+        if hasattr(vector, 'ranks'):
+            codes = map(vector.ranks().__getitem__, codes)
+        return (-code for code in codes) if reverse else codes
+
+    def _ranks(self, table, name, reverse):
+        values = sorted({value for (value,) in table.scan((name,))}, reverse=reverse)
+        return {value: rank for rank, value in enumerate(values)}
+
+    def _passes(self, data):
+        rows = list(data)
+        for name, reverse in reversed(tuple(zip(self.names, self.reverse))):
+            rows.sort(key=itemgetter(data.column_names.index(name)), reverse=reverse)
+        return rows if self.limit is None else rows[:self.limit]
+
+    def _sort(self, items, key, reverse=False):
+        if self.limit is not None:
+            logger.info('selecting top %d rows', self.limit)
+            select = nlargest if reverse else nsmallest
+            return select(self.limit, items, key=key)
+        if self.budget is None:
+            return sorted(items, key=key, reverse=reverse)
+        return self._external(iter(items), key, reverse)
+
+    def _external(self, items, key, reverse=False):
+        runs = []
+        while True:
+            run = sorted(islice(items, self.budget), key=key, reverse=reverse)
+            if not runs and len(run) < self.budget:
+                return run
+            if not run:
+                break
+            runs.append(self._spill(run))
+        logger.info('merging %d sorted runs of %d rows', len(runs), self.budget)
+        return merge(*(self._unspill(f) for f in runs), key=key, reverse=reverse)
+
+    def _spill(self, run):
+        f = TemporaryFile()
+        for start in range(0, len(run), self.BLOCK):
+            pickle.dump(run[start:start + self.BLOCK], f, pickle.HIGHEST_PROTOCOL)
+        f.seek(0)
+        return f
+
+    def _unspill(self, f):
+        with f:
+            while True:
+                try:
+                    yield from pickle.load(f)
+                except EOFError:
+                    return
+
+
+class Descending(object):
+    '''
+    Wraps a value to be compared in reverse order, within mixed direction keys.
+    '''
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
 
 
 class Filter(Operator):
@@ -191,59 +759,450 @@ class Filter(Operator):
     change this:
     >>> 'PROJECT="the hobbit" AND (SHOT=1 OR SHOT=40)'
 
+    Date, time and numeric columns also support range comparisons, BETWEEN
+    bounds are inclusive:
+    >>> 'FINISH_DATE>=2010-07-01 AND INTERNAL_BID<40'
+    >>> 'FINISH_DATE BETWEEN 2010-07-01 AND 2010-09-30'
+
+    Quoted values are single literals, operators and parentheses included:
+    >>> 'STATUS="rock AND roll" OR STATUS="done (x)"'
+
     Arguments
     ---------
     * query: the filtering query language
 
+    Comparisons over indexed columns are answered by looking up the table indexes
+    (range comparisons by bisecting sorted indexes), combining them by set
+    intersection (AND) and union (OR), the remaining ones
+    are evaluated against the looked up rows or, when no index applies, by
+    scanning the table.
+    Scans look up the zone maps of the table (if any) the same way, skipping the
+    blocks of rows which cannot satisfy the query, as the looked up rows still to
+    be evaluated do.
+
     Methods
     -------
     call: return a generator with the filtered data by specified query
     >>> fil = Filter('PROJECT="the hobbit" OR PROJECT="lotr"')
     >>> fil(Table(...))
+
+    batches: return a generator with the chunks of the positions of a columnar table
+             satisfying the query, comparing the codes of each chunk column by column
+             and narrowing the selection by each AND operand, optionally within the
+             specified (start, stop) span of positions
+    >>> fil.batches(ColumnarTable(...), Batch())
+    >>> fil.batches(ColumnarTable(...), Batch(), span=(8192, 16384))
     '''
 
-    REGEX = re.compile(r'(\bAND\b|\bOR\b|=|\(|\))')
+    REGEX = re.compile(r'("[^"]*"|\bAND\b|\bOR\b|\bBETWEEN\b|<=|>=|<|>|=|\(|\))')
+    QUOTE = '"'
     OPERANDS = {'OR', 'AND', '(', ')'}
     EQUAL = '='
+    BETWEEN = 'BETWEEN'
+    COMPARATORS = {'=': eq, '<': lt, '<=': le, '>': gt, '>=': ge}
+    RANGES = {'<': (False, False), '<=': (False, True), '>': (True, False), '>=': (True, True)}
+    AND = 'AND'
+    OR = 'OR'
+    OPEN = '('
+    CLOSE = ')'
+
+    class QueryError(ValueError):
+        '''
+        Indicates the filtering query cannot be parsed or refers to unknown columns
+        '''
 
     def __init__(self, query):
         self.tokens = list(self._tokenize(query))
+        self.tree = self._parse()
+        self.names = tuple(OrderedDict.fromkeys(self._names(self.tree)))
+        self.project = None
+
+    def canonical(self):
+        return (self.__class__.__name__, self._canonical(self.tree))
+
+    def explain(self, table, rows, exact):
+        label = 'filter %s' % self._text()
+        positions, lookup = self._candidates(table)
+        blocks = self._blocks(table) if positions is None else None
+        if positions is None and blocks is None:
+            label += ' by scan'
+            exact = False
+        elif positions is None:
+            zones = next(iter(table.zones.values()))
+            label += ' by scan of %d/%d blocks' % (len(blocks), len(zones))
+            rows, exact = min(rows, zones.rows(blocks)), False
+        else:
+            label += ' by indexes on %s' % ','.join(OrderedDict.fromkeys(self._indexed(self.tree, table)))
+            rows, exact = min(rows, len(positions)), exact and lookup
+            if not lookup:
+                label += ' then predicates'
+        names = self._projected(table)
+        if names != table.column_names:
+            label += ', taking %s' % ','.join(names)
+        return label, rows, exact
+
+    def batches(self, table, batch, span=None):
+        logger.info('filtering data by batches: %s', self._text())
+        select = self._vectorize(self.tree, table, batch)
+        positions, exact = self._candidates(table)
+        if positions is not None:
+            logger.info('looking up %d rows by indexes', len(positions))
+            positions = sorted(positions)
+            if span is not None:
+                positions = positions[bisect_left(positions, span[0]):bisect_left(positions, span[1])]
+            if exact:
+                yield from batch.chunks(positions, len(table))
+                return
+        spans = self._spans(table) if positions is None else None
+        if span is not None and positions is None:
+            spans = self._clip(spans or [(0, len(table))], span)
+        chunks = batch.chunks(positions, len(table)) if spans is None else batch.spans(spans)
+        for chunk in chunks:
+            columns = {name: batch.column(table.vectors[name], chunk) for name in self.names}
+            selected = batch.positions(chunk, select(columns, None))
+            if selected:
+                yield selected
 
     def __call__(self, table):
-        logger.info('filtering data by: %s', ' '.join(self.tokens))
-        translation = self._translate(table)
-        for row in table:
-            evaluation = translation
-            for name, value in row:
-                evaluation = evaluation.replace(name, repr(value))
-            logger.info('evaluating expression: %s', evaluation)
-            if(eval(evaluation)):
-                yield(row)
-    
-    def _translate(self, table):
-        translation = []
-        names = table.column_names
-        for token in self.tokens:
-            if token in names:
-                translation.append(token)
-                col = [col for col in table.columns if col.name == token][0]
-            elif token == self.EQUAL:
-                translation.append('==')
-            elif token in self.OPERANDS:
-                translation.append(token.lower())
-            else:
-                if col:
-                    translation.append(repr(col.value(token)))
-        return ' '.join(translation)
+        logger.info('filtering data by: %s', self._text())
+        names = self._projected(table)
+        return Rows(names, self._rows(table, names))
+
+    def _rows(self, table, names):
+        predicate = self._compile(self.tree, table)
+        positions, exact = self._candidates(table)
+        if positions is None:
+            positions = (pos for pos, row in self._scan(table) if predicate(row))
+        else:
+            logger.info('looking up %d rows by indexes', len(positions))
+            positions = sorted(positions)
+            if not exact:
+                rows = table.take(positions, self.names)
+                positions = [pos for pos, row in zip(positions, rows) if predicate(row)]
+        yield from table.take(positions, names)
+
+    def _parse(self):
+        tree, pos = self._expression(0)
+        if pos != len(self.tokens):
+            self._error('unexpected token %r' % self.tokens[pos])
+        return tree
+
+    def _expression(self, pos):
+        node, pos = self._term(pos)
+        while self._peek(pos) == self.OR:
+            right, pos = self._term(pos + 1)
+            node = (self.OR, node, right)
+        return node, pos
+
+    def _term(self, pos):
+        node, pos = self._factor(pos)
+        while self._peek(pos) == self.AND:
+            right, pos = self._factor(pos + 1)
+            node = (self.AND, node, right)
+        return node, pos
+
+    def _factor(self, pos):
+        token = self._peek(pos)
+        if token == self.OPEN:
+            node, pos = self._expression(pos + 1)
+            if self._peek(pos) != self.CLOSE:
+                self._error('missing closing parenthesis')
+            return node, pos + 1
+        op = self._peek(pos + 1)
+        if op == self.BETWEEN:
+            low, high = self._peek(pos + 2), self._peek(pos + 4)
+            if not self._literal(token) or not self._literal(low) or self._peek(pos + 3) != self.AND or not self._literal(high):
+                self._error('expected a NAME BETWEEN LOW AND HIGH comparison at token %d' % pos)
+            return (self.BETWEEN, self._unquote(token), self._unquote(low), self._unquote(high)), pos + 5
+        literal = self._peek(pos + 2)
+        if not self._literal(token) or op not in self.COMPARATORS or not self._literal(literal):
+            self._error('expected a NAME=VALUE comparison at token %d' % pos)
+        return (op, self._unquote(token), self._unquote(literal)), pos + 3
+
+    def _literal(self, token):
+        return token is not None and token not in self.OPERANDS and token not in self.COMPARATORS and token != self.BETWEEN
+
+    def _text(self):
+        return ' '.join(map(self._unquote, self.tokens))
+
+    def _unquote(self, token):
+        if len(token) > 1 and token[0] == token[-1] == self.QUOTE:
+            return token[1:-1]
+        return token.replace(self.QUOTE, '')
+
+    def _peek(self, pos):
+        if pos < len(self.tokens):
+            return self.tokens[pos]
+
+    def _canonical(self, node):
+        if node[0] not in (self.AND, self.OR):
+            return repr(node)
+        operands = sorted({self._canonical(operand) for operand in self._operands(node, node[0])})
+        return '%s(%s)' % (node[0], ','.join(operands))
+
+    def _operands(self, node, op):
+        if node[0] != op:
+            yield node
+            return
+        yield from self._operands(node[1], op)
+        yield from self._operands(node[2], op)
+
+    def _names(self, node):
+        if node[0] in (self.AND, self.OR):
+            yield from self._names(node[1])
+            yield from self._names(node[2])
+        else:
+            yield node[1]
+
+    def _compile(self, node, table):
+        op = node[0]
+        if op == self.BETWEEN:
+            return self._between(*node[1:], table=table)
+        if op in self.COMPARATORS:
+            return self._comparison(*node, table=table)
+        left = self._compile(node[1], table)
+        right = self._compile(node[2], table)
+        if op == self.AND:
+            return lambda row: left(row) and right(row)
+        return lambda row: left(row) or right(row)
+
+    def _comparison(self, op, name, literal, table):
+        index = self.names.index(name)
+        value = self._cast(name, literal, table, ordered=op != self.EQUAL)
+        if op == self.EQUAL:
+            return lambda row: row[index] == value
+        fn = self.COMPARATORS[op]
+        return lambda row: fn(row[index], value)
+
+    def _between(self, name, low, high, table):
+        index = self.names.index(name)
+        low = self._cast(name, low, table, ordered=True)
+        high = self._cast(name, high, table, ordered=True)
+        return lambda row: low <= row[index] <= high
+
+    def _vectorize(self, node, table, batch):
+        op = node[0]
+        if op in (self.AND, self.OR):
+            left = self._vectorize(node[1], table, batch)
+            right = self._vectorize(node[2], table, batch)
+            if op == self.AND:
+                return lambda columns, selection: right(columns, left(columns, selection))
+            return lambda columns, selection: batch.union(left(columns, selection), right(columns, selection))
+        name = node[1]
+        if op == self.BETWEEN:
+            low = self._code(name, node[2], table, ordered=True)
+            high = self._code(name, node[3], table, ordered=True)
+            return lambda columns, selection: batch.select(le, columns[name], high, batch.select(ge, columns[name], low, selection))
+        code = self._code(name, node[2], table, ordered=op != self.EQUAL)
+        fn = self.COMPARATORS[op]
+        return lambda columns, selection: batch.select(fn, columns[name], code, selection)
+
+    def _code(self, name, literal, table, ordered=False):
+        value = self._cast(name, literal, table, ordered)
+        return table.vectors[name].code(value)
+
+    def _candidates(self, table):
+        positions, exact = self._lookup(self.tree, table)
+        if positions is None or exact:
+            return positions, exact
+        blocks = self._blocks(table)
+        if blocks is not None:
+            size = next(iter(table.zones.values())).size
+            positions = {pos for pos in positions if pos // size in blocks}
+        return positions, exact
+
+    def _scan(self, table):
+        spans = self._spans(table)
+        if spans is None:
+            return enumerate(table.scan(self.names))
+        return ((pos, row) for start, stop in spans for pos, row in zip(range(start, stop), table.scan(self.names, start, stop)))
+
+    def _spans(self, table):
+        blocks = self._blocks(table)
+        if blocks is None:
+            return None
+        zones = next(iter(table.zones.values()))
+        logger.info('scanning %d of %d blocks by zone maps', len(blocks), len(zones))
+        return zones.spans(blocks)
+
+    def _clip(self, spans, span):
+        low, high = span
+        clipped = ((max(start, low), min(stop, high)) for start, stop in spans)
+        return [(start, stop) for start, stop in clipped if start < stop]
+
+    def _blocks(self, table):
+        zones = getattr(table, 'zones', None)
+        if not zones:
+            return None
+        blocks, _ = self._lookup(self.tree, table, zones)
+        return blocks
+
+    def _lookup(self, node, table, indexes=None):
+        op = node[0]
+        if indexes is None:
+            indexes = table.indexes
+        if op not in (self.AND, self.OR):
+            return self._search(node, table, indexes)
+        left, left_exact = self._lookup(node[1], table, indexes)
+        right, right_exact = self._lookup(node[2], table, indexes)
+        if left is None or right is None:
+            if op == self.AND:
+                return (right if left is None else left), False
+            return None, False
+        if op == self.AND:
+            return left & right, left_exact and right_exact
+        return left | right, left_exact and right_exact
+
+    def _indexed(self, node, table):
+        op = node[0]
+        if op not in (self.AND, self.OR):
+            return None if self._search(node, table, table.indexes)[0] is None else (node[1],)
+        left = self._indexed(node[1], table)
+        right = self._indexed(node[2], table)
+        if left is None or right is None:
+            return (right if left is None else left) if op == self.AND else None
+        return left + right
+
+    def _search(self, node, table, indexes):
+        op, name = node[:2]
+        index = indexes.get(name)
+        if op == self.EQUAL and index is not None:
+            return index.lookup(self._cast(name, node[2], table)), True
+        if not hasattr(index, 'range'):
+            return None, False
+        if op == self.BETWEEN:
+            low = self._cast(name, node[2], table, ordered=True)
+            high = self._cast(name, node[3], table, ordered=True)
+            return index.range(low, high), True
+        lower, inclusive = self.RANGES[op]
+        value = self._cast(name, node[2], table, ordered=True)
+        if lower:
+            return index.range(low=value, left=inclusive), True
+        return index.range(high=value, right=inclusive), True
+
+    def _cast(self, name, literal, table, ordered=False):
+        columns = [col for col in table.columns if col.name == name]
+        if not columns:
+            self._error('%s is not a valid column' % name)
+        value = columns[0].value
+        if ordered and isinstance(value, TxtVal):
+            self._error('%s does not support range comparisons' % name)
+        return value(literal)
+
+    def _error(self, msg):
+        msg = 'invalid filter %r: %s' % (self._text(), msg)
+        logger.error(msg)
+        raise self.QueryError(msg)
 
     def _tokenize(self, query):
         for token in self.REGEX.split(query):
             token = token.strip()
-            token = token.replace('"', '')
             if token:
                 yield(token)
 
 
+class Sampler(object):
+    '''
+    Summary
+    -------
+    Draws a simple random sample of the rows of a table (without replacement) as a
+    table of the same kind, columnar when the table is (mapped tables included), so
+    that the operators run over the sample as over the whole table, by indexes and
+    batches as well.
+
+    Arguments
+    ---------
+    * fraction: the fraction of the rows to sample, greater than 0 up to 1
+    * seed: the seed of the random generator (if any), so that samples are repeatable
+
+    Constructor
+    -----------
+    >>> sampler = Sampler(0.01, seed=42)
+
+    Methods
+    -------
+    call: return the table of the sampled rows, keeping track of the number of rows
+          of the table (population) and of the sample (size)
+    >>> sampler(Table(...))
+
+    canonical: return a hashable form of the fraction and the seed, None when the
+               sample is not repeatable (unseeded)
+    >>> sampler.canonical()
+    ('Sampler', 0.01, 42)
+
+    expect: keep track of the number of rows the table (population) would be
+            sampled by, without sampling it (i.e. for cached results)
+    >>> sampler.expect(len(table))
+
+    margin: return the margin of error (95% confidence) of any proportion of rows
+            estimated over the sample, in the worst case
+    >>> sampler.margin()
+    0.0098
+
+    estimate: return the number of rows of the whole table estimated by the number
+              of rows of the sample, along with its margin of error (95% confidence)
+    >>> sampler.estimate(4213)
+    (421300, 9629)
+    '''
+
+    Z = 1.96
+
+    class SampleError(ValueError):
+        '''
+        Indicates an invalid fraction of the rows has been specified
+        '''
+
+    def __init__(self, fraction, seed=None):
+        if not 0 < fraction <= 1:
+            msg = 'sample fraction must be greater than 0 up to 1: %s' % fraction
+            logger.error(msg)
+            raise self.SampleError(msg)
+        self.fraction = fraction
+        self.seed = seed
+        self.population = None
+        self.size = None
+
+    def __repr__(self):
+        return '%s(%g)' % (self.__class__.__name__, self.fraction)
+
+    def canonical(self):
+        if self.seed is None:
+            return None
+        return (self.__class__.__name__, self.fraction, self.seed)
+
+    def expect(self, population):
+        self.population, self.size = population, round(population * self.fraction)
+        return self.size
+
+    def explain(self, table, rows, exact):
+        size = round(rows * self.fraction)
+        return 'sample %g%% of rows' % (self.fraction * 100), size, exact
+
+    def __call__(self, table):
+        population = len(table)
+        size = self.expect(population)
+        logger.info('sampling %d of %d rows', size, population)
+        positions = sorted(Random(self.seed).sample(range(population), size))
+        sample = (ColumnarTable if hasattr(table, 'vectors') else Table)(table.columns)
+        sample._bulk(OrderedDict(zip(positions, table.take(positions))))
+        return sample
+
+    def margin(self):
+        return self._error(0.5)
+
+    def estimate(self, rows):
+        if not self.size:
+            return 0, self.population or 0
+        proportion = rows / self.size
+        return round(proportion * self.population), round(self._error(proportion) * self.population)
+
+    def _error(self, proportion):
+        if not self.size:
+            return 1.0
+        correction = (self.population - self.size) / max(self.population - 1, 1)
+        return self.Z * sqrt(proportion * (1 - proportion) / self.size * correction)
+
+
 class Bulk:
     '''
     Summary
@@ -255,28 +1214,279 @@ class Bulk:
     * _filter: the filtering operator, a callable accepting a single data argument
     * order: the sorter operator, a callable accepting a single data argument
     * select: the selector operator, a callable accepting a single data argument
+    * limit: the maximum number of rows to yield, all of them if None
+    * offset: the number of leading rows to skip
+    * batch: the number of rows processed at once over columnar tables, None to
+      process them one by one
+    * sampler: the sampler drawing the rows the operators run over (if any), instead
+      of the whole table
+    * workers: the number of processes scanning the partitions of columnar tables
+      processed by batches, None (or 1) to scan them within the calling process
+
+    When limited, the pipeline stops as soon as enough rows are yielded and the
+    sorter (unless followed by grouping) just selects the leading rows.
+
+    The operators are planned before running (by copies, the specified ones being
+    left untouched): the filter and the sorter take just
+    the columns needed by the following operators (from columnar tables, the rows of
+    the other ones being already materialized), and the sorter runs after
+    grouping when it orders by plain group columns (yielding the groups in the same
+    order, since groups are yielded as first met), so that it sorts the groups
+    instead of the whole rows.
+
+    Columnar tables are processed by batches when all of the operators support them
+    (the sorter does not within a budget): the filter and the sorter pass chunks of
+    selected positions instead of rows, comparing and sorting the encoded columns,
+    and the selector decodes just the selected values column by column.
+
+    With multiple workers, the positions of the table are split into consecutive
+    partitions (aligned to the batches, a few ones by worker to balance them) and
+    scanned by a pool of forked processes, sharing the table without copying it:
+    each one filters its partition and either accumulates its groups, or sorts its
+    leading rows along with their keys, or selects its leading rows, and the calling
+    process merges the groups, the sorted runs or the rows by partition order, so
+    that the rows are yielded as by a single process (float sums may differ in the
+    last digits, being summed by partition).
+    Queries grouping the rows sorted by other than the group columns, tables within
+    a single batch and platforms not forking processes are processed within the
+    calling process.
 
     Constructor
     -----------
     >>> bulk = Bulk(_filter=Filter(...), order=Sorter(...), select=Selector(...))
+    >>> bulk = Bulk(_filter=None, order=Sorter(...), select=None, limit=50, offset=100)
+    >>> bulk = Bulk(_filter=Filter(...), order=None, select=Selector(...), batch=8192, workers=4)
 
     Methods
     -------
+    Bulk.factory: factory the operators by their plain queries, as accepted by the CLI
+    >>> bulk = Bulk.factory(select='PROJECT,SHOT:count', group='PROJECT', order='PROJECT')
+
+    canonical: return a hashable form of the operators, limit and offset (and of the
+               sampler), None when the rows are not repeatable (unseeded samples)
+    >>> bulk.canonical()
+
+    plan: return the operators in the order they are applied
+    >>> bulk.plan()
+    (Filter(...), Selector(...), Sorter(...))
+
+    explain: return the lines describing the plan over the table, each step preceded
+             by the estimated number of rows it yields (= exact, <= upper bound)
+    >>> bulk.explain(Table(...))
+    [' = 4          scan Table(columns=(...), rows=4) row by row', ...]
+
+    Bulk.format: format the values of a yielded row as a line of text
+    >>> Bulk.format(('the hobbit', 45.0, datetime(2010, 4, 1, 13, 35)))
+    'the hobbit,45.00,2010-04-01 13:35'
+
     call: return a generator by apply the operators to the table data
     >>> bulk(Table(...))
     '''
 
     PLAIN = lambda _, x: x
+    SEPARATOR = ','
+    WIDTH = 10
+    PARTITIONS = 4
+
+    class RangeError(ValueError):
+        '''
+        Indicates a negative limit or offset has been specified
+        '''
+
+    @classmethod
+    def factory(cls, select=None, group=None, filter=None, order=None, limit=None, offset=0, budget=None, batch=Batch.SIZE, cap=None, sample=None, seed=None, workers=None):
+        for name, value in (('limit', limit), ('offset', offset)):
+            if value is not None and value < 0:
+                msg = '%s must not be negative: %s' % (name, value)
+                logger.error(msg)
+                raise cls.RangeError(msg)
+        _filter = Filter(filter) if filter else None
+        order = Sorter(order, budget=budget) if order else None
+        select = Selector(select, group=group, cap=cap) if select else None
+        sampler = Sampler(sample, seed) if sample else None
+        return cls(_filter, order, select, limit, offset, batch or None, sampler, workers)
+
+    @classmethod
+    def format(cls, row):
+        tokens = []
+        for value in row:
+            if hasattr(value, 'strptime'):
+                value = value.strftime(TimeVal.FORMAT)
+            elif isinstance(value, float):
+                value = '%.2f' % value
+            tokens.append(str(value))
+        return cls.SEPARATOR.join(tokens)
 
-    def __init__(self, _filter, order, select):
+    def __init__(self, _filter, order, select, limit=None, offset=0, batch=None, sampler=None, workers=None):
+        self.stop = None if limit is None else offset + limit
+        self.offset = offset
+        self.batch = batch
+        self.sampler = sampler
+        self.workers = workers
+        self.late = self._late(order, select)
+        if self.stop is not None and hasattr(order, 'limit') and (self.late or not getattr(select, 'group', None)):
+            order = copy(order)
+            order.limit = self.stop
+        self.parts = self._project(_filter, order, select)
         _filter = _filter or self.PLAIN
         order = order or self.PLAIN
         select = select or self.PLAIN
         self.operators = (_filter, order, select)
 
+    def canonical(self):
+        operators = tuple(op.canonical() if hasattr(op, 'canonical') else None for op in self.operators)
+        canonical = operators + (self.offset, self.stop)
+        if self.sampler is not None:
+            sampled = self.sampler.canonical()
+            if sampled is None:
+                return None
+            canonical += (sampled,)
+        return canonical
+
+    def plan(self):
+        _filter, order, select = self.parts
+        steps = (_filter, select, order) if self.late else (_filter, order, select)
+        return tuple(op for op in steps if op is not None)
+
+    def explain(self, table):
+        mode = 'by batches of %d' % self.batch if self._batched(table) else 'row by row'
+        if self._parallel(table):
+            mode += ' within %d workers' % self.workers
+        rows, exact = len(table), True
+        lines = [self._estimate('scan %r %s' % (table, mode), rows, exact)]
+        if self.sampler is not None:
+            label, rows, exact = self.sampler.explain(table, rows, exact)
+            lines.append(self._estimate(label, rows, exact))
+        for op in self.plan():
+            if hasattr(op, 'explain'):
+                label, rows, exact = op.explain(table, rows, exact)
+            else:
+                label, exact = repr(op), False
+            lines.append(self._estimate(label, rows, exact))
+        if self.stop is not None or self.offset:
+            stop = rows if self.stop is None else min(rows, self.stop)
+            label = 'skip %d, stop at %s' % (self.offset, 'end' if self.stop is None else self.stop)
+            lines.append(self._estimate(label, max(stop - self.offset, 0), exact))
+        return lines
+
     def __call__(self, data):
-        for op in self.operators:
+        if self.sampler is not None:
+            data = self.sampler(data)
+        if self._parallel(data):
+            yield from islice(self._scatter(data), self.offset, self.stop)
+            return
+        if self._batched(data):
+            yield from islice(self._batches(data), self.offset, self.stop)
+            return
+        for op in self.plan():
             data = op(data)
-        for row in data:
+        rows = islice(data, self.offset, self.stop)
+        if not logger.isEnabledFor(DEBUG):
+            yield from rows
+            return
+        for row in rows:
             logger.debug('yielding row: %r', row)
-            yield(tuple(value for _, value in row))
+            yield row
+
+    def _late(self, order, select):
+        group = getattr(select, 'group', None)
+        if not group or not hasattr(order, 'names'):
+            return False
+        return all(name in group and name in select.query and select.query[name] is None for name in order.names)
+
+    def _project(self, _filter, order, select):
+        if not isinstance(select, Selector):
+            return _filter, order, select
+        names = select._grouped() if select.group else select.names
+        if order is not None and not self.late:
+            if hasattr(order, 'project'):
+                order = copy(order)
+                order.project = names
+            names += tuple(name for name in getattr(order, 'names', ()) if name not in names)
+        if hasattr(_filter, 'project'):
+            _filter = copy(_filter)
+            _filter.project = names
+        return _filter, order, select
+
+    def _estimate(self, label, rows, exact):
+        return '%2s %-*d %s' % ('=' if exact else '<=', self.WIDTH, rows, label)
+
+    def _batched(self, data):
+        if not self.batch or not hasattr(data, 'vectors'):
+            return False
+        if any(op is not None and not hasattr(op, 'batches') for op in self.parts):
+            return False
+        return getattr(self.parts[1], 'budget', None) is None
+
+    def _batches(self, table):
+        _filter, order, select = self.parts
+        batch = Batch.factory(self.batch)
+        logger.info('processing data by %r', batch)
+        chunks = _filter.batches(table, batch) if _filter else None
+        if order and not self.late:
+            chunks = order.batches(table, chunks, batch)
+        if chunks is None:
+            chunks = batch.chunks(None, len(table))
+        select = select or Selector(self.SEPARATOR.join(table.column_names))
+        rows = select.batches(table, chunks, batch)
+        if self.late:
+            rows = order(Rows(select.names, rows))
+        yield from rows
+
+    def _parallel(self, data):
+        if not self.workers or self.workers < 2 or not self._batched(data) or len(data) <= self.batch:
+            return False
+        _filter, order, select = self.parts
+        if order and not self.late and getattr(select, 'group', None):
+            return False
+        return 'fork' in get_all_start_methods()
+
+    def _partitions(self, table):
+        size = -(-len(table) // (self.workers * self.PARTITIONS))
+        size = max(-(-size // self.batch) * self.batch, self.batch)
+        return [(start, min(start + size, len(table))) for start in range(0, len(table), size)]
+
+    def _scatter(self, table):
+        _filter, order, select = self.parts
+        partitions = self._partitions(table)
+        logger.info('scanning %d partitions within %d workers', len(partitions), self.workers)
+        context = get_context('fork')
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_initialize, initargs=(self, table)) as pool:
+            partials = pool.map(_scan_partition, partitions)
+            if getattr(select, 'group', None):
+                rows = select.merge(partials)
+                if self.late:
+                    rows = order(Rows(select.names, rows))
+            elif order:
+                rows = order.merge(partials)
+            else:
+                rows = (row for partial in partials for row in partial)
+            yield from rows
+
+    def _scan(self, table, span):
+        _filter, order, select = self.parts
+        batch = Batch.factory(self.batch)
+        chunks = _filter.batches(table, batch, span) if _filter else batch.spans([span])
+        if getattr(select, 'group', None):
+            return select.accumulate(table, chunks, batch)
+        names = select.names if select else table.column_names
+        if not order:
+            return list(islice(Selector(self.SEPARATOR.join(names)).batches(table, chunks, batch), self.stop))
+        chunks = order.batches(table, chunks, batch)
+        keys = names + tuple(name for name in order.names if name not in names)
+        rows = Selector(self.SEPARATOR.join(keys)).batches(table, chunks, batch)
+        key, row = Rows.projection(keys, order.names), Rows.projection(keys, names)
+        return [(key(values), row(values)) for values in islice(rows, self.stop)]
+
+
+_BULK = None
+
+
+def _initialize(bulk, table):
+    global _BULK
+    _BULK = (bulk, table)
+
+
+def _scan_partition(span):
+    bulk, table = _BULK
+    return bulk._scan(table, span)
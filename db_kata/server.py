@@ -0,0 +1,196 @@
+import asyncio
+from itertools import islice
+import json
+from os import path, remove
+from socket import AF_UNIX, SOCK_STREAM, socket
+from db_kata.cache import Cache
+from db_kata.importer import Storage
+from db_kata.logger import BASE as logger
+from db_kata.query import Bulk
+
+
+class Server(object):
+    '''
+    Summary
+    -------
+    Serves queries over a local Unix socket from a table loaded just once, which is
+    reloaded in background as soon as the datastore generation changes (i.e. on import):
+    queries keep being answered by the previous table meanwhile. Results are cached
+    by the generation of the loaded table.
+    Queries run within the threads of the default executor, a chunk of rows at a
+    time, so that grouping and sorting a large table do not hold up the other
+    clients; the loaded table is swapped along with its stamp at once.
+
+    Each request is a JSON object on a single line, whose keys are the arguments of
+    Bulk.factory but the workers (queries never fork processes out of the threads of
+    the server); the response lists each row as a JSON string on its own line, ended
+    by a JSON object reporting either the count of the rows or the error (any failure
+    of the query, even after some rows). Many requests can be sent over the same
+    connection.
+
+    Arguments
+    ---------
+    * datastore: the path of the datastore file (or .segments directory)
+    * address: the path of the Unix socket
+    * interval: the seconds between the checks of the datastore for changes
+    * cache: the cache of the results, a cache.Cache
+
+    Constructor
+    -----------
+    >>> server = Server('./stubs/projects', address='./db_kata.sock')
+
+    Methods
+    -------
+    call: load the table and serve the queries until interrupted
+    >>> server()
+
+    serve: the coroutine loading the table and serving the queries
+    >>> asyncio.run(server.serve())
+
+    load: (re)load the table from the datastore, increasing the generation
+    >>> server.load()
+    '''
+
+    ADDRESS = './db_kata.sock'
+    INTERVAL = 1.0
+    CHUNK = 1000
+    ENCODING = 'utf-8'
+    REJECTED = ('workers',)
+
+    class RequestError(ValueError):
+        '''
+        Indicates the request is malformed or the query cannot be answered
+        '''
+
+    def __init__(self, datastore, address=ADDRESS, interval=INTERVAL, cache=None):
+        self.storage = Storage.factory(datastore)
+        self.address = address
+        self.interval = interval
+        self.cache = cache or Cache()
+        self.snapshot = (None, None)
+        self.generation = 0
+
+    def __call__(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.load()
+        server = await asyncio.start_unix_server(self._handle, path=self.address)
+        logger.info('serving %s on %s', self.snapshot[0], self.address)
+        watcher = asyncio.ensure_future(self._watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+            if path.exists(self.address):
+                remove(self.address)
+
+    def load(self):
+        stamp = self.storage.generation()
+        table = self.storage.read()
+        self.snapshot = (table, stamp)
+        self.generation += 1
+        logger.info('loaded generation %d: %s', self.generation, table)
+
+    async def _watch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.storage.generation() == self.snapshot[1]:
+                continue
+            try:
+                await loop.run_in_executor(None, self.load)
+            except (OSError, EOFError, ValueError) as e:
+                logger.error('cannot reload the datastore, retrying: %s', e)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._respond(line, writer)
+        finally:
+            writer.close()
+
+    async def _respond(self, line, writer):
+        loop = asyncio.get_event_loop()
+        count = 0
+        try:
+            request = json.loads(line.decode(self.ENCODING))
+            table, stamp = self.snapshot
+            rows = self.cache.fetch(self._bulk(request), stamp, lambda: table)
+            while True:
+                chunk = await loop.run_in_executor(None, self._chunk, rows)
+                if not chunk:
+                    break
+                writer.write(b''.join(chunk))
+                count += len(chunk)
+                await writer.drain()
+            status = {'count': count}
+        except (TypeError, ValueError) as e:
+            logger.error('invalid request %r: %s', line, e)
+            status = {'error': str(e)}
+        except Exception as e:
+            logger.exception('cannot answer request %r', line)
+            status = {'error': '%s: %s' % (type(e).__name__, e)}
+        writer.write(self._encode(status))
+        await writer.drain()
+
+    def _bulk(self, request):
+        rejected = [name for name in self.REJECTED if name in request]
+        if rejected:
+            raise self.RequestError('%s cannot be requested from the server' % ','.join(rejected))
+        return Bulk.factory(**request)
+
+    def _chunk(self, rows):
+        return [self._encode(Bulk.format(row)) for row in islice(rows, self.CHUNK)]
+
+    def _encode(self, obj):
+        return ('%s\n' % json.dumps(obj)).encode(self.ENCODING)
+
+
+class Client(object):
+    '''
+    Summary
+    -------
+    Sends the queries to the Server by its Unix socket.
+
+    Arguments
+    ---------
+    * address: the path of the Unix socket
+
+    Constructor
+    -----------
+    >>> client = Client('./db_kata.sock')
+
+    Methods
+    -------
+    call: return a generator with the lines of the rows answering the query, the
+          keyword arguments are the ones of Bulk.factory; raises a RequestError when
+          the server reports an error or the response ends without its status
+    >>> client(select='PROJECT,SHOT', filter='PROJECT="lotr"', limit=10)
+    '''
+
+    def __init__(self, address=Server.ADDRESS):
+        self.address = address
+
+    def __call__(self, **request):
+        with socket(AF_UNIX, SOCK_STREAM) as sock:
+            sock.connect(self.address)
+            with sock.makefile('rwb') as f:
+                f.write(('%s\n' % json.dumps(request)).encode(Server.ENCODING))
+                f.flush()
+                for line in f:
+                    response = json.loads(line.decode(Server.ENCODING))
+                    if not isinstance(response, dict):
+                        yield response
+                    elif 'error' in response:
+                        logger.error(response['error'])
+                        raise Server.RequestError(response['error'])
+                    else:
+                        return
+        msg = 'the response of %s ended without its status' % self.address
+        logger.error(msg)
+        raise Server.RequestError(msg)
@@ -0,0 +1,59 @@
+from itertools import product
+from operator import eq, ge
+import unittest
+from unittest.mock import patch
+from db_kata.batch import Batch, NumpyBatch, numpy
+from db_kata.query import Bulk
+from stubs.constants import COLUMNAR
+
+FILTERS = (None, 'PROJECT="the hobbit"', 'PROJECT="lotr" OR VERSION>=64', 'FINISH_DATE BETWEEN 2006-01-01 AND 2010-05-15 AND INTERNAL_BID<30', 'STATUS="nope"')
+ORDERS = (None, 'FINISH_DATE,INTERNAL_BID', 'FINISH_DATE:desc,INTERNAL_BID:asc', 'PROJECT:desc')
+SELECTS = ((None, None), ('PROJECT,SHOT,FINISH_DATE', None), ('PROJECT,VERSION:max,INTERNAL_BID:sum,SHOT:collect,STATUS:count', 'PROJECT'), ('STATUS,PROJECT:collect,SHOT', 'STATUS'))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.batch = Batch(size=2)
+
+    def test_chunks(self):
+        self.assertEqual(list(self.batch.chunks(None, 5)), [range(0, 2), range(2, 4), range(4, 5)])
+        self.assertEqual(list(self.batch.chunks([1, 3, 4], 5)), [[1, 3], [4]])
+        self.assertEqual(list(self.batch.spans([(0, 3), (5, 6)])), [range(0, 2), range(2, 3), range(5, 6)])
+
+    def test_column(self):
+        vector = COLUMNAR.vectors['VERSION']
+        self.assertEqual(list(self.batch.column(vector, range(1, 3))), [16, 128])
+        self.assertEqual(self.batch.column(vector, [3, 0]), [32, 64])
+
+    def test_select(self):
+        column = [64, 16, 128, 32]
+        self.assertEqual(self.batch.select(ge, column, 32), [0, 2, 3])
+        self.assertEqual(self.batch.select(ge, column, 64, [1, 2, 3]), [2])
+        self.assertEqual(self.batch.select(eq, column, None), [])
+
+    def test_positions(self):
+        self.assertEqual(self.batch.positions(range(4, 8), [0, 2]), [4, 6])
+        self.assertEqual(self.batch.positions([3, 5, 7], None), [3, 5, 7])
+
+    def test_keys(self):
+        vector = COLUMNAR.vectors['PROJECT']
+        keys = self.batch.keys(vector, range(0, 4), vector.ranks(), negate=True)
+        self.assertEqual(keys, [-2, -1, 0, -2])
+
+    def test_bulk(self):
+        self._assert_bulk(Batch)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_bulk_numpy(self):
+        self._assert_bulk(NumpyBatch)
+
+    def _assert_bulk(self, cls):
+        with patch.object(Batch, 'factory', cls):
+            for _filter, order, (select, group), size in product(FILTERS, ORDERS, SELECTS, (1, 3)):
+                kwargs = dict(filter=_filter, order=order, select=select, group=group, limit=3, offset=1)
+                expected = list(Bulk.factory(batch=0, **kwargs)(COLUMNAR))
+                self.assertEqual(list(Bulk.factory(batch=size, **kwargs)(COLUMNAR)), expected, kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
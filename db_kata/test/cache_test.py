@@ -0,0 +1,93 @@
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from db_kata.cache import Cache, DiskCache
+from db_kata.importer import Mapped
+from db_kata.query import Bulk, Sorter
+from stubs.constants import TABLE
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.bulk = Bulk.factory(select='PROJECT,SHOT:count', group='PROJECT')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_fetch(self):
+        cache = Cache()
+        rows = list(cache.fetch(self.bulk, 'gen', lambda: TABLE))
+        self.assertEqual(rows, list(self.bulk(TABLE)))
+        self.assertEqual(list(cache.fetch(self.bulk, 'gen', self._untouched)), rows)
+
+    def test_fetch_canonical(self):
+        cache = Cache()
+        list(cache.fetch(self.bulk, 'gen', lambda: TABLE))
+        bulk = Bulk.factory(select=' PROJECT, SHOT:count', group='PROJECT')
+        self.assertEqual(len(list(cache.fetch(bulk, 'gen', self._untouched))), 3)
+
+    def test_fetch_generation(self):
+        cache = Cache()
+        list(cache.fetch(self.bulk, 'gen', lambda: TABLE))
+        list(cache.fetch(self.bulk, 'next', lambda: TABLE))
+        self.assertEqual(len(cache), 2)
+        list(cache.fetch(self.bulk, None, lambda: TABLE))
+        self.assertEqual(len(cache), 2)
+
+    def test_fetch_invalid_order(self):
+        cache = Cache()
+        list(cache.fetch(Bulk.factory(order='PROJECT'), 'gen', lambda: TABLE))
+        with self.assertRaises(Sorter.OrderError):
+            list(cache.fetch(Bulk.factory(order='PROJECT:bogus'), 'gen', self._untouched))
+
+    def test_fetch_unseeded(self):
+        cache = Cache()
+        bulk = Bulk.factory(sample=0.5)
+        self.assertEqual(len(list(cache.fetch(bulk, 'gen', lambda: TABLE))), 2)
+        self.assertEqual(len(cache), 0)
+        bulk = Bulk.factory(sample=0.5, seed=42)
+        rows = list(cache.fetch(bulk, 'gen', lambda: TABLE))
+        self.assertEqual(list(cache.fetch(bulk, 'gen', self._untouched)), rows)
+
+    def test_eviction(self):
+        cache = Cache(size=3)
+        list(cache.fetch(self.bulk, 'first', lambda: TABLE))
+        list(cache.fetch(self.bulk, 'second', lambda: TABLE))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.rows, 3)
+        list(cache.fetch(Bulk.factory(), 'first', lambda: TABLE))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(list(cache.fetch(self.bulk, 'second', self._untouched)), list(self.bulk(TABLE)))
+
+    def test_storage(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        cache = Cache()
+        rows = list(cache(self.bulk, mapped))
+        mapped.read = self._untouched
+        self.assertEqual(list(cache(self.bulk, mapped)), rows)
+        mapped.generation.renew()
+        with self.assertRaises(AssertionError):
+            list(cache(self.bulk, mapped))
+
+    def test_disk_cache(self):
+        dirname = path.join(self.tempdir.name, 'cache')
+        rows = list(DiskCache(dirname).fetch(self.bulk, 'gen', lambda: TABLE))
+        cache = DiskCache(dirname)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(list(cache.fetch(self.bulk, 'gen', self._untouched)), rows)
+
+    def test_disk_cache_eviction(self):
+        cache = DiskCache(path.join(self.tempdir.name, 'cache'), size=4)
+        list(cache.fetch(self.bulk, 'first', lambda: TABLE))
+        list(cache.fetch(self.bulk, 'second', lambda: TABLE))
+        self.assertEqual(len(cache), 1)
+        list(cache.fetch(self.bulk, 'second', self._untouched))
+
+    def _untouched(self):
+        raise AssertionError('the table should not be read')
+
+
+if __name__ == '__main__':
+    unittest.main()
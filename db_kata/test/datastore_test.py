@@ -1,20 +1,26 @@
 from datetime import date, datetime
 import unittest
-from db_kata.datastore import Table
-from stubs.constants import COLUMNS, ROWS, SHUFFLE, TABLE
+from collections import OrderedDict
+from db_kata.datastore import Column, ColumnarTable, HashIndex, MappedWords, Rows, Table, Vector, ZoneMap
+from db_kata.values import IntVal, TxtVal
+from stubs.constants import COLUMNAR, COLUMNS, ROWS, SHUFFLE, TABLE
 
 
 class TestDatastore(unittest.TestCase):
     def test_column_repr(self):
         self.assertEqual(str(COLUMNS[0]), 'Column(PROJECT, TxtVal(1-64), key=True)')
 
+    def test_column_index_error(self):
+        with self.assertRaises(ValueError):
+            Column('PROJECT', TxtVal(), index='btree')
+
     def test_columns_sorting(self):
         table = Table.factory(SHUFFLE, COLUMNS)
         headers = tuple(c.name for c in table.columns)
         self.assertEqual(headers, SHUFFLE[0])
 
     def test_table_factory(self):
-        _id = '70d72c0c1a323dd355d22961ea77857e'
+        _id = ('king kong', '42', 128)
         table = Table.factory(ROWS, COLUMNS)
         self.assertEqual(len(table), 4)
         self.assertIn(_id, table)
@@ -30,12 +36,11 @@ class TestDatastore(unittest.TestCase):
 
     def test_table_iteration(self):
         data = list(TABLE)[0]
-        name, value = data[-1]
-        self.assertEqual(name, 'CREATED_DATE')
-        self.assertEqual(value, datetime(2010, 4, 1, 13, 35))
+        self.assertEqual(TABLE.column_names[-1], 'CREATED_DATE')
+        self.assertEqual(data[-1], datetime(2010, 4, 1, 13, 35))
 
     def test_append_row(self):
-        _id = '7889a3193abeffbc23ee75d431226a8a'
+        _id = ('the hobbit', '1', 64)
         table = Table(COLUMNS)
         table.append(ROWS[1])
         self.assertEqual(len(table), 1)
@@ -43,7 +48,7 @@ class TestDatastore(unittest.TestCase):
         self.assertEqual(table[_id], ('the hobbit', '1', 64, 'scheduled', date(2010, 5, 15), 45.00, datetime(2010, 4, 1, 13, 35)))
 
     def test_merge_rows(self):
-        _id = '70d72c0c1a323dd355d22961ea77857e'
+        _id = ('king kong', '42', 128)
         TABLE.merge(ROWS[1:])
         self.assertEqual(len(TABLE), 4)
         self.assertIn(_id, TABLE)
@@ -53,6 +58,29 @@ class TestDatastore(unittest.TestCase):
         with self.assertRaises(Table.DataError):
             TABLE.append([1,2,3])
 
+    def test_load_rows(self):
+        for cls in (Table, ColumnarTable):
+            table = cls(COLUMNS)
+            expected = cls(COLUMNS)
+            for row in ROWS[1:] + ROWS[2:3]:
+                expected.append(row)
+            self.assertEqual(table.load(ROWS[1:] + ROWS[2:3], batch=2), 6)
+            self.assertEqual(table.rows, expected.rows)
+            self.assertEqual(list(table), list(expected))
+            for name, index in expected.indexes.items():
+                self.assertEqual(table.indexes[name].positions, index.positions)
+
+    def test_load_rows_error(self):
+        table = Table(COLUMNS)
+        invalid = list(ROWS[2])
+        invalid[2] = 'nope'
+        with self.assertRaises(Table.DataError):
+            table.load([ROWS[1], invalid], batch=1)
+        self.assertEqual(len(table), 1)
+        with self.assertRaises(Table.DataError):
+            table.load([ROWS[3], ROWS[4][:3]])
+        self.assertEqual(len(table), 1)
+
     def test_tables_addition(self):
         table = Table(COLUMNS)
         table.merge(ROWS[1:2])
@@ -61,6 +89,144 @@ class TestDatastore(unittest.TestCase):
         table + other
         self.assertEqual(len(table), 3)
 
+    def test_table_locate(self):
+        self.assertEqual(TABLE.locate([('lotr', '3', 16), ('lotr', '3', 17)]), {('lotr', '3', 16): 1})
+
+    def test_table_scan(self):
+        data = list(TABLE.scan(('SHOT', 'PROJECT', 'NOPE')))
+        self.assertEqual(data[0], ('1', 'the hobbit'))
+
+    def test_table_take(self):
+        data = list(TABLE.take([2, 0]))
+        self.assertEqual(data[0][0], 'king kong')
+        self.assertEqual(data[1][0], 'the hobbit')
+        data = list(TABLE.take([2, 0], ('SHOT',)))
+        self.assertEqual(data, [('42',), ('1',)])
+
+    def test_rows_scan(self):
+        rows = Rows(('PROJECT', 'SHOT', 'VERSION'), [('the hobbit', '1', 64), ('lotr', '3', 16)])
+        self.assertEqual(list(rows.scan(('VERSION', 'NOPE', 'PROJECT'))), [(64, 'the hobbit'), (16, 'lotr')])
+        self.assertEqual(list(rows.scan()), list(rows))
+        self.assertEqual(Rows.projection(rows.column_names, ())(('lotr', '3', 16)), ())
+
+    def test_table_indexes(self):
+        self.assertEqual(sorted(TABLE.indexes), ['FINISH_DATE', 'INTERNAL_BID', 'PROJECT', 'STATUS'])
+        self.assertEqual(TABLE.indexes['PROJECT'].lookup('the hobbit'), {0, 3})
+        self.assertEqual(TABLE.indexes['STATUS'].lookup('scheduled'), {0})
+        self.assertEqual(TABLE.indexes['STATUS'].lookup('not required'), {2})
+        self.assertEqual(TABLE.indexes['FINISH_DATE'].keys, [date(2001, 5, 15), date(2006, 7, 22), date(2010, 5, 15)])
+
+    def test_columnar_indexes(self):
+        self.assertEqual(COLUMNAR.indexes['INTERNAL_BID'].keys, [15.0, 22.8, 30.0, 45.0])
+        self.assertEqual(COLUMNAR.indexes['STATUS'].lookup('not required'), {2})
+
+    def test_sorted_index(self):
+        index = HashIndex.factory('sorted')
+        index.add(3, 0)
+        index.add(1, 1)
+        index.add(3, 2)
+        index.discard(1, 1)
+        self.assertEqual(index.keys, [3])
+        self.assertEqual(index.lookup(3), {0, 2})
+        self.assertEqual(index.lookup(1), set())
+
+    def test_sorted_index_extend(self):
+        index = HashIndex.factory('sorted')
+        index.extend([5, 3, 5])
+        index.extend([4, 1, 3], start=3)
+        self.assertEqual(index.keys, [1, 3, 4, 5])
+        self.assertEqual(index.lookup(3), {1, 5})
+        self.assertEqual(index.lookup(5), {0, 2})
+
+    def test_mapped_words(self):
+        words = MappedWords(*MappedWords.build(['rivendell', 'moria', 'lothlórien', '']))
+        self.assertEqual(list(words), ['rivendell', 'moria', 'lothlórien', ''])
+        self.assertEqual([words.code(word) for word in ('', 'lothlórien', 'rivendell', 'shire')], [3, 2, 0, None])
+        self.assertEqual(words.ranks(), [3, 2, 1, 0])
+
+    def test_sorted_index_range(self):
+        index = TABLE.indexes['INTERNAL_BID']
+        self.assertEqual(index.range(low=22.8, high=30.0), {2, 3})
+        self.assertEqual(index.range(low=22.8, high=30.0, left=False, right=False), set())
+        self.assertEqual(index.range(high=30.0, right=False), {1, 3})
+        self.assertEqual(index.range(low=30.0), {0, 2})
+        self.assertEqual(index.range(), {0, 1, 2, 3})
+
+    def test_legacy_state(self):
+        table = Table.__new__(Table)
+        records = list(TABLE)[:2]
+        table.__setstate__({'columns': COLUMNS, 'rows': OrderedDict([('a', records[0]), ('b', records[1])])})
+        self.assertEqual(table.rows, OrderedDict([(('the hobbit', '1', 64), 0), (('lotr', '3', 16), 1)]))
+        self.assertEqual(table[('lotr', '3', 16)], records[1])
+        self.assertEqual(table.indexes, {})
+
+    def test_combined_keys(self):
+        table = Table(COLUMNS)
+        table.append(['ab', '1', '64', 'scheduled', '2010-05-15', '45.00', '2010-04-01 13:35'])
+        table.append(['a', 'b1', '64', 'scheduled', '2010-05-15', '45.00', '2010-04-01 13:35'])
+        self.assertEqual(list(table.rows), [('ab', '1', 64), ('a', 'b1', 64)])
+
+    def test_vector(self):
+        vector = Vector.factory(IntVal())
+        vector.append(42)
+        vector.append(8)
+        vector[1] = 9
+        self.assertEqual(list(vector), [42, 9])
+        self.assertEqual(vector.data.typecode, 'q')
+
+    def test_dict_vector(self):
+        vector = Vector.factory(TxtVal())
+        for word in ('finished', 'scheduled', 'finished'):
+            vector.append(word)
+        self.assertEqual(list(vector.data), [0, 1, 0])
+        self.assertEqual(vector.words, ['finished', 'scheduled'])
+        self.assertEqual(vector[2], 'finished')
+
+    def test_columnar_factory(self):
+        _id = ('king kong', '42', 128)
+        self.assertEqual(str(COLUMNAR), 'ColumnarTable(columns=(PROJECT, SHOT, VERSION, STATUS, FINISH_DATE, INTERNAL_BID, CREATED_DATE), rows=4)')
+        self.assertEqual(COLUMNAR[_id], ('king kong', '42', 128, 'not required', date(2006, 7, 22), 30.0, datetime(2006, 10, 15, 9, 14)))
+        self.assertEqual(COLUMNAR.vectors['PROJECT'].words, ['the hobbit', 'lotr', 'king kong'])
+
+    def test_zone_map(self):
+        vector = Vector(IntVal())
+        for val in (5, 1, 3, 3, 9, 7, 8, 2):
+            vector.append(val)
+        zones = ZoneMap(vector, 3, *ZoneMap.build(vector.data, size=3))
+        self.assertEqual(len(zones), 3)
+        self.assertEqual((list(zones.lows), list(zones.highs)), ([1, 3, 2], [5, 9, 8]))
+        self.assertEqual((list(zones.counts), list(zones.distincts)), ([3, 3, 2], [3, 3, 2]))
+        self.assertEqual(zones.lookup(4), {0, 1, 2})
+        self.assertEqual(zones.lookup(9), {1})
+        self.assertEqual(zones.range(low=8), {1, 2})
+        self.assertEqual(zones.range(low=8, left=False), {1})
+        self.assertEqual(zones.range(high=2, right=False), {0})
+        self.assertEqual(zones.spans({0, 1, 2}), [(0, 8)])
+        self.assertEqual(zones.spans({2, 0}), [(0, 3), (6, 8)])
+        self.assertEqual(zones.rows({0, 2}), 5)
+        self.assertEqual(zones.distinct(), 8)
+
+    def test_columnar_scan_range(self):
+        self.assertEqual(list(COLUMNAR.scan(('SHOT',), 1, 3)), [('3',), ('42',)])
+        self.assertEqual(list(TABLE.scan(('SHOT',), 1, 3)), [('3',), ('42',)])
+
+    def test_columnar_iteration(self):
+        self.assertEqual(list(COLUMNAR), list(TABLE))
+
+    def test_columnar_scan(self):
+        data = list(COLUMNAR.scan(('VERSION', 'FINISH_DATE')))
+        self.assertEqual(data[-1], (32, date(2010, 5, 15)))
+
+    def test_columnar_take(self):
+        self.assertEqual(list(COLUMNAR.take([3, 1])), list(TABLE.take([3, 1])))
+
+    def test_columnar_addition(self):
+        table = ColumnarTable(COLUMNS)
+        table.merge(ROWS[1:3])
+        table + TABLE
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(table), list(TABLE))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,14 +1,43 @@
-from tempfile import NamedTemporaryFile
+from hashlib import md5
+import json
+from os import listdir, path
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 import unittest
-from db_kata.datastore import Table
-from db_kata.importer import Parser, Storage
-from stubs.constants import COLUMNS, ROWS, TABLE
+from unittest.mock import patch
+from datetime import date
+from db_kata.datastore import MappedDictVector, MappedTable, Table
+from db_kata.importer import Mapped, Parser, Segments, Storage, Workers
+from db_kata.query import Bulk, Filter, Selector, Sorter
+from stubs.constants import COLUMNAR, COLUMNS, ROWS, SHUFFLE, TABLE
+
+
+class MappedV1(Mapped):
+    '''
+    Writes the version 1 format, along with the block of the MD5 digests of the
+    key values concatenated, as the rows were keyed by.
+    '''
+
+    VERSION = 1
+
+    def _blocks(self, f, table):
+        footer = super()._blocks(f, table)
+        for meta, vector in zip(footer['vectors'], self._vectors(table)):
+            if meta['words'] is not None:
+                meta['words'] = list(vector.words)
+        ids = (md5(''.join(map(str, _id)).encode()).digest() for _id in table.rows)
+        footer['ids'] = self._write(f, b''.join(ids))
+        return footer
 
 
 class TestImporter(unittest.TestCase):
     def setUp(self):
         temp = NamedTemporaryFile(mode='w+', suffix='.pickle')
         self.storage = Storage(temp.name)
+        self.tempdir = TemporaryDirectory()
+        self.segments = Segments(path.join(self.tempdir.name, 'projects'))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
 
     def test_parser(self):
         parser = Parser('./stubs/sample.txt')
@@ -16,6 +45,28 @@ class TestImporter(unittest.TestCase):
         self.assertEqual(data[0], ('PROJECT', 'SHOT', 'VERSION', 'STATUS', 'FINISH_DATE', 'INTERNAL_BID', 'CREATED_DATE'))
         self.assertEqual(data[-1], ('king kong', '42', '128', 'not required', '2006-07-22', '30.00', '2006-10-15 09:14'))
 
+    def test_parser_ranges(self):
+        parser = Parser('./stubs/sample.txt')
+        self.assertEqual(parser.headers(), ROWS[0])
+        ranges = list(parser.ranges(64))
+        self.assertEqual(ranges, [(66, 179), (179, 300), (300, 364)])
+        data = [row for start, end in ranges for row in parser.read(start, end)]
+        self.assertEqual(data, ROWS[1:])
+
+    def test_workers_load(self):
+        workers = Workers(2, size=64)
+        tables = list(workers.tables('./stubs/sample.txt', COLUMNS))
+        self.assertEqual([len(table) for table in tables], [2, 2, 1])
+        table = workers.load('./stubs/sample.txt', COLUMNS)
+        self.assertEqual(table.rows, TABLE.rows)
+        self.assertEqual(list(table), list(TABLE))
+
+    def test_workers_shuffled(self):
+        table = Workers(2, size=64).load('./stubs/shuffled.txt', COLUMNS)
+        self.assertEqual(table.column_names, SHUFFLE[0])
+        self.assertEqual(len(table), 4)
+        self.assertIn(('king kong', 'not required'), [row[2:5:2] for _, row in table.items()])
+
     def test_storage_filename(self):
         storage = Storage('./stubs/projects')
         self.assertTrue(storage.filename.endswith('/stubs/projects.pickle'))
@@ -24,6 +75,7 @@ class TestImporter(unittest.TestCase):
         self.storage.write(TABLE)
         table = self.storage.read()
         self.assertEqual(table.rows, TABLE.rows)
+        self.assertEqual(table.indexes['PROJECT'].lookup('the hobbit'), {0, 3})
 
     def test_storage_augment(self):
         table = Table(COLUMNS)
@@ -35,6 +87,234 @@ class TestImporter(unittest.TestCase):
         table = self.storage.read()
         self.assertEqual(len(table), 3)
 
+    def test_storage_factory(self):
+        self.assertIsInstance(Storage.factory('./stubs/projects'), Mapped)
+        self.assertIs(type(Storage.factory('./stubs/projects.pickle')), Storage)
+        segments = Storage.factory('./stubs/projects.segments/')
+        self.assertIsInstance(segments, Segments)
+        self.assertTrue(segments.dirname.endswith('/stubs/projects.segments'))
+
+    def test_mapped_io(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        table = mapped.read()
+        self.assertIsInstance(table, MappedTable)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.rows, TABLE.rows)
+        self.assertEqual(list(table), list(TABLE))
+        self.assertEqual(list(table.scan(('SHOT', 'FINISH_DATE'))), list(TABLE.scan(('SHOT', 'FINISH_DATE'))))
+        self.assertEqual(table[('king kong', '42', 128)], TABLE[('king kong', '42', 128)])
+
+    def test_mapped_indexes(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(COLUMNAR)
+        table = mapped.read()
+        self.assertEqual(table.indexes['PROJECT'].lookup('the hobbit'), {0, 3})
+        self.assertEqual(table.indexes['PROJECT'].lookup('alien'), set())
+        self.assertEqual(table.indexes['FINISH_DATE'].range(low=date(2006, 7, 22)), {0, 2, 3})
+        self.assertEqual(table.indexes['INTERNAL_BID'].range(high=30.0, right=False), {1, 3})
+
+    def test_mapped_zones(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        with patch.object(Mapped, 'ZONE', 2):
+            mapped.write(COLUMNAR)
+        table = mapped.read()
+        self.assertEqual(len(table.zones), len(COLUMNS))
+        self.assertEqual(table.zones['PROJECT'].lookup('king kong'), {1})
+        self.assertEqual(table.zones['FINISH_DATE'].range(high=date(2005, 1, 1)), {0})
+        _filter = Filter('CREATED_DATE<2005-01-01 00:00 OR SHOT="nope"')
+        self.assertEqual(_filter._blocks(table), {0})
+        for batch in (None, 1):
+            bulk = Bulk(_filter, None, Selector('PROJECT,SHOT'), batch=batch)
+            self.assertEqual(list(bulk(table)), [('lotr', '3')])
+        self.assertIn('by scan of 1/2 blocks', Bulk(_filter, None, None).explain(table)[1])
+
+    def test_mapped_locate(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        with patch.object(Mapped, 'ZONE', 2):
+            mapped.write(COLUMNAR)
+        table = mapped.read()
+        ids = [('king kong', '42', 128), ('lotr', '3', 17), ('nope', '1', 1), ('the hobbit', '40', 32)]
+        self.assertEqual(table.locate(ids), {('king kong', '42', 128): 2, ('the hobbit', '40', 32): 3})
+        self.assertEqual(table.zones['VERSION'].among([128]), {1})
+        self.assertIsNone(table._rows)
+        self.assertEqual(table.locate(ids), COLUMNAR.locate(ids))
+
+    def test_mapped_query(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        table = mapped.read()
+        for op in (Filter('PROJECT="the hobbit" AND FINISH_DATE>=2010-01-01 OR VERSION=16'), Sorter('FINISH_DATE,INTERNAL_BID'), Selector('PROJECT,SHOT:count', 'PROJECT')):
+            self.assertEqual(list(op(table)), list(op(TABLE)))
+
+    def test_mapped_augment(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        table = Table(COLUMNS)
+        table.merge(ROWS[1:2])
+        mapped.write(table)
+        other = Table(COLUMNS)
+        other.merge(ROWS[1:4])
+        mapped.write(other)
+        self.assertEqual(len(mapped.read()), 3)
+
+    def test_mapped_read_only(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        with self.assertRaises(Table.DataError):
+            mapped.read().append(ROWS[1])
+
+    def test_mapped_migration(self):
+        Storage(path.join(self.tempdir.name, 'projects')).write(TABLE)
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        self.assertIs(type(mapped.read()), Table)
+        mapped.write(Table(COLUMNS))
+        self.assertTrue(path.isfile(mapped.filename))
+        self.assertEqual(list(mapped.read()), list(TABLE))
+
+    def test_mapped_version(self):
+        legacy = MappedV1(path.join(self.tempdir.name, 'projects'))
+        legacy.write(TABLE)
+        with open(legacy.filename, 'rb') as f:
+            data = f.read()
+        self.assertEqual(Mapped.PREFIX.unpack_from(data)[1], 1)
+        self.assertEqual(legacy._footer(memoryview(data))['ids'][1], 16 * len(TABLE))
+        self.assertEqual(legacy._footer(memoryview(data))['vectors'][0]['words'], ['the hobbit', 'lotr', 'king kong'])
+        mapped = Mapped(legacy.filename)
+        table = mapped.read()
+        self.assertEqual(table.rows, TABLE.rows)
+        self.assertEqual(list(table), list(TABLE))
+        self.assertEqual(table[('king kong', '42', 128)], TABLE[('king kong', '42', 128)])
+        mapped.write(TABLE)
+        with open(mapped.filename, 'rb') as f:
+            self.assertEqual(Mapped.PREFIX.unpack_from(f.read())[1], Mapped.VERSION)
+        self.assertEqual(list(mapped.read()), list(TABLE))
+
+    def test_mapped_format_error(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        with open(mapped.filename, 'wb') as f:
+            f.write(b'NOTKATA' + bytes(32))
+        with self.assertRaises(Mapped.FormatError):
+            mapped.read()
+
+    def test_mapped_words(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        vector = mapped.read().vectors['PROJECT']
+        self.assertIsInstance(vector, MappedDictVector)
+        self.assertEqual(list(vector.words), ['the hobbit', 'lotr', 'king kong'])
+        self.assertEqual([vector.code(word) for word in ('king kong', 'lotr', 'nope', 42)], [2, 1, None, None])
+        self.assertEqual(vector.ranks(), [2, 1, 0])
+        self.assertEqual(list(mapped.read().scan(('PROJECT',))), list(TABLE.scan(('PROJECT',))))
+
+    def test_mapped_itemsize(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        with open(mapped.filename, 'rb') as f:
+            data = f.read()
+        _, version, offset, _ = Mapped.PREFIX.unpack_from(data)
+        footer = json.loads(data[offset:].decode())
+        self.assertEqual({meta['itemsize'] for meta in footer['vectors']}, {8})
+        footer['vectors'][4]['itemsize'] = 4
+        footer = json.dumps(footer).encode()
+        with open(mapped.filename, 'wb') as f:
+            f.write(Mapped.PREFIX.pack(Mapped.MAGIC, version, offset, len(footer)))
+            f.write(data[Mapped.PREFIX.size:offset] + footer)
+        with self.assertRaises(Mapped.FormatError):
+            mapped.read()
+
+    def test_segments_write(self):
+        table = Table(COLUMNS)
+        table.merge(ROWS[1:2])
+        self.segments.write(table)
+        other = Table(COLUMNS)
+        other.merge(ROWS[1:4])
+        self.segments.write(other)
+        self.assertEqual(len(self.segments), 2)
+        self.assertTrue(self.segments.segments[-1].endswith('00000002.kata'))
+        self.assertEqual(len(self.segments.read()), 3)
+
+    def test_segments_load(self):
+        count = self.segments.load(ROWS, COLUMNS, batch=2)
+        self.assertEqual(count, 5)
+        self.assertEqual(len(self.segments), 3)
+        table = self.segments.read()
+        self.assertEqual(table.rows, TABLE.rows)
+        self.assertEqual(list(table), list(TABLE))
+
+    def test_segments_load_empty(self):
+        with NamedTemporaryFile(mode='w', suffix='.txt') as f:
+            self.assertEqual(self.segments.load(Parser(f.name), COLUMNS), 0)
+        self.assertEqual(len(self.segments), 0)
+
+    def test_segments_extend(self):
+        count = self.segments.extend(Workers(2).tables('./stubs/sample.txt', COLUMNS), batch=2)
+        self.assertEqual(count, 4)
+        self.assertEqual(len(self.segments), 2)
+        self.assertEqual(list(self.segments.read()), list(TABLE))
+
+    def test_segments_compact(self):
+        self.segments.load(ROWS, COLUMNS, batch=2)
+        self.segments.compact()
+        self.assertEqual(len(self.segments), 1)
+        self.assertTrue(self.segments.segments[0].endswith('00000003.kata'))
+        self.assertEqual(list(self.segments.read()), list(TABLE))
+
+    def test_segments_background_compact(self):
+        self.segments.THRESHOLD = 2
+        self.segments.load(ROWS, COLUMNS, batch=2)
+        self.segments.worker.join()
+        self.assertEqual(len(self.segments), 1)
+        self.assertEqual(list(self.segments.read()), list(TABLE))
+
+    def test_segments_tiers(self):
+        mb = 1 << 20
+        self.assertEqual(self.segments._run([20 * mb, 5 * mb, mb, mb, mb, mb]), slice(2, 6))
+        self.assertEqual(self.segments._run([20 * mb, 5 * mb, 4 * mb, 6 * mb, 7 * mb, mb]), slice(1, 5))
+        self.assertIsNone(self.segments._run([20 * mb, 5 * mb, mb, mb, mb]))
+        self.assertIsNone(self.segments._run([1 << 29] * 4))
+        self.segments.THRESHOLD = 4
+        self.assertEqual(self.segments._run([5 * mb, mb, 5 * mb, mb, mb]), slice(1, 5))
+
+    def test_segments_tiered_load(self):
+        self.segments.FANOUT = 2
+        for row in ROWS[1:]:
+            self.segments.write(Table.factory([ROWS[0], row], COLUMNS))
+            if self.segments.worker is not None:
+                self.segments.worker.join()
+        self.assertEqual(len(self.segments), 1)
+        self.assertFalse(any(name.endswith(Segments.STAGE + Mapped.EXT) for name in listdir(self.segments.dirname)))
+        self.assertEqual(list(self.segments.read()), list(TABLE))
+
+    def test_segments_read_retry(self):
+        self.segments.write(TABLE)
+        merge = self.segments._merge
+        with patch.object(self.segments, '_merge', side_effect=[FileNotFoundError, merge(self.segments.segments)]):
+            self.assertEqual(list(self.segments.read()), list(TABLE))
+
+    def test_segments_ignore_temp(self):
+        self.segments.write(TABLE)
+        Storage(path.join(self.segments.dirname, '00000002.tmp')).write(TABLE)
+        self.assertEqual(len(self.segments), 1)
+
+    def test_segments_missing(self):
+        with self.assertRaises(FileNotFoundError):
+            self.segments.read()
+
+
+    def test_generation(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        self.assertIsNone(mapped.generation())
+        mapped.write(TABLE)
+        stamp = mapped.generation()
+        self.assertEqual(mapped.generation(), stamp)
+        mapped.generation.renew()
+        self.assertNotEqual(mapped.generation(), stamp)
+
+    def test_segments_generation(self):
+        self.segments.write(TABLE)
+        stamp = self.segments.generation()
+        self.segments.write(TABLE)
+        self.assertNotEqual(self.segments.generation(), stamp)
 
 if __name__ == '__main__':
     unittest.main()
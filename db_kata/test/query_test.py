@@ -1,21 +1,75 @@
 from datetime import date, datetime
+from os import environ
+from subprocess import PIPE, run
+from sys import executable
 import unittest
-from db_kata.query import Bulk, Filter, Operator, Selector, Sorter
-from stubs.constants import TABLE
+from unittest.mock import patch
+from db_kata.datastore import ColumnarTable, Rows, Table
+from db_kata.query import ApproxCount, Bulk, Filter, Operator, Sampler, Selector, Sorter
+from stubs.constants import COLUMNAR, COLUMNS, ROWS, TABLE
 
 
 class TestQuery(unittest.TestCase):
     def test_selector(self):
         selector = Selector('PROJECT,VERSION,SHOT')
-        data = list(selector(TABLE))
+        rows = selector(TABLE)
+        self.assertEqual(rows.column_names, ('PROJECT', 'VERSION', 'SHOT'))
+        data = list(rows)
         self.assertEqual(len(data), 4)
-        self.assertEqual(data[0], (('PROJECT', 'the hobbit'), ('VERSION', 64), ('SHOT', '1')))
+        self.assertEqual(data[0], ('the hobbit', 64, '1'))
         
     def test_grouping(self):
         selector = Selector('PROJECT,VERSION:max,INTERNAL_BID:sum,SHOT:collect,STATUS:count', 'PROJECT')
         data = list(selector(TABLE))
         self.assertEqual(len(data), 3)
-        self.assertEqual(data[0], (('PROJECT', 'the hobbit'), ('VERSION', 64), ('INTERNAL_BID', 67.8), ('SHOT', '[1,40]'), ('STATUS', '(2)')))
+        self.assertEqual(data[0], ('the hobbit', 64, 67.8, '[1,40]', '(2)'))
+
+    def test_grouping_columnar(self):
+        selector = Selector('PROJECT,VERSION:max,INTERNAL_BID:sum,SHOT:collect,STATUS:count', 'PROJECT')
+        self.assertEqual(list(selector(COLUMNAR)), list(selector(TABLE)))
+
+    def test_grouping_multiple_columns(self):
+        selector = Selector('PROJECT,STATUS,SHOT:count,VERSION:min', 'PROJECT,STATUS')
+        data = list(selector(TABLE))
+        self.assertEqual(len(data), 4)
+        self.assertEqual(data[0], ('the hobbit', 'scheduled', '(1)', 64))
+        self.assertEqual(data[-1], ('the hobbit', 'finished', '(1)', 32))
+
+    def test_grouping_by_unselected_column(self):
+        selector = Selector('SHOT:collect', 'PROJECT')
+        rows = selector(TABLE)
+        self.assertEqual(rows.column_names, ('SHOT',))
+        self.assertEqual(list(rows), [('[1,40]',), ('[3]',), ('[42]',)])
+
+    def test_grouping_codes(self):
+        selector = Selector('PROJECT,STATUS:collect,SHOT:count,VERSION:max', 'PROJECT')
+        vectors = COLUMNAR.vectors
+        decoders = [selector._decoder(name, vectors[name]) for name in selector.names]
+        self.assertEqual([decoder is not None for decoder in decoders], [True, True, True, False])
+        rows = [(0, 1, 0, 64), (0, 0, 3, 32), (1, 0, 1, 16)]
+        data = list(selector._reduce(rows, decoders))
+        self.assertEqual(data, [('the hobbit', '[finished,scheduled]', '(2)', 64), ('lotr', '[scheduled]', '(1)', 16)])
+
+    def test_grouping_approximate(self):
+        selector = Selector('PROJECT,SHOT:count_approx,STATUS:collect', 'PROJECT', cap=1)
+        for data in (TABLE, COLUMNAR):
+            self.assertEqual(list(selector(data)), [('the hobbit', '(2)', '[finished,...]'), ('lotr', '(1)', '[finished]'), ('king kong', '(1)', '[not required]')])
+        self.assertNotEqual(selector.canonical(), Selector('PROJECT,SHOT:count_approx,STATUS:collect', 'PROJECT').canonical())
+
+    def test_approx_count(self):
+        accumulator = ApproxCount(0)
+        for value in range(1, 100000):
+            accumulator.add('shot %d' % value)
+        self.assertIsInstance(accumulator.value, bytearray)
+        self.assertAlmostEqual(int(accumulator.result().strip('(~)')), 100000, delta=5000)
+
+    def test_approx_count_repeatable(self):
+        script = 'from db_kata.query import ApproxCount\n' \
+                 'accumulator = ApproxCount(0)\n' \
+                 'for value in range(1, 5000): accumulator.add("shot %d" % value)\n' \
+                 'print(accumulator.result())'
+        results = {run([executable, '-c', script], env=dict(environ, PYTHONHASHSEED=str(seed)), stdout=PIPE, check=True).stdout for seed in (1, 2)}
+        self.assertEqual(len(results), 1)
 
     def test_grouping_error(self):
         selector = Selector('PROJECT,INTERNAL_BID:reduce', 'PROJECT')
@@ -26,28 +80,107 @@ class TestQuery(unittest.TestCase):
         sorter = Sorter('FINISH_DATE,INTERNAL_BID')
         data = list(sorter(TABLE))
         self.assertEqual(len(data), 4)
-        self.assertEqual(data[0], (('PROJECT', 'lotr'), ('SHOT', '3'), ('VERSION', 16), ('STATUS', 'finished'), ('FINISH_DATE', date(2001, 5, 15)), ('INTERNAL_BID', 15.0), ('CREATED_DATE', datetime(2001, 4, 1, 6, 47))))
-        self.assertEqual(data[-1], (('PROJECT', 'the hobbit'), ('SHOT', '1'), ('VERSION', 64), ('STATUS', 'scheduled'), ('FINISH_DATE', date(2010, 5, 15)), ('INTERNAL_BID', 45.0), ('CREATED_DATE', datetime(2010, 4, 1, 13, 35))))
+        self.assertEqual(data[0], ('lotr', '3', 16, 'finished', date(2001, 5, 15), 15.0, datetime(2001, 4, 1, 6, 47)))
+        self.assertEqual(data[-1], ('the hobbit', '1', 64, 'scheduled', date(2010, 5, 15), 45.0, datetime(2010, 4, 1, 13, 35)))
 
     def test_filter_date(self):
         _filter = Filter('FINISH_DATE=2006-07-22')
         data = list(_filter(TABLE))
         self.assertEqual(len(data), 1)
-        self.assertEqual(data[0], (('PROJECT', 'king kong'), ('SHOT', '42'), ('VERSION', 128), ('STATUS', 'not required'), ('FINISH_DATE', date(2006, 7, 22)), ('INTERNAL_BID', 30.0), ('CREATED_DATE', datetime(2006, 10, 15, 9, 14))))
+        self.assertEqual(data[0], ('king kong', '42', 128, 'not required', date(2006, 7, 22), 30.0, datetime(2006, 10, 15, 9, 14)))
 
     def test_filter_or(self):
         _filter = Filter('PROJECT="the hobbit" OR PROJECT="lotr"')
         data = list(_filter(TABLE))
         self.assertEqual(len(data), 3)
-        self.assertEqual(data[0], (('PROJECT', 'the hobbit'), ('SHOT', '1'), ('VERSION', 64), ('STATUS', 'scheduled'), ('FINISH_DATE', date(2010, 5, 15)), ('INTERNAL_BID', 45.0), ('CREATED_DATE', datetime(2010, 4, 1, 13, 35))))
-        self.assertEqual(data[1], (('PROJECT', 'lotr'), ('SHOT', '3'), ('VERSION', 16), ('STATUS', 'finished'), ('FINISH_DATE', date(2001, 5, 15)), ('INTERNAL_BID', 15.0), ('CREATED_DATE', datetime(2001, 4, 1, 6, 47))))
+        self.assertEqual(data[0], ('the hobbit', '1', 64, 'scheduled', date(2010, 5, 15), 45.0, datetime(2010, 4, 1, 13, 35)))
+        self.assertEqual(data[1], ('lotr', '3', 16, 'finished', date(2001, 5, 15), 15.0, datetime(2001, 4, 1, 6, 47)))
 
     def test_filter_combo(self):
         _filter = Filter('PROJECT="the hobbit" AND (SHOT=1 OR SHOT=40)')
         data = list(_filter(TABLE))
         self.assertEqual(len(data), 2)
-        self.assertEqual(data[0], (('PROJECT', 'the hobbit'), ('SHOT', '1'), ('VERSION', 64), ('STATUS', 'scheduled'), ('FINISH_DATE', date(2010, 5, 15)), ('INTERNAL_BID', 45.0), ('CREATED_DATE', datetime(2010, 4, 1, 13, 35))))
-        self.assertEqual(data[1], (('PROJECT', 'the hobbit'), ('SHOT', '40'), ('VERSION', 32), ('STATUS', 'finished'), ('FINISH_DATE', date(2010, 5, 15)), ('INTERNAL_BID', 22.8), ('CREATED_DATE', datetime(2010, 3, 22, 1, 10))))
+        self.assertEqual(data[0], ('the hobbit', '1', 64, 'scheduled', date(2010, 5, 15), 45.0, datetime(2010, 4, 1, 13, 35)))
+        self.assertEqual(data[1], ('the hobbit', '40', 32, 'finished', date(2010, 5, 15), 22.8, datetime(2010, 3, 22, 1, 10)))
+
+    def test_filter_tree(self):
+        _filter = Filter('PROJECT="the hobbit" AND SHOT=1 OR SHOT=40')
+        self.assertEqual(_filter.tree, ('OR', ('AND', ('=', 'PROJECT', 'the hobbit'), ('=', 'SHOT', '1')), ('=', 'SHOT', '40')))
+        self.assertEqual(_filter.names, ('PROJECT', 'SHOT'))
+
+    def test_filter_literal_as_name(self):
+        _filter = Filter('PROJECT="SHOT" OR STATUS="finished"')
+        data = list(_filter(TABLE))
+        self.assertEqual(len(data), 2)
+
+    def test_filter_quoted_literals(self):
+        status = ROWS[0].index('STATUS')
+        statuses = ('rock AND roll', 'a=b', 'done (x)', 'OR')
+        rows = [row[:status] + (value,) + row[status + 1:] for row, value in zip(ROWS[1:], statuses)]
+        table = Table.factory(ROWS[:1] + rows, COLUMNS)
+        for value in statuses:
+            _filter = Filter('STATUS="%s" AND (PROJECT="lotr" OR VERSION>0)' % value)
+            self.assertEqual(_filter.tree[1], ('=', 'STATUS', value))
+            for data in (table, ColumnarTable.factory(ROWS[:1] + rows, COLUMNS)):
+                self.assertEqual([row[status] for row in _filter(data)], [value])
+        with self.assertRaises(Filter.QueryError):
+            Filter('STATUS="rock AND roll')
+
+    def test_filter_lookup(self):
+        _filter = Filter('PROJECT="the hobbit" OR PROJECT="lotr"')
+        self.assertEqual(_filter._lookup(_filter.tree, TABLE), ({0, 1, 3}, True))
+        _filter = Filter('PROJECT="the hobbit" AND SHOT=40')
+        self.assertEqual(_filter._lookup(_filter.tree, TABLE), ({0, 3}, False))
+        self.assertEqual(len(list(_filter(TABLE))), 1)
+        _filter = Filter('PROJECT="the hobbit" OR SHOT=3')
+        self.assertEqual(_filter._lookup(_filter.tree, TABLE), (None, False))
+
+    def test_filter_range(self):
+        _filter = Filter('FINISH_DATE>2006-07-22 AND VERSION<64')
+        data = list(_filter(TABLE))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0][:2], ('the hobbit', '40'))
+        self.assertEqual(_filter._lookup(_filter.tree, TABLE), ({0, 3}, False))
+
+    def test_filter_range_inclusive(self):
+        _filter = Filter('INTERNAL_BID<=30 OR CREATED_DATE>=2010-04-01 13:35')
+        data = list(_filter(TABLE))
+        self.assertEqual([row[1] for row in data], ['1', '3', '42', '40'])
+
+    def test_filter_between(self):
+        _filter = Filter('FINISH_DATE BETWEEN 2006-01-01 AND 2010-05-15 AND STATUS="finished"')
+        self.assertEqual(_filter.tree, ('AND', ('BETWEEN', 'FINISH_DATE', '2006-01-01', '2010-05-15'), ('=', 'STATUS', 'finished')))
+        self.assertEqual(_filter._lookup(_filter.tree, COLUMNAR), ({3}, True))
+        data = list(_filter(COLUMNAR))
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0][:2], ('the hobbit', '40'))
+
+    def test_filter_range_error(self):
+        _filter = Filter('PROJECT>"lotr"')
+        with self.assertRaises(Filter.QueryError):
+            list(_filter(TABLE))
+
+    def test_filter_syntax_error(self):
+        for query in ('PROJECT="lotr" AND', '(SHOT=1 OR SHOT=3', 'SHOT 1', 'SHOT=1)', 'VERSION BETWEEN 1 OR 3', 'VERSION<'):
+            with self.assertRaises(Filter.QueryError):
+                Filter(query)
+
+    def test_filter_column_error(self):
+        _filter = Filter('NOPE=1')
+        with self.assertRaises(Filter.QueryError):
+            list(_filter(TABLE))
+
+    def test_columnar_selector(self):
+        selector = Selector('PROJECT,VERSION,SHOT')
+        self.assertEqual(list(selector(COLUMNAR)), list(selector(TABLE)))
+
+    def test_columnar_sorter(self):
+        sorter = Sorter('FINISH_DATE,INTERNAL_BID')
+        self.assertEqual(list(sorter(COLUMNAR)), list(sorter(TABLE)))
+
+    def test_columnar_filter(self):
+        _filter = Filter('PROJECT="the hobbit" AND (SHOT=1 OR SHOT=40)')
+        self.assertEqual(list(_filter(COLUMNAR)), list(_filter(TABLE)))
 
     def test_bulk_none(self):
         bulk = Bulk(None, None, None)
@@ -63,6 +196,199 @@ class TestQuery(unittest.TestCase):
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0], ('king kong', '42', 128))
 
+    def test_sorter_descending(self):
+        expected = list(Sorter('FINISH_DATE,INTERNAL_BID')(TABLE))[::-1]
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            self.assertEqual(list(Sorter('FINISH_DATE:desc,INTERNAL_BID:desc')(data)), expected)
+            sorter = Sorter('FINISH_DATE:desc,INTERNAL_BID:desc', limit=2)
+            self.assertEqual(list(sorter(data)), expected[:2])
+            sorter = Sorter('FINISH_DATE:desc,INTERNAL_BID:desc', budget=1)
+            self.assertEqual(list(sorter(data)), expected)
+
+    def test_sorter_mixed(self):
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            for limit, budget in ((None, None), (3, None), (None, 2)):
+                sorter = Sorter('FINISH_DATE:desc,INTERNAL_BID:asc', limit, budget)
+                shots = list(Selector('SHOT')(sorter(data)))
+                self.assertEqual(shots, [('40',), ('1',), ('42',), ('3',)][:limit])
+
+    def test_sorter_mixed_budget(self):
+        _filter = Filter('INTERNAL_BID>10')
+        expected = list(Bulk(_filter, Sorter('FINISH_DATE:desc,INTERNAL_BID:asc'), None)(TABLE))
+        sorter = Sorter('FINISH_DATE:desc,INTERNAL_BID:asc', budget=1)
+        with patch.object(Sorter, '_spill', side_effect=sorter._spill) as spill:
+            self.assertEqual(list(Bulk(_filter, sorter, None)(TABLE)), expected)
+        self.assertEqual(spill.call_count, 4)
+
+    def test_selector_unknown_columns(self):
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            for selector in (Selector('PROJECT', 'NOPE'), Selector('PROJECT,NOPE:count', 'PROJECT')):
+                with self.assertRaisesRegex(Operator.ColumnError, 'NOPE'):
+                    list(selector(data))
+        bulk = Bulk.factory(select='PROJECT,SHOT:count', group='NOPE')
+        with self.assertRaisesRegex(Operator.ColumnError, 'NOPE'):
+            list(bulk(COLUMNAR))
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            self.assertEqual(list(Selector('NOPE')(data)), [()] * 4)
+            self.assertEqual(list(data.scan(('NOPE',))), [()] * 4)
+            for batch in (0, 1):
+                self.assertEqual(list(Bulk.factory(select='NOPE', batch=batch)(data)), [()] * 4)
+        self.assertEqual(list(COLUMNAR.scan((), 1, 3)), [()] * 2)
+
+    def test_selector_sorter_rows(self):
+        rows = Sorter('INTERNAL_BID:desc')(Selector('SHOT,INTERNAL_BID,NOPE')(TABLE))
+        self.assertEqual(rows.column_names, ('SHOT', 'INTERNAL_BID'))
+        self.assertEqual(list(rows), [('1', 45.0), ('42', 30.0), ('40', 22.8), ('3', 15.0)])
+
+    def test_sorter_unknown_columns(self):
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            for sorter in (Sorter('NOPE'), Sorter('FINISH_DATE:desc,NOPE')):
+                with self.assertRaisesRegex(Operator.ColumnError, 'NOPE'):
+                    list(sorter(data))
+        for batch in (None, 1):
+            with self.assertRaisesRegex(Operator.ColumnError, 'NOPE'):
+                list(Bulk.factory(order='NOPE', batch=batch)(COLUMNAR))
+
+    def test_sorter_direction_error(self):
+        sorter = Sorter('FINISH_DATE:up')
+        for data in (TABLE, COLUMNAR):
+            with self.assertRaisesRegex(Sorter.OrderError, 'up is not a valid direction'):
+                list(sorter(data))
+        with self.assertRaises(Sorter.OrderError):
+            list(Bulk(None, sorter, None, batch=1)(COLUMNAR))
+        with self.assertRaises(Sorter.OrderError):
+            sorter.canonical()
+
+    def test_canonical(self):
+        a = Bulk.factory(filter='PROJECT="lotr" AND (SHOT=1 OR SHOT=2)', order='FINISH_DATE:asc', limit=1)
+        b = Bulk.factory(filter='(SHOT=2 OR SHOT=1) AND PROJECT="lotr"', order='FINISH_DATE', limit=1)
+        self.assertEqual(a.canonical(), b.canonical())
+        c = Bulk.factory(filter='PROJECT="lotr" AND SHOT=1 OR SHOT=2', order='FINISH_DATE', limit=1)
+        self.assertNotEqual(a.canonical(), c.canonical())
+        self.assertNotEqual(Selector('PROJECT', 'PROJECT').canonical(), Selector('PROJECT').canonical())
+
+    def test_sampler(self):
+        expected = list(TABLE)
+        for data in (TABLE, COLUMNAR):
+            bulk = Bulk.factory(sample=0.5, seed=42)
+            rows = list(bulk(data))
+            self.assertEqual((bulk.sampler.size, bulk.sampler.population), (2, 4))
+            self.assertTrue(all(row in expected for row in rows))
+            self.assertEqual(rows, list(Bulk.factory(sample=0.5, seed=42)(data)))
+        self.assertEqual(bulk.sampler.estimate(1), (2, 2))
+        self.assertAlmostEqual(bulk.sampler.margin(), 0.5658, places=4)
+        self.assertNotEqual(bulk.canonical(), Bulk.factory().canonical())
+        self.assertIsNone(Bulk.factory(sample=0.5).canonical())
+        sampler = Sampler(0.5)
+        self.assertEqual(sampler.expect(4), 2)
+        self.assertEqual((sampler.size, sampler.population), (2, 4))
+        with self.assertRaises(Sampler.SampleError):
+            Sampler(1.5)
+
+    def test_sorter_limit(self):
+        for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+            sorter = Sorter('FINISH_DATE,INTERNAL_BID', limit=2)
+            self.assertEqual(list(sorter(data)), list(Sorter('FINISH_DATE,INTERNAL_BID')(data))[:2])
+
+    def test_sorter_budget(self):
+        expected = list(Sorter('FINISH_DATE,INTERNAL_BID')(TABLE))
+        for budget in (1, 3, 4, 10):
+            for data in (TABLE, COLUMNAR, Rows(TABLE.column_names, list(TABLE))):
+                sorter = Sorter('FINISH_DATE,INTERNAL_BID', budget=budget)
+                self.assertEqual(list(sorter(data)), expected)
+
+    def test_sorter_budget_spills(self):
+        sorter = Sorter('FINISH_DATE,INTERNAL_BID', budget=3)
+        run = sorter._external(iter(range(7, 0, -1)), None)
+        self.assertEqual(list(run), [1, 2, 3, 4, 5, 6, 7])
+        sorter.BLOCK = 2
+        runs = [sorter._spill([i, i + 1, i + 2]) for i in (0, 3)]
+        self.assertEqual([list(sorter._unspill(f)) for f in runs], [[0, 1, 2], [3, 4, 5]])
+        self.assertTrue(all(f.closed for f in runs))
+
+    def test_bulk_limit_offset(self):
+        bulk = Bulk(None, Sorter('FINISH_DATE,INTERNAL_BID'), Selector('SHOT'), limit=2, offset=1)
+        self.assertEqual(list(bulk(TABLE)), [('42',), ('40',)])
+
+    def test_bulk_limit_sorter(self):
+        sorter = Sorter('FINISH_DATE')
+        bulk = Bulk(None, sorter, None, limit=2, offset=1)
+        self.assertEqual(bulk.parts[1].limit, 3)
+        self.assertIsNone(sorter.limit)
+        self.assertEqual(len(list(sorter(TABLE))), 4)
+
+    def test_bulk_limit_range(self):
+        for query in ({'limit': -1}, {'offset': -1}):
+            with self.assertRaises(Bulk.RangeError):
+                Bulk.factory(order='SHOT', **query)
+        self.assertEqual(list(Bulk.factory(select='SHOT', limit=0)(TABLE)), [])
+
+    def test_bulk_limit_grouping(self):
+        sorter = Sorter('SHOT')
+        bulk = Bulk(None, sorter, Selector('PROJECT,SHOT:count', 'PROJECT'), limit=1)
+        self.assertIsNone(sorter.limit)
+        self.assertEqual(list(bulk(TABLE)), [('the hobbit', '(2)')])
+
+    def test_bulk_plan_sorts_groups(self):
+        selector = Selector('PROJECT,SHOT:count', 'PROJECT')
+        sorter = Sorter('PROJECT:desc')
+        bulk = Bulk(None, sorter, selector, limit=2)
+        self.assertEqual(bulk.plan(), (selector, bulk.parts[1]))
+        self.assertEqual(bulk.parts[1].limit, 2)
+        self.assertIsNone(sorter.limit)
+        for data in (TABLE, COLUMNAR):
+            self.assertEqual(list(bulk(data)), [('the hobbit', '(2)'), ('lotr', '(1)')])
+        self.assertEqual(Bulk(None, Sorter('SHOT'), selector).plan()[-1], selector)
+
+    def test_bulk_plan_projects(self):
+        _filter = Filter('PROJECT="the hobbit"')
+        sorter = Sorter('FINISH_DATE,INTERNAL_BID')
+        bulk = Bulk(_filter, sorter, Selector('SHOT,VERSION'))
+        self.assertEqual(bulk.parts[1].project, ('SHOT', 'VERSION'))
+        self.assertEqual(bulk.parts[0].project, ('SHOT', 'VERSION', 'FINISH_DATE', 'INTERNAL_BID'))
+        self.assertEqual(bulk.parts[0](COLUMNAR).column_names, bulk.parts[0].project)
+        self.assertEqual(bulk.parts[0](TABLE).column_names, TABLE.column_names)
+        self.assertIsNone(sorter.project)
+        self.assertEqual(_filter(COLUMNAR).column_names, COLUMNAR.column_names)
+        self.assertEqual(list(bulk(TABLE)), [('40', 32), ('1', 64)])
+
+    def test_bulk_explain(self):
+        bulk = Bulk.factory(select='PROJECT,SHOT:count', group='PROJECT', filter='STATUS="finished"', order='PROJECT', limit=1)
+        lines = [line.split(None, 2) for line in bulk.explain(TABLE)]
+        self.assertEqual([(estimate, int(rows)) for estimate, rows, _ in lines], [('=', 4), ('=', 2), ('<=', 2), ('<=', 1), ('<=', 1)])
+        self.assertTrue(lines[0][2].startswith('scan Table('))
+        self.assertTrue(lines[1][2].startswith('filter STATUS = finished by indexes on STATUS'))
+        self.assertEqual(lines[2][2], 'group PROJECT,SHOT:count by PROJECT')
+        self.assertEqual(lines[3][2], 'sort PROJECT top 1')
+        lines = Bulk.factory(filter='SHOT=1 OR PROJECT="lotr"').explain(COLUMNAR)
+        self.assertIn('by batches of', lines[0])
+        self.assertIn('by scan', lines[1])
+
+    def test_bulk_limit_stops_early(self):
+        consumed = []
+        def data():
+            for row in TABLE:
+                consumed.append(row)
+                yield row
+        bulk = Bulk(None, None, Selector('SHOT'), limit=1)
+        self.assertEqual(list(bulk(Rows(TABLE.column_names, data()))), [('1',)])
+        self.assertEqual(len(consumed), 1)
+
+    def test_bulk_parallel(self):
+        queries = ({}, {'filter': 'STATUS="finished" OR SHOT=40', 'select': 'PROJECT,SHOT'},
+                   {'select': 'PROJECT,SHOT:count,INTERNAL_BID:sum,SHOT:count_approx', 'group': 'PROJECT'},
+                   {'select': 'PROJECT,SHOT:collect', 'group': 'PROJECT', 'order': 'PROJECT:desc', 'limit': 2},
+                   {'order': 'FINISH_DATE:desc,INTERNAL_BID:asc', 'limit': 3, 'offset': 1},
+                   {'filter': 'SHOT=1 OR PROJECT="lotr"', 'order': 'INTERNAL_BID:desc', 'select': 'SHOT'})
+        for query in queries:
+            bulk = Bulk.factory(batch=1, workers=2, **query)
+            self.assertTrue(bulk._parallel(COLUMNAR))
+            self.assertEqual(list(bulk(COLUMNAR)), list(Bulk.factory(batch=1, **query)(COLUMNAR)))
+        self.assertIn('within 2 workers', bulk.explain(COLUMNAR)[0])
+        bulk = Bulk.factory(select='PROJECT,SHOT:count', group='PROJECT', order='SHOT', workers=2)
+        self.assertFalse(bulk._parallel(COLUMNAR))
+        self.assertFalse(Bulk.factory(workers=2)._parallel(TABLE))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+from os import path
+from socket import AF_UNIX, SOCK_STREAM, socket
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import sleep
+import unittest
+from unittest.mock import patch
+from db_kata.datastore import Table
+from db_kata.importer import Mapped
+from db_kata.server import Client, Server
+from stubs.constants import COLUMNS, ROWS, TABLE
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        self.mapped.dump(TABLE)
+        address = path.join(self.tempdir.name, 'db_kata.sock')
+        self.server = Server(self.mapped.filename, address, interval=0.01)
+        self.client = Client(address)
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.future = asyncio.run_coroutine_threadsafe(self.server.serve(), self.loop)
+        self._wait(lambda: path.exists(address))
+
+    def tearDown(self):
+        self.future.cancel()
+        self._wait(lambda: not path.exists(self.server.address))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.tempdir.cleanup()
+
+    def test_query(self):
+        lines = list(self.client(select='PROJECT,SHOT:count', group='PROJECT', order='PROJECT'))
+        self.assertEqual(lines, ['king kong,(1)', 'lotr,(1)', 'the hobbit,(2)'])
+
+    def test_query_all(self):
+        lines = list(self.client(filter='PROJECT="lotr"'))
+        self.assertEqual(lines, ['lotr,3,16,finished,2001-05-15,15.00,2001-04-01 06:47'])
+
+    def test_query_error(self):
+        with self.assertRaises(Server.RequestError):
+            list(self.client(filter='PROJECT=lotr AND'))
+        with self.assertRaises(Server.RequestError):
+            list(self.client(project='lotr'))
+        with self.assertRaisesRegex(Server.RequestError, 'workers cannot be requested'):
+            list(self.client(select='PROJECT', workers=2))
+        self.assertEqual(len(list(self.client())), 4)
+
+    def test_query_failure(self):
+        with patch.object(self.server.cache, 'fetch', side_effect=RuntimeError('boom')):
+            with self.assertRaisesRegex(Server.RequestError, 'RuntimeError: boom'):
+                list(self.client())
+        self.assertEqual(len(list(self.client())), 4)
+
+    def test_truncated_response(self):
+        address = path.join(self.tempdir.name, 'truncated.sock')
+        with socket(AF_UNIX, SOCK_STREAM) as listener:
+            listener.bind(address)
+            listener.listen(1)
+            def respond():
+                conn, _ = listener.accept()
+                with conn:
+                    conn.recv(1024)
+                    conn.sendall(b'"lotr"\n')
+            thread = Thread(target=respond)
+            thread.start()
+            with self.assertRaises(Server.RequestError):
+                list(Client(address)())
+            thread.join()
+
+    def test_concurrent_queries(self):
+        started, answered = Event(), Event()
+        results = {}
+        fetch = self.server.cache.fetch
+        def slow(bulk, stamp, load):
+            if bulk.stop == 1:
+                started.set()
+                results['answered'] = answered.wait(5)
+            yield from fetch(bulk, stamp, load)
+        def query():
+            results['slow'] = list(self.client(limit=1))
+        with patch.object(self.server.cache, 'fetch', side_effect=slow):
+            thread = Thread(target=query)
+            thread.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(len(list(self.client())), 4)
+            answered.set()
+            thread.join()
+        self.assertTrue(results['answered'])
+        self.assertEqual(len(results['slow']), 1)
+
+    def test_reload(self):
+        self.assertEqual(len(list(self.client())), 4)
+        row = ('lotr', '4', '1', 'scheduled', '2001-06-01', '10.00', '2001-05-01 10:00')
+        self.mapped.write(Table.factory([ROWS[0], row], COLUMNS))
+        self._wait(lambda: self.server.generation > 1)
+        self.assertEqual(len(list(self.client())), 5)
+
+    def _wait(self, condition, timeout=5):
+        for _ in range(int(timeout / 0.01)):
+            if condition():
+                return
+            sleep(0.01)
+        self.fail('timed out')
+
+
+if __name__ == '__main__':
+    unittest.main()
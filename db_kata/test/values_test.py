@@ -1,4 +1,5 @@
 from datetime import date, datetime
+import pickle
 import unittest
 from db_kata.values import DateVal, FloatVal, IntVal, TimeVal, TxtVal
 
@@ -42,6 +43,10 @@ class TestValues(unittest.TestCase):
         tval = TxtVal(_max=64)
         self.assertEqual(tval('here come the sun'), 'here come the sun')
 
+    def test_txt_interned(self):
+        tval = TxtVal()
+        self.assertIs(tval(''.join(['the ', 'hobbit'])), tval('the hobbit'))
+
     def test_valid_txt_by_int(self):
         tval = TxtVal()
         self.assertEqual(tval(9999), '9999')
@@ -81,11 +86,78 @@ class TestValues(unittest.TestCase):
         tval = TimeVal()
         self.assertEqual(str(tval), 'TimeVal(YYYY-MM-DD HH:MM)')
 
+    def test_date_encoding(self):
+        dval = DateVal()
+        code = dval.encode(date(2017, 9, 11))
+        self.assertEqual(code, 736583)
+        self.assertEqual(dval.decode(code), date(2017, 9, 11))
+
+    def test_time_encoding(self):
+        tval = TimeVal()
+        code = tval.encode(datetime(2017, 9, 11, 23, 55))
+        self.assertEqual(code, 736583 * 1440 + 23 * 60 + 55)
+        self.assertEqual(tval.decode(code), datetime(2017, 9, 11, 23, 55))
+
     def test_invalid_time(self):
         tval = TimeVal()
         with self.assertRaises(ValueError):
             tval('11th of Spetember 23 hours and 55 minutes')
 
+    def test_invalid_time_format(self):
+        tval = TimeVal()
+        with self.assertRaises(ValueError):
+            tval('2017-09-11T23:55')
+
+    def test_invalid_date_separators(self):
+        dval = DateVal()
+        for val in ('2017-9-11', '2017/09/11', '20170911', '2017-09-11 '):
+            with self.assertRaises(ValueError):
+                dval(val)
+
+    def test_bounds_after_unpickling(self):
+        ival = pickle.loads(pickle.dumps(IntVal(_min=10, _max=20)))
+        self.assertEqual(ival('15'), 15)
+        with self.assertRaises(ValueError):
+            ival('42')
+
+    def test_batch(self):
+        ival = IntVal(_max=100)
+        self.assertEqual(ival.batch(['1', '2', '42']), [1, 2, 42])
+
+    def test_batch_reports_all_errors(self):
+        dval = DateVal()
+        with self.assertRaises(DateVal.BatchError) as ctx:
+            dval.batch(['2017-09-11', '2017-09-31', '2017-09-12', 'nope'])
+        self.assertEqual([pos for pos, _ in ctx.exception.errors], [1, 3])
+        self.assertTrue(str(ctx.exception).startswith('2 invalid values: #1 '))
+
+
+class TestParsersEquivalence(unittest.TestCase):
+    '''
+    The fixed format parsers against strptime, their timings being compared by
+    benchmarks/values.py.
+    '''
+
+    def test_date_as_strptime(self):
+        dval = DateVal()
+        for val in ['2016-02-%02d' % day for day in range(1, 30)] + ['0001-01-01', '9999-12-31']:
+            self.assertEqual(dval(val), datetime.strptime(val, DateVal.FORMAT).date())
+        for val in ('2017-02-29', '2017-13-01', '2017-09-11 ', 'nope'):
+            with self.assertRaises(ValueError):
+                datetime.strptime(val, DateVal.FORMAT)
+            with self.assertRaises(ValueError):
+                dval(val)
+
+    def test_time_as_strptime(self):
+        tval = TimeVal()
+        for val in ['2017-09-11 %02d:%02d' % (hour, hour * 2) for hour in range(24)]:
+            self.assertEqual(tval(val), datetime.strptime(val, TimeVal.FORMAT))
+        for val in ('2017-09-11 24:00', '2017-09-11 12:60', '2017-09-31 12:00'):
+            with self.assertRaises(ValueError):
+                datetime.strptime(val, TimeVal.FORMAT)
+            with self.assertRaises(ValueError):
+                tval(val)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+from os import path
+from tempfile import TemporaryDirectory
+import unittest
+from db_kata.datastore import Rows, Table
+from db_kata.importer import Mapped, Segments
+from db_kata.query import Selector
+from db_kata.views import Total, View, Views
+from stubs.constants import COLUMNS, ROWS, TABLE
+
+SELECT = 'PROJECT,VERSION:max,INTERNAL_BID:sum,SHOT:collect,STATUS:count'
+REPLACING = [['king kong', '42', '128', 'finished', '2006-07-22', '10.00', '2006-10-15 09:14'],
+             ['lotr', '5', '8', 'finished', '2006-07-22', '1.00', '2006-10-15 09:14']]
+
+
+class TestViews(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_view(self):
+        view = View(SELECT, 'PROJECT')
+        view.insert(TABLE)
+        self.assertEqual(len(view), 3)
+        self.assertEqual(list(view.rows()), list(Selector(SELECT, 'PROJECT')(TABLE)))
+
+    def test_view_retract(self):
+        view = View(SELECT, 'PROJECT')
+        view.insert(TABLE)
+        view.retract(Rows(TABLE.column_names, [TABLE[('king kong', '42', 128)]]))
+        self.assertEqual([row[0] for row in view.rows()], ['the hobbit', 'lotr'])
+        view.retract(Rows(TABLE.column_names, [TABLE[('the hobbit', '40', 32)]]))
+        self.assertEqual(list(view.rows())[0], ('the hobbit', 64, 45.0, '[1]', '(1)'))
+
+    def test_view_sum_total(self):
+        view = View(SELECT, 'PROJECT')
+        view.insert(TABLE)
+        count, states = view.groups[('the hobbit',)]
+        self.assertEqual(count, 2)
+        self.assertIsInstance(states[2], Total)
+        self.assertAlmostEqual(states[2].value, 67.8)
+        view.retract(TABLE)
+        self.assertEqual(len(view), 0)
+
+    def test_view_errors(self):
+        with self.assertRaises(Selector.AggregateError):
+            View('PROJECT,SHOT:count', None)
+        with self.assertRaises(Selector.AggregateError):
+            View('PROJECT,SHOT', 'PROJECT')
+        with self.assertRaises(Selector.AggregateError):
+            View('PROJECT,SHOT:avg', 'PROJECT')
+
+    def test_views(self):
+        views = Views(path.join(self.tempdir.name, 'projects.kata'))
+        self.assertFalse(views)
+        views.register('rollup', SELECT, 'PROJECT', TABLE)
+        self.assertEqual(list(views), ['rollup'])
+        self.assertEqual(list(views.read('rollup')), list(Selector(SELECT, 'PROJECT')(TABLE)))
+        views.drop('rollup')
+        self.assertFalse(views)
+        with self.assertRaises(Views.ViewError):
+            views.read('rollup')
+
+    def test_mapped_views(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        mapped.views.register('rollup', SELECT, 'PROJECT', mapped.read())
+        mapped.write(Table.factory([ROWS[0]] + REPLACING, COLUMNS))
+        self.assertEqual(sorted(mapped.views.read('rollup')), sorted(Selector(SELECT, 'PROJECT')(mapped.read())))
+
+    def test_stale_views(self):
+        mapped = Mapped(path.join(self.tempdir.name, 'projects'))
+        mapped.write(TABLE)
+        mapped.views.register('rollup', SELECT, 'PROJECT', mapped.read())
+        table = Table.factory([ROWS[0]] + REPLACING, COLUMNS)
+        merged, _ = mapped._table(table)
+        mapped.generation.renew()
+        mapped.dump(merged)
+        expected = sorted(Selector(SELECT, 'PROJECT')(mapped.read()))
+        self.assertEqual(sorted(mapped.views.read('rollup')), expected)
+        mapped.generation.renew()
+        mapped.write(TABLE)
+        self.assertEqual(sorted(mapped.views.read('rollup')), sorted(Selector(SELECT, 'PROJECT')(mapped.read())))
+
+    def test_segments_views(self):
+        segments = Segments(path.join(self.tempdir.name, 'projects'))
+        segments.load(ROWS, COLUMNS, batch=2)
+        segments.views.register('rollup', SELECT, 'PROJECT', segments.read())
+        segments.load([ROWS[0]] + REPLACING, COLUMNS, batch=1)
+        self.assertEqual(sorted(segments.views.read('rollup')), sorted(Selector(SELECT, 'PROJECT')(segments.read())))
+
+
+if __name__ == '__main__':
+    unittest.main()
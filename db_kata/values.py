@@ -1,6 +1,9 @@
-from datetime import datetime
+from datetime import date, datetime
+from sys import intern
 from db_kata.logger import BASE as logger
 
+ISOFORMAT = hasattr(date, 'fromisoformat')
+
 
 class Val(object):
     '''
@@ -13,16 +16,88 @@ class Val(object):
     ---------
     * _min: the minimum value accepted
     * _max: the maximum value accepted
+
+    Methods
+    -------
+    call: computes the value by the concrete cast, logging and raising an exception when invalid
+    >>> val('42')
+
+    batch: computes a whole list of values at once, raising a single exception which
+           reports all of the invalid ones by their position, optionally counted from
+           the specified start
+    >>> val.batch(['42', '43', 'nope'])
+    BatchError: 1 invalid values: #2 invalid literal for int() with base 10: 'nope'
+    >>> val.batch(['42', '43', 'nope'], start=1000)
+    BatchError: 1 invalid values: #1002 invalid literal for int() with base 10: 'nope'
+
+    encode: converts the value to the code stored within a typed array of TYPECODE kind,
+            no array is used when TYPECODE is None (dictionary encoding)
+    >>> val.encode(date(2017, 9, 11))
+    736583
+
+    decode: converts a stored code back to the value
+    >>> val.decode(736583)
+    date(2017, 9, 11)
     '''
 
+    TYPECODE = None
+    REPORTED = 10
+
+    class BatchError(ValueError):
+        '''
+        Indicates some values of a batch are invalid, errors lists their positions
+        along with the messages
+        '''
+
+        def __init__(self, msg, errors):
+            super().__init__(msg)
+            self.errors = errors
+
     def __init__(self, _min, _max):
         self._min = _min
         self._max = _max
+        self._bounds()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bounds()
 
     def __repr__(self):
         name = self.__class__.__name__
         return '%s(%s-%s)' % (name, self._min, self._max)
 
+    def __call__(self, val):
+        try:
+            return self._cast(val)
+        except ValueError as e:
+            logger.error(e)
+            raise
+
+    def batch(self, values, start=0):
+        cast = self._cast
+        result = []
+        errors = []
+        for pos, val in enumerate(values, start):
+            try:
+                result.append(cast(val))
+            except ValueError as e:
+                errors.append((pos, str(e)))
+        if errors:
+            reported = '; '.join('#%d %s' % error for error in errors[:self.REPORTED])
+            msg = '%d invalid values: %s' % (len(errors), reported)
+            logger.error(msg)
+            raise self.BatchError(msg, errors)
+        return result
+
+    def encode(self, val):
+        return val
+
+    def decode(self, code):
+        return code
+
+    def _bounds(self):
+        pass
+
 
 class IntVal(Val):
     '''
@@ -43,18 +118,23 @@ class IntVal(Val):
 
     MIN = 0
     MAX = 65535
+    TYPECODE = 'q'
+    CAST = int
 
     def __init__(self, _min=MIN, _max=MAX):
         super().__init__(_min, _max)
 
-    def __call__(self, val):
-        val = int(val)
-        if val < int(self._min) or val > int(self._max):
+    def _cast(self, val):
+        val = self.CAST(val)
+        if val < self.low or val > self.high:
             msg = '%s is outside of permitted range: %s-%s' % (val, self._min, self._max)
-            logger.error(msg)
             raise ValueError(msg)
         return val
 
+    def _bounds(self):
+        self.low = self.CAST(self._min)
+        self.high = self.CAST(self._max)
+
 
 class FloatVal(IntVal):
     '''
@@ -72,13 +152,9 @@ class FloatVal(IntVal):
     >>> fval('2.15')
     2.15
     '''
-    def __call__(self, val):
-        val = float(val)
-        if val < float(self._min) or val > float(self._max):
-            msg = '%s is outside of permitted range: %s-%s' % (val, self._min, self._max)
-            logger.error(msg)
-            raise ValueError(msg)
-        return val
+
+    TYPECODE = 'd'
+    CAST = float
 
 
 class TxtVal(Val):
@@ -87,6 +163,10 @@ class TxtVal(Val):
     -------
     Identifies the datastore column value for text/string
 
+    Values are interned, so that the rows repeating a word share a single string
+    object (pickled once as well) and equality comparisons against the interned
+    filter literals are identity checks.
+
     Arguments
     ---------
     * _min: the minimum length accepted
@@ -109,14 +189,17 @@ class TxtVal(Val):
     def __init__(self, _min=MIN, _max=MAX):
         super().__init__(_min, _max)
 
-    def __call__(self, val):
+    def _cast(self, val):
         val = str(val)
         val_len = len(val)
-        if val_len < int(self._min) or val_len > int(self._max):
+        if val_len < self.low or val_len > self.high:
             msg = '%s length is outside of permitted range: %s-%s' % (val, self._min, self._max)
-            logger.error(msg)
             raise ValueError(msg)
-        return val
+        return intern(val)
+
+    def _bounds(self):
+        self.low = int(self._min)
+        self.high = int(self._max)
 
 
 class DateVal(Val):
@@ -125,6 +208,9 @@ class DateVal(Val):
     -------
     Identifies the datastore column value for date, supported format is YYYY-MM-DD
 
+    Values are checked against the fixed format and parsed by fromisoformat,
+    or by slicing on the Python versions lacking it.
+
     Constructor
     -----------
     >>> dval = DateVal()
@@ -138,28 +224,42 @@ class DateVal(Val):
 
     REPR = 'YYYY-MM-DD'
     FORMAT = '%Y-%m-%d'
+    TYPECODE = 'q'
+    KIND = 'date'
 
     def __init__(self):
         pass
 
-    def __call__(self, val):
+    def __repr__(self):
+        name = self.__class__.__name__
+        return '%s(%s)' % (name, self.REPR)
+
+    def encode(self, val):
+        return val.toordinal()
+
+    def decode(self, code):
+        return date.fromordinal(code)
+
+    def _cast(self, val):
         try:
-            return datetime.strptime(val, self.FORMAT).date()
+            return self._parse(val)
         except ValueError:
-            msg = '%s cannot be converted to a valid date' % val
-            logger.error(msg)
+            msg = '%s cannot be converted to a valid %s' % (val, self.KIND)
             raise ValueError(msg)
 
-    def __repr__(self):
-        name = self.__class__.__name__
-        return '%s(%s)' % (name, self.REPR)
+    def _parse(self, val):
+        if len(val) != 10 or val[4] != '-' or val[7] != '-':
+            raise ValueError(val)
+        if ISOFORMAT:
+            return date.fromisoformat(val)
+        return date(int(val[:4]), int(val[5:7]), int(val[8:]))
 
 
 class TimeVal(DateVal):
     '''
     Summary
     -------
-    Identifies the datastore column value for time, supported format is YYYY-MM-DD HH:MM 
+    Identifies the datastore column value for time, supported format is YYYY-MM-DD HH:MM
 
     Constructor
     -----------
@@ -174,11 +274,21 @@ class TimeVal(DateVal):
 
     REPR = 'YYYY-MM-DD HH:MM'
     FORMAT = '%Y-%m-%d %H:%M'
-
-    def __call__(self, val):
-        try:
-            return datetime.strptime(val, self.FORMAT)
-        except ValueError:
-            msg = '%s cannot be converted to a valid datetime' % val
-            logger.error(msg)
-            raise ValueError(msg)
+    TYPECODE = 'q'
+    KIND = 'datetime'
+    MINUTES = 1440
+
+    def encode(self, val):
+        return val.toordinal() * self.MINUTES + val.hour * 60 + val.minute
+
+    def decode(self, code):
+        days, minutes = divmod(code, self.MINUTES)
+        hour, minute = divmod(minutes, 60)
+        return datetime.fromordinal(days).replace(hour=hour, minute=minute)
+
+    def _parse(self, val):
+        if len(val) != 16 or val[4] != '-' or val[7] != '-' or val[10] != ' ' or val[13] != ':':
+            raise ValueError(val)
+        if ISOFORMAT:
+            return datetime.fromisoformat(val)
+        return datetime(int(val[:4]), int(val[5:7]), int(val[8:10]), int(val[11:13]), int(val[14:]))
@@ -0,0 +1,277 @@
+from collections import Counter, OrderedDict
+from numbers import Number
+from os import path, remove, replace
+import pickle
+from db_kata.datastore import Rows
+from db_kata.logger import BASE as logger
+from db_kata.query import Selector
+
+
+class Counts(Counter):
+    '''
+    Keeps the multiplicities of the values of a column within a group, the values
+    retracted as many times as they were counted being dropped.
+    '''
+
+    def add(self, value, sign):
+        self[value] += sign
+        if self[value] <= 0:
+            del self[value]
+
+
+class Total(object):
+    '''
+    Keeps the running total of the numeric values of a summed column within a group,
+    the retracted values being subtracted.
+    '''
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value, sign):
+        if isinstance(value, Number):
+            self.value += value * sign
+
+
+class View(object):
+    '''
+    Summary
+    -------
+    Materializes the groups of a query.Selector, updated incrementally as rows are
+    inserted or retracted: each group keeps the count of its rows, the running total
+    of its summed columns and the multiplicities of the values of the other ones, so
+    that the contribution of a replaced row is retracted exactly (minimum and maximum
+    included) and the reduced rows are computed by the distinct values of the groups,
+    without scanning the table.
+    Selected columns must be either aggregated or grouped by, groups are yielded in
+    the order they are first met (a group emptied by retractions and met again is
+    yielded last).
+
+    Arguments
+    ---------
+    * select: the columns names, followed by a colon and the aggregate name (if any),
+      separated by comma, as accepted by the selector
+    * group: the columns names to group by, separated by comma
+
+    Constructor
+    -----------
+    >>> view = View('PROJECT,VERSION:max,INTERNAL_BID:sum,SHOT:collect', 'PROJECT')
+
+    Methods
+    -------
+    insert: adds the rows of the specified table (or datastore.Rows) to the groups
+    >>> view.insert(Table(...))
+
+    retract: removes the rows of the specified table (or datastore.Rows) from the groups
+    >>> view.retract(Rows(table.column_names, [old_row]))
+
+    rows: return the datastore.Rows reduced by group, as yielded by the selector
+    >>> view.rows()
+
+    clear: removes all of the groups
+    >>> view.clear()
+    '''
+
+    def __init__(self, select, group):
+        self.selector = Selector(select, group)
+        self.groups = OrderedDict()
+        self._check()
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __repr__(self):
+        label = self.selector._describe(self.selector.names)
+        return '%s(%s by %s, groups=%d)' % (self.__class__.__name__, label, ','.join(self.selector.group), len(self))
+
+    def insert(self, data):
+        self._apply(data, 1)
+
+    def retract(self, data):
+        self._apply(data, -1)
+
+    def rows(self):
+        selector = self.selector
+        factories = tuple(selector.AGGREGATES.get(selector.query[name], selector.PLAIN) for name in selector.names)
+        rows = (tuple(self._result(factory, state) for factory, state in zip(factories, states)) for _, states in self.groups.values())
+        return Rows(selector.names, rows)
+
+    def clear(self):
+        self.groups = OrderedDict()
+
+    def _result(self, factory, state):
+        if isinstance(state, Total):
+            return state.value
+        return factory.tally(state)
+
+    def _states(self):
+        query = self.selector.query
+        return tuple(Total() if query[name] == 'sum' else Counts() for name in self.selector.names)
+
+    def _apply(self, data, sign):
+        names = self.selector._grouped()
+        self.selector._check_columns(data, names)
+        key = Rows.projection(names, self.selector.group)
+        groups = self.groups
+        for values in data.scan(names):
+            _key = key(values)
+            group = groups.get(_key)
+            if group is None:
+                group = groups[_key] = [0, self._states()]
+            group[0] += sign
+            for state, value in zip(group[1], values):
+                state.add(value, sign)
+            if group[0] <= 0:
+                del groups[_key]
+
+    def _check(self):
+        selector = self.selector
+        selector._check_aggregate()
+        if not selector.group:
+            msg = 'views require grouping columns'
+            logger.error(msg)
+            raise selector.AggregateError(msg)
+        for name, aggregate in selector.query.items():
+            if aggregate is None and name not in selector.group:
+                msg = '%s is neither aggregated nor grouped by' % name
+                logger.error(msg)
+                raise selector.AggregateError(msg)
+
+
+class Views(object):
+    '''
+    Summary
+    -------
+    Stores the named views of a datastore within a sidecar pickle file, so that the
+    storages update them incrementally by the rows they write (inserting the new
+    rows and retracting the ones they replace), and reading a view costs just its
+    groups.
+    The file is stamped by the token of the datastore generation: views whose stamp
+    does not match it (i.e. a write interrupted between the data and the views) are
+    rebuilt from the datastore, instead of being updated or read stale.
+
+    Arguments
+    ---------
+    * datastore: the path of the datastore file (or directory)
+    * generation: the generation of the datastore, stamping the views (if any)
+    * load: a callable returning the table of the datastore, rebuilding stale views
+
+    Constructor
+    -----------
+    >>> views = Views('./projects.kata')
+    >>> views = Views('./projects.kata', Generation('./projects.kata'), storage.read)
+
+    Methods
+    -------
+    register: register the named view over the specified table, replacing any view
+              with the same name
+    >>> views.register('rollup', 'PROJECT,VERSION:max,SHOT:collect', 'PROJECT', table)
+
+    drop: remove the named view, the file along with the last one
+    >>> views.drop('rollup')
+
+    update: insert the rows of the table and retract the replaced ones (datastore.Rows)
+            from all of the views (if any) stamped by the generation token preceding
+            the write, rebuilding them otherwise
+    >>> views.update(Table(...), Rows(columns, replaced), stamp)
+
+    read: return the datastore.Rows of the named view
+    >>> views.read('rollup')
+    '''
+
+    EXT = '.views'
+    TEMP = '.tmp'
+
+    class ViewError(ValueError):
+        '''
+        Indicates the specified view has not been registered
+        '''
+
+    def __init__(self, datastore, generation=None, load=None):
+        self.filename = datastore + self.EXT
+        self.generation = generation
+        self.load = load
+
+    def __len__(self):
+        return len(self.views)
+
+    def __bool__(self):
+        return path.isfile(self.filename)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    @property
+    def views(self):
+        stamp, views = self._stamped()
+        if views and self.generation is not None and stamp != self.generation.token():
+            self._rebuild(views)
+        return views
+
+    def register(self, name, select, group, table):
+        logger.info('registering view %s', name)
+        view = View(select, group)
+        view.insert(table)
+        views = self.views
+        views[name] = view
+        self._dump(views)
+        return view
+
+    def drop(self, name):
+        views = self.views
+        self._view(views, name)
+        del views[name]
+        if views:
+            self._dump(views)
+        else:
+            remove(self.filename)
+
+    def update(self, inserted, replaced, stamp=None):
+        current, views = self._stamped()
+        if not views:
+            return
+        if self.generation is not None and current != stamp:
+            self._rebuild(views)
+            return
+        for name, view in views.items():
+            logger.info('updating view %s by %d rows, %d replaced', name, len(inserted), len(replaced.rows))
+            view.insert(inserted)
+            view.retract(replaced)
+        self._dump(views)
+
+    def read(self, name):
+        return self._view(self.views, name).rows()
+
+    def _view(self, views, name):
+        view = views.get(name)
+        if view is None:
+            msg = 'no view named %s' % name
+            logger.error(msg)
+            raise self.ViewError(msg)
+        return view
+
+    def _stamped(self):
+        if not path.isfile(self.filename):
+            return None, OrderedDict()
+        with open(self.filename, 'rb') as f:
+            state = pickle.load(f)
+        if isinstance(state, OrderedDict):
+            return None, state
+        return state
+
+    def _rebuild(self, views):
+        logger.warning('views of %s are stale, rebuilding them', self.filename)
+        table = self.load()
+        for view in views.values():
+            view.clear()
+            view.insert(table)
+        self._dump(views)
+
+    def _dump(self, views):
+        stamp = None if self.generation is None else self.generation.token()
+        temp = self.filename + self.TEMP
+        with open(temp, 'wb') as f:
+            pickle.dump((stamp, views), f, pickle.HIGHEST_PROTOCOL)
+        replace(temp, self.filename)
@@ -1,15 +1,16 @@
-from db_kata.datastore import Column, Table
+from db_kata.datastore import Column, ColumnarTable, Table
 from db_kata.importer import Parser
 from db_kata.values import DateVal, FloatVal, IntVal, TimeVal, TxtVal
 
-project = Column('PROJECT', TxtVal(), True, desc='the project name or code name of the shot')
+project = Column('PROJECT', TxtVal(), True, desc='the project name or code name of the shot', index='hash')
 shot    = Column('SHOT', TxtVal(), True, desc='the name of the shot')
 version = Column('VERSION', IntVal(), True, desc='the current version of the file')
-status  = Column('STATUS', TxtVal(_max=32), desc='the current status of the shot')
-finish  = Column('FINISH_DATE', DateVal(), desc='the date the work on the shot is scheduled to end')
-bid     = Column('INTERNAL_BID', FloatVal(), desc='the amount of days we estimate the work on this shot will take')
+status  = Column('STATUS', TxtVal(_max=32), desc='the current status of the shot', index='hash')
+finish  = Column('FINISH_DATE', DateVal(), desc='the date the work on the shot is scheduled to end', index='sorted')
+bid     = Column('INTERNAL_BID', FloatVal(), desc='the amount of days we estimate the work on this shot will take', index='sorted')
 created = Column('CREATED_DATE', TimeVal(), desc='the time and date when this record is being added to the system')
 COLUMNS = (project, shot, version, status, finish, bid, created)
 ROWS    = list(Parser('./stubs/sample.txt'))
 SHUFFLE = list(Parser('./stubs/shuffled.txt'))
 TABLE   = Table.factory(ROWS, COLUMNS)
+COLUMNAR = ColumnarTable.factory(ROWS, COLUMNS)